@@ -13,12 +13,30 @@ from app.routes.plaid import plaid_bp
 from app.routes.financials import financials_bp
 from app.routes.financials_api import financials_api_bp
 from app.config import Config
+from app.utils.db_routing import init_replica_schema
+from app.utils.schema import add_missing_columns
+from app.utils.metrics import init_metrics
+from app.utils.query_profiler import init_query_profiler
+from app.utils.backfill import init_backfill
+from app.utils.sync_scheduler import init_sync_scheduler
+from app.utils.resilience import init_resilience
+from app.utils.email import init_email_outbox
+from app.utils.change_log import init_change_log
+from app.utils.partitions import init_partitions, prepare_partitions
+from app.utils.account_purge import init_account_purge
+from app.utils.dictionary import init_dictionary
+from app.utils.categorization import init_categorization
+from app.utils.transfers import init_transfers
+from app.utils.relink import init_relink
+from app.utils.compression import init_compression
+from app.utils.fast_json import FastJSONProvider
 
 
 def create_app():
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = FastJSONProvider(app)
     
     # Initialize database (no migrations - just connection setup)
     db.init_app(app)
@@ -30,10 +48,36 @@ def create_app():
             app._tables_created = True
             try:
                 db.create_all()
+                add_missing_columns(db)
+                prepare_partitions(db)
+                init_replica_schema(db)
                 print("Database tables ready")
             except Exception as e:
                 print(f"Table note: {e}")
     
+    # Compression and ETags (registered first, so it runs after the other
+    # after_request hooks)
+    init_compression(app)
+    
+    # Request latency and SQL metrics
+    init_metrics(app)
+    init_query_profiler(app)
+    
+    # Deadlines for outbound API calls made while serving a request
+    init_resilience(app)
+    
+    # Background history backfill for linked items (after create_tables)
+    init_backfill(app)
+    init_sync_scheduler(app)
+    init_email_outbox(app)
+    init_change_log(app)
+    init_partitions(app)
+    init_account_purge(app)
+    init_dictionary(app)
+    init_categorization(app)
+    init_transfers(app)
+    init_relink(app)
+    
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
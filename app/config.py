@@ -5,14 +5,62 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _normalize_db_url(url):
+    """Fix Railway's legacy 'postgres://' prefix for SQLAlchemy"""
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def _engine_options(url, read_only=False):
+    """
+    Build SQLAlchemy engine options from environment variables.
+    
+    Pool sizing only applies to server databases; SQLite picks its own pool.
+    """
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+    
+    if url.startswith('sqlite'):
+        return options
+    
+    options.update({
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    })
+    
+    if url.startswith('postgresql'):
+        pg_options = []
+        statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+        if statement_timeout:
+            pg_options.append(f'-c statement_timeout={statement_timeout}')
+        if read_only:
+            pg_options.append('-c default_transaction_read_only=on')
+        if pg_options:
+            options['connect_args'] = {'options': ' '.join(pg_options)}
+    
+    return options
+
+
 class Config:
-    # Fix Railway's legacy 'postgres://' prefix for SQLAlchemy
-    db_url = os.getenv("DATABASE_URL")
-    if db_url and db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    db_url = _normalize_db_url(os.getenv("DATABASE_URL"))
     
     SQLALCHEMY_DATABASE_URI = db_url or "sqlite:///dev.db"
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Optional read replica for dashboard reads (see app/utils/db_routing.py).
+    # A second local SQLite file works as a stand-in during development.
+    replica_url = _normalize_db_url(os.getenv("DATABASE_REPLICA_URL"))
+    SQLALCHEMY_BINDS = {
+        'replica': {'url': replica_url, **_engine_options(replica_url, read_only=True)}
+    } if replica_url else {}
+    DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 30))  # seconds
+    DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', 5))
+    DB_READ_YOUR_WRITES_WINDOW = float(os.getenv('DB_READ_YOUR_WRITES_WINDOW', 15))
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-key-change-in-production")
     
     # Email Settings (Brevo)
@@ -32,6 +80,130 @@ class Config:
     PLAID_PRODUCTS = os.getenv('PLAID_PRODUCTS', 'transactions,auth,identity').split(',')
     PLAID_COUNTRY_CODES = os.getenv('PLAID_COUNTRY_CODES', 'US').split(',')
     PLAID_REDIRECT_URI = os.getenv('PLAID_REDIRECT_URI', 'http://localhost:5000/plaid/callback')
+    PLAID_HOST = os.getenv('PLAID_HOST')  # Overrides PLAID_ENV, e.g. benchmarks/fake_plaid.py
+    PLAID_SYNC_PAGE_SIZE = int(os.getenv('PLAID_SYNC_PAGE_SIZE', 500))
+    PLAID_SYNC_PREFETCH_PAGES = int(os.getenv('PLAID_SYNC_PREFETCH_PAGES', 1))  # pages queued ahead of the writer
+    
+    # Progressive history: a newly linked item gets PLAID_INITIAL_DAYS right
+    # away, the rest back to PLAID_HISTORY_DAYS is backfilled in chunks
+    PLAID_INITIAL_DAYS = int(os.getenv('PLAID_INITIAL_DAYS', 30))
+    PLAID_HISTORY_DAYS = int(os.getenv('PLAID_HISTORY_DAYS', 730))
+    PLAID_BACKFILL_CHUNK_DAYS = int(os.getenv('PLAID_BACKFILL_CHUNK_DAYS', 90))
+    PLAID_BACKFILL_STALE_SECONDS = int(os.getenv('PLAID_BACKFILL_STALE_SECONDS', 900))  # reclaim abandoned backfills
+    PLAID_BACKFILL_ENABLED = os.getenv('PLAID_BACKFILL_ENABLED', 'true').lower() == 'true'
+    
+    # Failing items back off exponentially; login errors wait for a relink
+    PLAID_ERROR_BACKOFF_SECONDS = int(os.getenv('PLAID_ERROR_BACKOFF_SECONDS', 60))
+    PLAID_ERROR_BACKOFF_MAX_SECONDS = int(os.getenv('PLAID_ERROR_BACKOFF_MAX_SECONDS', 6 * 3600))
+    
+    # Balances are served from the database; items older than this are
+    # refreshed in the background when a page shows them
+    PLAID_BALANCE_TTL_SECONDS = int(os.getenv('PLAID_BALANCE_TTL_SECONDS', 900))
+    PLAID_BALANCE_REFRESH_ENABLED = os.getenv('PLAID_BALANCE_REFRESH_ENABLED', 'true').lower() == 'true'
+    
+    # Sync progress stream (see app/utils/sync_events.py). Streams stay open
+    # only under the gevent worker class; elsewhere clients reconnect every
+    # SYNC_EVENTS_RETRY_MS.
+    SYNC_EVENTS_POLL_SECONDS = float(os.getenv('SYNC_EVENTS_POLL_SECONDS', 1.0))
+    SYNC_EVENTS_HEARTBEAT_SECONDS = float(os.getenv('SYNC_EVENTS_HEARTBEAT_SECONDS', 15))
+    SYNC_EVENTS_MAX_STREAM_SECONDS = float(os.getenv('SYNC_EVENTS_MAX_STREAM_SECONDS', 300))
+    SYNC_EVENTS_RETRY_MS = int(os.getenv('SYNC_EVENTS_RETRY_MS', 3000))
+    SYNC_EVENTS_RETENTION_SECONDS = int(os.getenv('SYNC_EVENTS_RETENTION_SECONDS', 3600))
+    
+    # Sync scheduler (flask sync-scheduler, see app/utils/sync_scheduler.py)
+    SYNC_SCHEDULER_WORKERS = int(os.getenv('SYNC_SCHEDULER_WORKERS', 4))  # concurrent syncs per scheduler
+    SYNC_SCHEDULER_GLOBAL_LIMIT = int(os.getenv('SYNC_SCHEDULER_GLOBAL_LIMIT', 16))  # across all schedulers
+    SYNC_SCHEDULER_PER_INSTITUTION = int(os.getenv('SYNC_SCHEDULER_PER_INSTITUTION', 4))
+    SYNC_SCHEDULER_INTERVAL_SECONDS = int(os.getenv('SYNC_SCHEDULER_INTERVAL_SECONDS', 6 * 3600))  # sync items older than this
+    SYNC_SCHEDULER_RETRY_SECONDS = int(os.getenv('SYNC_SCHEDULER_RETRY_SECONDS', 900))  # after a failed sync
+    SYNC_SCHEDULER_POLL_SECONDS = float(os.getenv('SYNC_SCHEDULER_POLL_SECONDS', 5))
+    SYNC_LEASE_SECONDS = int(os.getenv('SYNC_LEASE_SECONDS', 300))  # renewed after every page
+    
+    # Outbound resilience (see app/utils/resilience.py). Each call's timeout
+    # is the service timeout, capped by what is left of the request deadline.
+    REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', 60))  # below gunicorn's timeout
+    PLAID_TIMEOUT_SECONDS = float(os.getenv('PLAID_TIMEOUT_SECONDS', 30))
+    BREVO_TIMEOUT_SECONDS = float(os.getenv('BREVO_TIMEOUT_SECONDS', 10))
+    VONAGE_TIMEOUT_SECONDS = float(os.getenv('VONAGE_TIMEOUT_SECONDS', 10))
+    CIRCUIT_FAILURE_RATE = float(os.getenv('CIRCUIT_FAILURE_RATE', 0.5))  # opens at this failure rate...
+    CIRCUIT_WINDOW_SECONDS = float(os.getenv('CIRCUIT_WINDOW_SECONDS', 60))  # ...over this window...
+    CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', 5))  # ...once it has seen this many calls
+    CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', 30))  # before a half-open probe
+    
+    # Emails queued while Brevo is unavailable, retried by the sync scheduler
+    # or `flask email-outbox`
+    EMAIL_OUTBOX_RETRY_SECONDS = int(os.getenv('EMAIL_OUTBOX_RETRY_SECONDS', 60))
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 10))
+    EMAIL_OUTBOX_INTERVAL_SECONDS = int(os.getenv('EMAIL_OUTBOX_INTERVAL_SECONDS', 60))
+    
+    # Transaction change log (see app/utils/change_log.py), compacted by the
+    # sync scheduler or `flask change-log compact`
+    CHANGE_LOG_SEGMENT_SIZE = int(os.getenv('CHANGE_LOG_SEGMENT_SIZE', 10000))  # seqs per compaction segment
+    CHANGE_LOG_COMPACT_AFTER_SECONDS = int(os.getenv('CHANGE_LOG_COMPACT_AFTER_SECONDS', 7 * 86400))
+    CHANGE_LOG_RETENTION_SECONDS = int(os.getenv('CHANGE_LOG_RETENTION_SECONDS', 90 * 86400))  # for tombstones
+    CHANGE_LOG_COMPACT_INTERVAL_SECONDS = int(os.getenv('CHANGE_LOG_COMPACT_INTERVAL_SECONDS', 3600))
+    
+    # Monthly partitions of transactions on Postgres (see app/utils/partitions.py);
+    # ignored on SQLite. Opt-in: `flask partitions convert` partitions an existing
+    # table, and with TRANSACTIONS_PARTITIONING set a fresh database is
+    # partitioned at startup. Maintained by the sync scheduler or `flask partitions maintain`
+    TRANSACTIONS_PARTITIONING = os.getenv('TRANSACTIONS_PARTITIONING', 'false').lower() == 'true'
+    TRANSACTIONS_PARTITIONS_AHEAD_MONTHS = int(os.getenv('TRANSACTIONS_PARTITIONS_AHEAD_MONTHS', 3))
+    TRANSACTIONS_ARCHIVE_AFTER_MONTHS = int(os.getenv('TRANSACTIONS_ARCHIVE_AFTER_MONTHS', 36))
+    TRANSACTIONS_ARCHIVE_TABLESPACE = os.getenv('TRANSACTIONS_ARCHIVE_TABLESPACE')  # e.g. on compressed storage
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('PARTITION_MAINTENANCE_INTERVAL_SECONDS', 3600))
+    
+    # Removed accounts: transactions are deleted after the grace period, in
+    # batches, and items left without active accounts are revoked at Plaid
+    # (see app/utils/account_purge.py)
+    ACCOUNT_PURGE_GRACE_SECONDS = int(os.getenv('ACCOUNT_PURGE_GRACE_SECONDS', 30 * 86400))
+    ACCOUNT_PURGE_BATCH_SIZE = int(os.getenv('ACCOUNT_PURGE_BATCH_SIZE', 5000))
+    ACCOUNT_PURGE_INTERVAL_SECONDS = int(os.getenv('ACCOUNT_PURGE_INTERVAL_SECONDS', 3600))
+    
+    # Merchant and category dictionaries (see app/utils/dictionary.py): ids
+    # cached per process, and the backfill of transactions stored without them
+    DICTIONARY_CACHE_SIZE = int(os.getenv('DICTIONARY_CACHE_SIZE', 100000))  # entries per dictionary
+    DICTIONARY_BACKFILL_BATCH_SIZE = int(os.getenv('DICTIONARY_BACKFILL_BATCH_SIZE', 5000))
+    DICTIONARY_BACKFILL_INTERVAL_SECONDS = int(os.getenv('DICTIONARY_BACKFILL_INTERVAL_SECONDS', 60))
+    
+    # Categorization rules (see app/utils/categorization.py): rows re-evaluated
+    # per transaction when a user's rules change, and how often the scheduler
+    # picks up users whose history is behind their rules
+    CATEGORY_RULES_BATCH_SIZE = int(os.getenv('CATEGORY_RULES_BATCH_SIZE', 5000))
+    CATEGORY_RULES_INTERVAL_SECONDS = int(os.getenv('CATEGORY_RULES_INTERVAL_SECONDS', 60))
+    
+    # Transfers between a user's own accounts (see app/utils/transfers.py):
+    # how many days apart the two sides of a transfer may be dated
+    TRANSFER_WINDOW_DAYS = int(os.getenv('TRANSFER_WINDOW_DAYS', 3))
+    
+    # Relinked items (see app/utils/relink.py): rows per transaction when a
+    # superseded account is fingerprinted and merged, and how often the
+    # scheduler merges accounts whose successor has its whole history
+    RELINK_MERGE_BATCH_SIZE = int(os.getenv('RELINK_MERGE_BATCH_SIZE', 5000))
+    RELINK_MERGE_INTERVAL_SECONDS = int(os.getenv('RELINK_MERGE_INTERVAL_SECONDS', 300))
+    
+    # Response compression and ETags (see app/utils/compression.py); brotli
+    # is used when the package is installed and the client accepts it
+    RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # bytes
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 4))
+    
+    # Metrics (see app/utils/metrics.py). METRICS_DIR lets gunicorn workers
+    # share their counters. /metrics is only served with METRICS_TOKEN set, to
+    # scrapers sending it as a bearer token.
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    
+    # Query profiler (see app/utils/query_profiler.py) - opt-in, logs N+1
+    # patterns and slow statements; the X-Query-Profile header is dev-only
+    QUERY_PROFILER = os.getenv('QUERY_PROFILER', 'false').lower() in ('1', 'true', 'yes')
+    QUERY_PROFILER_REPEAT_THRESHOLD = int(os.getenv('QUERY_PROFILER_REPEAT_THRESHOLD', 5))
+    QUERY_PROFILER_SLOW_MS = float(os.getenv('QUERY_PROFILER_SLOW_MS', 100))
+    QUERY_PROFILER_HEADER = os.getenv(
+        'QUERY_PROFILER_HEADER', str(os.getenv('FLASK_ENV') == 'development')
+    ).lower() in ('1', 'true', 'yes')
     
     # Security Settings
     SESSION_COOKIE_HTTPONLY = True
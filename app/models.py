@@ -4,7 +4,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from app.utils.db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class User(UserMixin, db.Model):
@@ -25,6 +27,15 @@ class User(UserMixin, db.Model):
     phone = db.Column(db.String(20))
     vonage_request_id = db.Column(db.String(100))  # Temp storage for Vonage verification
     
+    # Bumped by every write that changes the user's financial data; API
+    # ETags derive from it (see app/utils/data_version.py)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Categorization rules: bumped on every rule edit, and the version last
+    # applied across the user's history (see app/utils/categorization.py)
+    rules_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rules_applied_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -90,6 +101,63 @@ class QuestionnaireResponse(db.Model):
         }
 
 
+class PlaidItem(db.Model):
+    """A Plaid Item (one institution login) and its sync state"""
+    __tablename__ = 'plaid_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    
+    # Plaid identifiers
+    plaid_item_id = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    plaid_access_token = db.Column(db.String(200), nullable=False)
+    institution_name = db.Column(db.String(100))
+    
+    # Incremental sync position for /transactions/sync
+    sync_cursor = db.Column(db.Text)
+    
+    # History backfill: everything on or after this date has been ingested
+    history_complete_through = db.Column(db.Date)
+    backfill_status = db.Column(db.String(20), default='pending')  # pending, running, complete
+    backfill_claimed_at = db.Column(db.DateTime)
+    
+    # Health: set while Plaid calls for this item are failing
+    error_state = db.Column(db.String(20))  # None, backoff, relink_required
+    error_code = db.Column(db.String(100))  # Plaid error_code, e.g. ITEM_LOGIN_REQUIRED
+    error_message = db.Column(db.Text)
+    failure_count = db.Column(db.Integer, default=0)
+    first_failed_at = db.Column(db.DateTime)
+    last_failed_at = db.Column(db.DateTime)
+    retry_after = db.Column(db.DateTime)  # backoff: no Plaid calls before this
+    
+    # Balances: when the accounts' balances were last fetched, and a claim on
+    # the background refresh so it is queued once (see app/utils/balances.py)
+    balances_refreshed_at = db.Column(db.DateTime)
+    balances_claimed_at = db.Column(db.DateTime)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship
+    accounts = db.relationship(
+        'BankAccount',
+        primaryjoin='PlaidItem.plaid_item_id == foreign(BankAccount.plaid_item_id)',
+        viewonly=True,
+        lazy='dynamic'
+    )
+    
+    def __repr__(self):
+        return f'<PlaidItem {self.institution_name} - {self.plaid_item_id}>'
+    
+    @property
+    def history_complete(self):
+        return self.backfill_status == 'complete'
+    
+    @property
+    def needs_relink(self):
+        return self.error_state == 'relink_required'
+
+
 class BankAccount(db.Model):
     """Bank account linked via Plaid"""
     __tablename__ = 'bank_accounts'
@@ -118,12 +186,23 @@ class BankAccount(db.Model):
     # Status
     is_active = db.Column(db.Boolean, default=True)
     last_synced_at = db.Column(db.DateTime)
+    # Removal: data is purged a grace period later (see app/utils/account_purge.py)
+    deactivated_at = db.Column(db.DateTime)
+    purged_at = db.Column(db.DateTime)
+    # Relink: the same account on a newer item, which takes over this one's
+    # history (see app/utils/relink.py)
+    superseded_by_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship
     transactions = db.relationship('Transaction', backref='account', lazy='dynamic', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Relinking looks up the user's accounts by fingerprint
+        db.Index('ix_bank_accounts_fingerprint', 'user_id', 'institution_name', 'mask', 'account_type'),
+    )
+    
     def __repr__(self):
         return f'<BankAccount {self.institution_name} - {self.mask}>'
     
@@ -161,6 +240,21 @@ class Transaction(db.Model):
     primary_category = db.Column(db.String(100))
     detailed_category = db.Column(db.String(100))
     
+    # Dictionary codes of merchant_name and category, for grouping on integers
+    # (see app/utils/dictionary.py)
+    merchant_id = db.Column(db.Integer, db.ForeignKey('merchants.id'))
+    category_id = db.Column(db.SmallInteger, db.ForeignKey('categories.id'))
+    # Category set by the user's rules; takes precedence over category_id
+    rule_category_id = db.Column(db.SmallInteger, db.ForeignKey('categories.id'))
+    
+    # The other side of a transfer between the user's own accounts; left out
+    # of income and spending (see app/utils/transfers.py)
+    transfer_pair_id = db.Column(db.Integer)
+    
+    # Hash of date, amount and name, set on the rows of a superseded account
+    # while a relinked item's copies of them are matched (see app/utils/relink.py)
+    fingerprint = db.Column(db.BigInteger)
+    
     # Date/time
     date = db.Column(db.Date, nullable=False, index=True)
     authorized_date = db.Column(db.Date)
@@ -173,6 +267,15 @@ class Transaction(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Transfer matching looks up opposite amounts around a date
+        db.Index('ix_transactions_amount_date', 'amount', 'date'),
+        # Only fingerprinted rows are indexed, so ingest doesn't pay for it
+        db.Index('ix_transactions_account_id_fingerprint', 'account_id', 'fingerprint',
+                 postgresql_where=db.text('fingerprint IS NOT NULL'),
+                 sqlite_where=db.text('fingerprint IS NOT NULL')),
+    )
+    
     def __repr__(self):
         return f'<Transaction {self.name} ${self.amount}>'
     
@@ -188,3 +291,156 @@ class Transaction(db.Model):
             'pending': self.pending,
             'payment_channel': self.payment_channel
         }
+
+
+class Merchant(db.Model):
+    """Merchant name, stored once and referenced by Transaction.merchant_id"""
+    __tablename__ = 'merchants'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f'<Merchant {self.name}>'
+
+
+class Category(db.Model):
+    """Plaid category path, stored once and referenced by Transaction.category_id"""
+    __tablename__ = 'categories'
+    
+    # SMALLINT on Postgres; SQLite only autoincrements INTEGER primary keys
+    id = db.Column(db.SmallInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)  # the path, as in Transaction.category
+    primary_category = db.Column(db.String(100))
+    detailed_category = db.Column(db.String(100))
+    
+    def __repr__(self):
+        return f'<Category {self.name}>'
+
+
+class CategoryRule(db.Model):
+    """User rule that re-categorizes matching transactions (see app/utils/categorization.py)"""
+    __tablename__ = 'category_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # lowest matching rule wins
+    
+    # Conditions; every one that is set must hold
+    merchant_contains = db.Column(db.String(200))  # case-insensitive, in merchant name (or name)
+    min_amount = db.Column(db.Float)  # inclusive, Plaid's sign: spending is positive
+    max_amount = db.Column(db.Float)
+    account_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'))
+    
+    # Category applied to matches
+    category = db.Column(db.String(100), nullable=False)
+    category_id = db.Column(db.SmallInteger, db.ForeignKey('categories.id'), nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CategoryRule {self.id} -> {self.category}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'position': self.position,
+            'merchant_contains': self.merchant_contains,
+            'min_amount': self.min_amount,
+            'max_amount': self.max_amount,
+            'account_id': self.account_id,
+            'category': self.category
+        }
+
+
+class SyncEvent(db.Model):
+    """Sync lifecycle event, streamed to the user's open pages (see app/utils/sync_events.py)"""
+    __tablename__ = 'sync_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    event = db.Column(db.String(50), nullable=False)  # sync_started, sync_page, sync_completed, sync_failed, ...
+    data = db.Column(db.Text)  # JSON payload
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_sync_events_user_id_id', 'user_id', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<SyncEvent {self.event} user={self.user_id}>'
+
+
+class SyncLease(db.Model):
+    """Time-limited claim on a Plaid item held by one sync scheduler (see app/utils/sync_scheduler.py)"""
+    __tablename__ = 'sync_leases'
+    
+    item_id = db.Column(db.Integer, db.ForeignKey('plaid_items.id'), primary_key=True)
+    institution_name = db.Column(db.String(100))  # for per-institution concurrency limits
+    owner = db.Column(db.String(100), nullable=False)  # host:pid:uuid of the scheduler
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<SyncLease item={self.item_id} owner={self.owner}>'
+
+
+class OutboundEmail(db.Model):
+    """Email waiting for delivery while Brevo is unavailable (see app/utils/email.py)"""
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html_content = db.Column(db.Text, nullable=False)
+    
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<OutboundEmail {self.subject} to {self.to_email} ({self.status})>'
+
+
+class TransactionChange(db.Model):
+    """Append-only log of transaction inserts, updates and deletes (see app/utils/change_log.py)"""
+    __tablename__ = 'transaction_changes'
+    
+    seq = db.Column(db.Integer, primary_key=True)  # monotonic; consumers store the last seq they processed
+    op = db.Column(db.String(10), nullable=False)  # insert, update, delete
+    transaction_id = db.Column(db.Integer, nullable=False)  # no FK: deleted transactions stay in the log
+    plaid_transaction_id = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    account_id = db.Column(db.Integer, nullable=False)
+    
+    # Values before and after the change (old_* are empty for inserts, new_* for deletes)
+    old_amount = db.Column(db.Float)
+    new_amount = db.Column(db.Float)
+    old_date = db.Column(db.Date)
+    new_date = db.Column(db.Date)
+    old_category = db.Column(db.String(100))
+    new_category = db.Column(db.String(100))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    # Never reuse a seq on SQLite, even after compaction deletes the newest rows
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    def __repr__(self):
+        return f'<TransactionChange {self.seq} {self.op} {self.plaid_transaction_id}>'
+
+
+class ChangeLogOffset(db.Model):
+    """How far a change-log consumer has processed transaction_changes"""
+    __tablename__ = 'change_log_offsets'
+    
+    consumer = db.Column(db.String(100), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChangeLogOffset {self.consumer}@{self.seq}>'
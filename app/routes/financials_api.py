@@ -1,131 +1,86 @@
 """Financial dashboard API routes - Data endpoints"""
 from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
-from sqlalchemy import func
-from datetime import datetime, timedelta, date
-from app.models import db, BankAccount, Transaction
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta
+from math import ceil
+from app.models import db, BankAccount, Category, CategoryRule
+from app.utils.db_routing import read_replica
+from app.utils.partitions import transactions_source
+from app.utils.fast_json import dumps, json_response, ndjson_response, records
+from app.utils.data_version import conditional
+from app.utils.financial_snapshot import FinancialSnapshot, SECTIONS, WINDOW_DAYS
+from app.utils import categorization
 
 financials_api_bp = Blueprint('financials_api', __name__, url_prefix='/api/financials')
 
+# Response keys of a listed transaction, in the order of the columns selected for it
+TRANSACTION_FIELDS = ('id', 'name', 'merchant_name', 'amount', 'date', 'category', 'detailed_category', 'account_id')
+
+# Rows fetched from the cursor and written per chunk of an NDJSON listing
+NDJSON_BATCH_SIZE = 500
+
+
+def _active_accounts():
+    """Filters for the current user's active accounts"""
+    return BankAccount.user_id == current_user.id, BankAccount.is_active.is_(True)
+
+
+def _paginate(stmt, page, per_page):
+    """
+    One page of a SELECT, and pagination metadata in the shape of
+    Flask-SQLAlchemy's Pagination
+    """
+    page = page if page and page > 0 else 1
+    per_page = per_page if per_page and per_page > 0 else 20
+    total = db.session.execute(
+        select(func.count()).select_from(stmt.order_by(None).subquery())
+    ).scalar()
+    pages = ceil(total / per_page) if total else 0
+    return stmt.limit(per_page).offset((page - 1) * per_page), {
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': pages,
+        'has_next': page < pages,
+        'has_prev': page > 1
+    }
+
 
 @financials_api_bp.route('/overview', methods=['GET'])
 @login_required
+@conditional()
+@read_replica
 def get_overview():
     """Get complete financial overview data"""
-    # Get accounts
-    bank_accounts = BankAccount.query.filter_by(
-        user_id=current_user.id,
-        is_active=True
-    ).all()
-    
-    # Calculate totals
-    total_balance = sum(acc.current_balance or 0 for acc in bank_accounts)
-    total_available = sum(acc.available_balance or 0 for acc in bank_accounts)
-    
-    # Get transactions for last 30 days
-    thirty_days_ago = datetime.utcnow().date() - timedelta(days=30)
-    recent_transactions = Transaction.query.join(BankAccount).filter(
-        BankAccount.user_id == current_user.id,
-        Transaction.date >= thirty_days_ago
-    ).order_by(Transaction.date.desc()).limit(10).all()
-    
-    # Calculate income and expenses
-    transactions_query = Transaction.query.join(BankAccount).filter(
-        BankAccount.user_id == current_user.id,
-        Transaction.date >= thirty_days_ago
-    ).all()
-    
-    income = sum(abs(tx.amount) for tx in transactions_query if tx.amount < 0)
-    expenses = sum(tx.amount for tx in transactions_query if tx.amount > 0)
-    
-    # Spending by category
-    spending_by_category = db.session.query(
-        Transaction.primary_category,
-        func.sum(Transaction.amount).label('total')
-    ).join(BankAccount).filter(
-        BankAccount.user_id == current_user.id,
-        Transaction.date >= thirty_days_ago,
-        Transaction.amount > 0
-    ).group_by(Transaction.primary_category).all()
-    
-    return jsonify({
-        'net_worth': {
-            'net_worth': total_balance,
-            'total_assets': total_available,
-            'total_liabilities': 0,
-            'changes': {
-                'monthly': {'amount': 0, 'percentage': 0}
-            }
-        },
-        'cash_flow': {
-            'total_income': income,
-            'total_expenses': expenses,
-            'net_cash_flow': income - expenses,
-            'savings_rate': (income - expenses) / income * 100 if income > 0 else 0,
-            'insights': {
-                'recommendations': [
-                    f"You've spent ${expenses:.2f} in the last 30 days",
-                    f"Your savings rate is {((income - expenses) / income * 100 if income > 0 else 0):.1f}%"
-                ]
-            }
-        },
-        'portfolio': {
-            'total_value': 0,
-            'total_gain': 0
-        },
-        'recent_transactions': [{
-            'id': tx.id,
-            'name': tx.name,
-            'merchant_name': tx.merchant_name,
-            'amount': float(tx.amount),
-            'date': tx.date.isoformat(),
-            'category': tx.primary_category
-        } for tx in recent_transactions],
-        'spending_by_category': [{
-            'category': cat or 'Uncategorized',
-            'amount': float(total)
-        } for cat, total in spending_by_category]
-    }), 200
+    snapshot = FinancialSnapshot(current_user.id)
+    return json_response({
+        name: snapshot.section(name)
+        for name in ('net_worth', 'cash_flow', 'portfolio', 'recent_transactions', 'spending_by_category')
+    })
 
 
 @financials_api_bp.route('/accounts', methods=['GET'])
 @login_required
+@conditional('PLAID_BALANCE_TTL_SECONDS')
+@read_replica
 def get_accounts():
     """Get all accounts with balances"""
-    accounts = BankAccount.query.filter_by(
-        user_id=current_user.id,
-        is_active=True
-    ).all()
-    
-    accounts_data = [{
-        'id': acc.id,
-        'name': acc.account_name,
-        'institution': acc.institution_name,
-        'type': acc.account_type,
-        'subtype': acc.account_subtype,
-        'mask': acc.mask,
-        'balance': float(acc.current_balance or 0),
-        'available': float(acc.available_balance or 0)
-    } for acc in accounts]
-    
-    total_assets = sum(acc.current_balance or 0 for acc in accounts)
-    
-    return jsonify({
-        'accounts': accounts_data,
-        'totals': {
-            'total_assets': total_assets,
-            'total_liabilities': 0,
-            'net_worth': total_assets,
-            'checking': sum(acc.current_balance or 0 for acc in accounts if acc.account_subtype == 'checking'),
-            'savings': sum(acc.current_balance or 0 for acc in accounts if acc.account_subtype == 'savings'),
-            'credit': 0,
-            'investment': 0
-        }
-    }), 200
+    snapshot = FinancialSnapshot(current_user.id)
+    balances = snapshot.section('balances')
+    return json_response({
+        'accounts': snapshot.section('accounts'),
+        'balances_as_of': balances['as_of'],
+        'refreshing': balances['refreshing'],
+        'totals': snapshot.section('totals')
+    })
 
 
 @financials_api_bp.route('/transactions', methods=['GET'])
 @login_required
+@conditional()
+@read_replica
 def get_transactions():
     """Get transactions with filtering and pagination"""
     page = request.args.get('page', 1, type=int)
@@ -138,82 +93,161 @@ def get_transactions():
     end_date = request.args.get('end_date')
     search = request.args.get('search')
     
-    query = Transaction.query.join(BankAccount).filter(
-        BankAccount.user_id == current_user.id
-    )
+    start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    
+    # Full-history listings also read archived partitions (Postgres)
+    Tx = transactions_source(start)
+    # The user's rules override Plaid's category
+    RuleCategory = aliased(Category)
+    primary_category = func.coalesce(RuleCategory.primary_category, Tx.primary_category)
+    # Plain rows of just the listed columns: no ORM objects to build
+    stmt = select(
+        Tx.id, Tx.name, Tx.merchant_name, Tx.amount, Tx.date, primary_category,
+        Tx.detailed_category, Tx.account_id
+    ).join(BankAccount, BankAccount.id == Tx.account_id).outerjoin(
+        RuleCategory, RuleCategory.id == Tx.rule_category_id
+    ).where(*_active_accounts())
     
     if account_id:
-        query = query.filter(Transaction.account_id == account_id)
+        stmt = stmt.where(Tx.account_id == account_id)
     
     if category:
-        query = query.filter(Transaction.primary_category == category)
+        stmt = stmt.where(primary_category == category)
     
-    if start_date:
-        start = datetime.strptime(start_date, '%Y-%m-%d').date()
-        query = query.filter(Transaction.date >= start)
+    if start:
+        stmt = stmt.where(Tx.date >= start)
     
     if end_date:
         end = datetime.strptime(end_date, '%Y-%m-%d').date()
-        query = query.filter(Transaction.date <= end)
+        stmt = stmt.where(Tx.date <= end)
     
     if search:
         search_term = f'%{search}%'
-        query = query.filter(
+        stmt = stmt.where(
             db.or_(
-                Transaction.name.ilike(search_term),
-                Transaction.merchant_name.ilike(search_term)
+                Tx.name.ilike(search_term),
+                Tx.merchant_name.ilike(search_term)
             )
         )
     
-    query = query.order_by(Transaction.date.desc())
+    stmt = stmt.order_by(Tx.date.desc())
     
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    page_stmt, pagination = _paginate(stmt, page, per_page)
     
-    return jsonify({
-        'transactions': [{
-            'id': tx.id,
-            'name': tx.name,
-            'merchant_name': tx.merchant_name,
-            'amount': float(tx.amount),
-            'date': tx.date.isoformat(),
-            'category': tx.primary_category,
-            'detailed_category': tx.detailed_category,
-            'account_id': tx.account_id
-        } for tx in pagination.items],
-        'pagination': {
-            'page': pagination.page,
-            'per_page': pagination.per_page,
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev
-        }
-    }), 200
+    # Large pages can stream as NDJSON, one transaction per line, with the
+    # pagination block in a header
+    if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        rows = db.session.execute(page_stmt.execution_options(yield_per=NDJSON_BATCH_SIZE))
+        return ndjson_response(TRANSACTION_FIELDS, rows, headers={'X-Pagination': dumps(pagination).decode()},
+                               batch_size=NDJSON_BATCH_SIZE)
+    
+    return json_response({
+        'transactions': records(TRANSACTION_FIELDS, db.session.execute(page_stmt).all()),
+        'pagination': pagination
+    })
 
 
 @financials_api_bp.route('/categories', methods=['GET'])
 @login_required
+@conditional()
+@read_replica
 def get_categories():
     """Get list of transaction categories with spending totals"""
-    today = date.today()
-    month_start = today.replace(day=1)
-    
-    categories = db.session.query(
-        Transaction.primary_category,
-        func.sum(Transaction.amount).label('total')
-    ).join(BankAccount).filter(
-        BankAccount.user_id == current_user.id,
-        Transaction.date >= month_start,
-        Transaction.amount > 0
-    ).group_by(
-        Transaction.primary_category
-    ).order_by(
-        db.desc('total')
+    return json_response({'categories': FinancialSnapshot(current_user.id).section('categories')})
+
+
+@financials_api_bp.route('/batch', methods=['GET'])
+@login_required
+@conditional('PLAID_BALANCE_TTL_SECONDS')
+@read_replica
+def get_batch():
+    """
+    Several sections in one response, from one read of the shared data
+    
+    ?include=accounts,totals,recent_transactions selects the sections (any of
+    SECTIONS), and fields[<section>]=id,amount trims a section's objects to
+    those keys.
+    """
+    include = [name for name in request.args.get('include', '').split(',') if name]
+    if not include:
+        return jsonify({'success': False, 'error': f"include is required, e.g. include={','.join(SECTIONS[:3])}"}), 400
+    unknown = [name for name in include if name not in SECTIONS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown sections: {', '.join(unknown)}"}), 400
+    
+    snapshot = FinancialSnapshot(current_user.id)
+    payload = {}
+    for name in include:
+        section = snapshot.section(name)
+        fields = request.args.get(f'fields[{name}]')
+        if fields:
+            keys = fields.split(',')
+            sample = section[0] if isinstance(section, list) and section else section
+            missing = [key for key in keys if isinstance(sample, dict) and key not in sample]
+            if missing:
+                return jsonify({'success': False, 'error': f"Unknown fields for {name}: {', '.join(missing)}"}), 400
+            section = _select_fields(section, keys)
+        payload[name] = section
+    return json_response(payload)
+
+
+def _select_fields(section, keys):
+    """Trim a section (an object or a list of objects) to the given keys"""
+    if isinstance(section, list):
+        return [{key: item[key] for key in keys} for item in section]
+    return {key: section[key] for key in keys}
+
+
+def _rules_window_start():
+    """
+    First date re-categorized while a rule edit is being served: the
+    snapshot's window. The sync scheduler re-applies the rest of the history.
+    """
+    return datetime.utcnow().date() - timedelta(days=WINDOW_DAYS)
+
+
+@financials_api_bp.route('/rules', methods=['GET'])
+@login_required
+def get_rules():
+    """List the user's categorization rules in the order they apply"""
+    rules = CategoryRule.query.filter_by(user_id=current_user.id).order_by(
+        CategoryRule.position, CategoryRule.id
     ).all()
-    
-    return jsonify({
-        'categories': [
-            {'name': c[0] or 'UNCATEGORIZED', 'total': float(c[1] or 0)}
-            for c in categories
-        ]
-    }), 200
+    return jsonify({'rules': [rule.to_dict() for rule in rules]})
+
+
+@financials_api_bp.route('/rules', methods=['POST'])
+@login_required
+def create_rule():
+    """Create a categorization rule and apply it to the user's recent transactions (history follows)"""
+    result = categorization.save_rule(current_user.id, request.get_json(silent=True) or {})
+    if not result['success']:
+        return jsonify(result), 400
+    recategorized = categorization.reapply_recent(current_user.id, _rules_window_start())
+    return jsonify({'success': True, 'rule': result['rule'].to_dict(), 'recategorized': recategorized}), 201
+
+
+@financials_api_bp.route('/rules/<int:rule_id>', methods=['PUT'])
+@login_required
+def update_rule(rule_id):
+    """Change a categorization rule and re-apply the user's rules to recent transactions (history follows)"""
+    rule = CategoryRule.query.filter_by(id=rule_id, user_id=current_user.id).first()
+    if not rule:
+        return jsonify({'success': False, 'error': 'Rule not found'}), 404
+    result = categorization.save_rule(current_user.id, request.get_json(silent=True) or {}, rule)
+    if not result['success']:
+        return jsonify(result), 400
+    recategorized = categorization.reapply_recent(current_user.id, _rules_window_start())
+    return jsonify({'success': True, 'rule': rule.to_dict(), 'recategorized': recategorized})
+
+
+@financials_api_bp.route('/rules/<int:rule_id>', methods=['DELETE'])
+@login_required
+def delete_rule(rule_id):
+    """Delete a categorization rule; its transactions go back to their other rules or Plaid's category"""
+    rule = CategoryRule.query.filter_by(id=rule_id, user_id=current_user.id).first()
+    if not rule:
+        return jsonify({'success': False, 'error': 'Rule not found'}), 404
+    categorization.delete_rule(rule)
+    recategorized = categorization.reapply_recent(current_user.id, _rules_window_start())
+    return jsonify({'success': True, 'recategorized': recategorized})
@@ -1,9 +1,13 @@
 """Main application routes"""
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+import hmac
+
+from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, abort
 from flask_login import login_required, current_user
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from app.models import db, BankAccount, Transaction
+from app.models import db
+from app.utils.db_routing import read_replica
+from app.utils.financial_snapshot import FinancialSnapshot
+from app.utils.metrics import render_prometheus
+from app.utils.resilience import breaker_states
 from app.utils.sms import send_sms_code
 from app.utils.email import send_mfa_enabled_notification
 
@@ -16,6 +20,26 @@ def health():
     return {'status': 'ok'}, 200
 
 
+@main_bp.route('/health/dependencies')
+def health_dependencies():
+    """Circuit breaker states for Plaid, Brevo and Vonage in this worker."""
+    states = breaker_states()
+    degraded = any(state['state'] != 'closed' for state in states.values())
+    return {'status': 'degraded' if degraded else 'ok', 'breakers': states}, 200
+
+
+@main_bp.route('/metrics')
+def metrics():
+    """Prometheus metrics aggregated across all workers (needs METRICS_TOKEN)."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    body = render_prometheus(current_app.config.get('METRICS_DIR'))
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @main_bp.route('/')
 def index():
     """Landing page."""
@@ -24,6 +48,7 @@ def index():
 
 @main_bp.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
     """Main dashboard with bank accounts and transactions."""
     if not current_user.is_verified:
@@ -35,39 +60,16 @@ def dashboard():
         user_id=current_user.id
     ).order_by(QuestionnaireResponse.created_at.desc()).first()
     
-    # Get bank accounts
-    bank_accounts = BankAccount.query.filter_by(
-        user_id=current_user.id,
-        is_active=True
-    ).all()
-    
-    # Get recent transactions (last 30 days)
-    thirty_days_ago = datetime.utcnow().date() - timedelta(days=30)
-    recent_transactions = Transaction.query.join(BankAccount).filter(
-        BankAccount.user_id == current_user.id,
-        Transaction.date >= thirty_days_ago
-    ).order_by(Transaction.date.desc()).limit(10).all()
-    
-    # Calculate total balance across all accounts
-    total_balance = sum(acc.current_balance or 0 for acc in bank_accounts)
-    
-    # Calculate spending by category (last 30 days)
-    spending_by_category = db.session.query(
-        Transaction.primary_category,
-        func.sum(Transaction.amount).label('total')
-    ).join(BankAccount).filter(
-        BankAccount.user_id == current_user.id,
-        Transaction.date >= thirty_days_ago,
-        Transaction.amount > 0  # Only expenses (positive amounts in Plaid)
-    ).group_by(Transaction.primary_category).all()
+    # Accounts and the last 30 days of transactions, read once for every widget
+    snapshot = FinancialSnapshot(current_user.id)
     
     return render_template(
         'dashboard.html',
         assessment=latest_response,
-        bank_accounts=bank_accounts,
-        recent_transactions=recent_transactions,
-        total_balance=total_balance,
-        spending_by_category=spending_by_category
+        bank_accounts=snapshot.accounts,
+        recent_transactions=snapshot.recent_transactions,
+        total_balance=snapshot.total_balance,
+        spending_by_category=snapshot.spending_by_category
     )
 
 
@@ -1,9 +1,14 @@
 """Plaid integration routes for bank linking and transaction management"""
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from datetime import datetime
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 
-from app.models import db, BankAccount
+from app.models import db, BankAccount, PlaidItem
 from app.utils.plaid_service import plaid_service
+from app.utils.backfill import backfill_worker
+from app.utils import sync_events, data_version
+from app.utils.balances import revalidate
 
 plaid_bp = Blueprint('plaid', __name__)
 
@@ -50,7 +55,7 @@ def callback():
     
     # Save accounts to database
     institution_name = metadata.get('institution', {}).get('name', 'Unknown Bank')
-    saved_accounts = plaid_service.save_accounts_for_user(
+    saved = plaid_service.save_accounts_for_user(
         current_user.id,
         access_token,
         item_id,
@@ -58,13 +63,17 @@ def callback():
         institution_name
     )
     
-    # Sync initial transactions for each account
-    for account in saved_accounts:
-        plaid_service.sync_and_save_transactions(account)
+    # Import recent transactions now so the dashboard has data right away;
+    # older history is backfilled in the background
+    item = plaid_service.get_or_create_item(current_user.id, access_token, item_id, institution_name)
+    with backfill_worker.interactive():
+        plaid_service.ingest_recent(item)
+    backfill_worker.enqueue(item.id)
     
     return jsonify({
         'success': True,
-        'accounts_linked': len(saved_accounts)
+        'accounts_linked': len(saved['accounts']),
+        'history_complete_through': item.history_complete_through.isoformat() if item.history_complete_through else None
     })
 
 
@@ -77,7 +86,37 @@ def accounts():
         is_active=True
     ).all()
     
-    return render_template('plaid/accounts.html', accounts=accounts)
+    items = {
+        item.plaid_item_id: item
+        for item in PlaidItem.query.filter_by(user_id=current_user.id)
+    }
+    
+    # Stored balances are shown right away; stale ones refresh in the background
+    balances = revalidate(current_user.id)
+    
+    return render_template('plaid/accounts.html', accounts=accounts, items=items, balances=balances)
+
+
+@plaid_bp.route('/events')
+@login_required
+def events():
+    """Server-Sent Events stream of the current user's sync progress"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    user_id = current_user.id
+    # Loading current_user checked out a connection that would otherwise be
+    # held until the stream closes; the stream opens its own per poll
+    db.session.remove()
+    
+    response = Response(
+        stream_with_context(sync_events.stream(
+            user_id,
+            int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        )),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy buffer the stream
+    return response
 
 
 @plaid_bp.route('/sync/<int:account_id>', methods=['POST'])
@@ -97,6 +136,12 @@ def sync_account(account_id):
     
     if result['success']:
         flash(f"Synced {result['added']} new transactions.", 'success')
+    elif result.get('error_state') == 'relink_required':
+        flash(f'{account.institution_name} needs you to sign in again. Use Reconnect to fix the connection.', 'warning')
+    elif result.get('in_progress'):
+        flash(f'{account.institution_name} is already syncing. New transactions will appear when it finishes.', 'info')
+    elif result.get('skipped'):
+        flash(f'Syncing {account.institution_name} is paused after repeated errors. We will retry automatically.', 'warning')
     else:
         flash('Failed to sync transactions.', 'danger')
     
@@ -112,16 +157,85 @@ def sync_all():
         is_active=True
     ).all()
     
+    # One sync per item covers all of its accounts
     total_added = 0
+    needs_relink = set()
+    in_progress = set()
+    synced_items = set()
     for account in accounts:
+        if account.plaid_item_id in synced_items:
+            continue
+        synced_items.add(account.plaid_item_id)
         result = plaid_service.sync_and_save_transactions(account)
         if result['success']:
             total_added += result['added']
+        elif result.get('error_state') == 'relink_required':
+            needs_relink.add(account.institution_name)
+        elif result.get('in_progress'):
+            in_progress.add(account.institution_name)
     
     flash(f"Synced {total_added} new transactions across all accounts.", 'success')
+    if in_progress:
+        flash(f"{', '.join(sorted(in_progress))} already syncing; their new transactions will appear when it finishes.",
+              'info')
+    if needs_relink:
+        flash(f"Reconnect {', '.join(sorted(needs_relink))} to resume syncing.", 'warning')
     return redirect(url_for('main.dashboard'))
 
 
+@plaid_bp.route('/relink/<int:account_id>')
+@login_required
+def relink(account_id):
+    """Open Plaid Link in update mode to repair a broken connection"""
+    account = BankAccount.query.filter_by(
+        id=account_id,
+        user_id=current_user.id
+    ).first()
+    
+    if not account:
+        flash('Account not found.', 'danger')
+        return redirect(url_for('plaid.accounts'))
+    
+    item = plaid_service.item_for_account(account)
+    result = plaid_service.create_link_token(current_user, access_token=item.plaid_access_token)
+    
+    if not result['success']:
+        flash('Unable to connect to Plaid. Please try again later.', 'danger')
+        return redirect(url_for('plaid.accounts'))
+    
+    return render_template(
+        'plaid/link.html',
+        link_token=result['link_token'],
+        callback_url=url_for('plaid.relink_complete', account_id=account.id),
+        success_url=url_for('plaid.accounts')
+    )
+
+
+@plaid_bp.route('/relink/<int:account_id>/complete', methods=['POST'])
+@login_required
+def relink_complete(account_id):
+    """Handle Plaid Link update mode success: clear the error and resync"""
+    account = BankAccount.query.filter_by(
+        id=account_id,
+        user_id=current_user.id
+    ).first()
+    
+    if not account:
+        return jsonify({'success': False, 'error': 'Account not found'}), 404
+    
+    # Update mode keeps the same access token, so there is nothing to exchange
+    item = plaid_service.item_for_account(account)
+    plaid_service.mark_item_relinked(item)
+    result = plaid_service.sync_and_save_transactions(account)
+    if not item.history_complete:
+        backfill_worker.enqueue(item.id)
+    
+    return jsonify({
+        'success': result['success'],
+        'error': result.get('error')
+    })
+
+
 @plaid_bp.route('/remove/<int:account_id>', methods=['POST'])
 @login_required
 def remove_account(account_id):
@@ -135,7 +249,10 @@ def remove_account(account_id):
         flash('Account not found.', 'danger')
         return redirect(url_for('plaid.accounts'))
     
+    # Hidden right away; its data is purged after ACCOUNT_PURGE_GRACE_SECONDS
     account.is_active = False
+    account.deactivated_at = datetime.utcnow()
+    data_version.bump(current_user.id)
     db.session.commit()
     
     flash('Account removed successfully.', 'success')
@@ -0,0 +1,29 @@
+/**
+ * Conditional GETs for the /api/financials endpoints
+ *
+ * fetchJSON(url) remembers each URL's ETag and body and sends If-None-Match.
+ * The server answers 304 without running a query when nothing has changed
+ * since the last sync; fetchJSON then resolves with the remembered body and
+ * changed: false, so the page can skip redrawing.
+ */
+const apiResponses = new Map();
+
+async function fetchJSON(url, options = {}) {
+    const cached = apiResponses.get(url);
+    const headers = Object.assign({}, options.headers);
+    if (cached) headers['If-None-Match'] = cached.etag;
+
+    // no-store: handle the 304 here instead of letting the browser cache answer it
+    const response = await fetch(url, Object.assign({}, options, { headers, cache: 'no-store' }));
+    if (response.status === 304 && cached) {
+        return { ok: true, changed: false, data: cached.data };
+    }
+    if (!response.ok) {
+        return { ok: false, changed: false, status: response.status, data: null };
+    }
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) apiResponses.set(url, { etag, data });
+    return { ok: true, changed: true, data };
+}
@@ -0,0 +1,57 @@
+/**
+ * Live sync progress from /plaid/events (Server-Sent Events)
+ *
+ * watchSyncEvents({ onChange }) shows a status banner while a sync runs and
+ * calls onChange(event) once new data has landed (transactions or refreshed
+ * balances), so the page can refresh just the widgets that depend on them.
+ */
+function watchSyncEvents(options = {}) {
+    if (!window.EventSource) return null;
+
+    const banner = document.createElement('div');
+    banner.className = 'alert alert-info';
+    banner.style.display = 'none';
+    const container = document.querySelector('.main-content .container') || document.body;
+    container.prepend(banner);
+
+    let hideTimer = null;
+    let changeTimer = null;
+
+    const show = (message, category = 'info', hideAfterMs = 0) => {
+        clearTimeout(hideTimer);
+        banner.className = `alert alert-${category}`;
+        banner.textContent = message;
+        banner.style.display = 'block';
+        if (hideAfterMs) {
+            hideTimer = setTimeout(() => { banner.style.display = 'none'; }, hideAfterMs);
+        }
+    };
+
+    // Several items can finish close together; refresh once
+    const changed = (data) => {
+        if (!options.onChange) return;
+        clearTimeout(changeTimer);
+        changeTimer = setTimeout(() => options.onChange(data), 300);
+    };
+
+    const source = new EventSource(options.url || '/plaid/events');
+    const on = (name, handler) => source.addEventListener(name, (e) => handler(JSON.parse(e.data)));
+
+    on('sync_started', (d) => show(`Syncing ${d.institution_name}...`));
+    on('sync_page', (d) => show(`Syncing ${d.institution_name}... (page ${d.page})`));
+    on('sync_completed', (d) => {
+        show(`${d.institution_name} synced: ${d.added} new, ${d.modified} updated, ${d.removed} removed.`, 'success', 5000);
+        if (d.added || d.modified || d.removed) changed(d);
+    });
+    on('sync_failed', (d) => show(`Sync failed for ${d.institution_name}. Please try again later.`, 'danger', 10000));
+    on('backfill_progress', (d) => show(`Importing ${d.institution_name} history... complete through ${d.history_complete_through}.`));
+    on('balances_refreshed', (d) => {
+        if (d.changed) changed(d);
+    });
+    on('backfill_completed', (d) => {
+        show(`Full ${d.institution_name} history imported.`, 'success', 5000);
+        changed(d);
+    });
+
+    return source;
+}
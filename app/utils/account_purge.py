@@ -0,0 +1,248 @@
+"""Purging removed accounts
+
+Removing an account only clears is_active and stamps deactivated_at. Every
+read joins bank_accounts on is_active, so the account and its transactions
+disappear from the app at once, and sync stops storing new transactions for
+it. The data itself is kept for ACCOUNT_PURGE_GRACE_SECONDS; after that
+purge():
+
+- deletes the account's transactions ACCOUNT_PURGE_BATCH_SIZE rows at a
+  time, each batch in its own short transaction and logged to the change
+  log, from the live table and (on Postgres) archived partitions. Transfer
+  partners on the user's other accounts are unpaired, and matched again
+  where another row fits
+- marks the account purged_at; the row stays as a tombstone while its item
+  is linked, so transactions Plaid still sends for it are recognised and
+  dropped
+- once an item has no active accounts left, revokes it at Plaid
+  (/item/remove) and deletes the item, its sync lease, its account rows and
+  the categorization rules scoped to them
+- on Postgres, runs a plain VACUUM ANALYZE on the tables it deleted from,
+  so the space is reused and the planner sees the new row counts. VACUUM
+  FULL would return space to the OS but locks the table while it rewrites
+  it, so it is left to operators. SQLite's VACUUM rewrites the whole
+  database under an exclusive lock and is skipped as well.
+
+Run by the sync scheduler, or by hand:
+
+    flask accounts status
+    flask accounts purge
+"""
+import logging
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import select, update, delete, func, text, and_
+
+from app.models import db, BankAccount, CategoryRule, PlaidItem, SyncLease, Transaction
+from app.utils import categorization, change_log, data_version, transfers
+from app.utils.partitions import ARCHIVE, archive_table, archived_through
+from app.utils.plaid_service import plaid_service
+
+logger = logging.getLogger(__name__)
+
+
+def _deactivated_before(cutoff):
+    # Accounts removed before deactivated_at existed count from their last update
+    return func.coalesce(BankAccount.deactivated_at, BankAccount.updated_at) <= cutoff
+
+
+def due_accounts(cutoff):
+    """Ids of removed accounts past the grace period whose data is still there"""
+    return db.session.execute(
+        select(BankAccount.id)
+        # A superseded account's data goes to its successor instead (see app/utils/relink.py)
+        .where(BankAccount.is_active.is_(False), BankAccount.superseded_by_id.is_(None),
+               BankAccount.purged_at.is_(None), _deactivated_before(cutoff))
+        .order_by(BankAccount.id)
+    ).scalars().all()
+
+
+def _delete_batch(table, account_id, batch_size):
+    """Delete up to batch_size of an account's rows from table; returns how many"""
+    rows = db.session.execute(
+        select(table.c.plaid_transaction_id, table.c.id, table.c.account_id, BankAccount.user_id,
+               table.c.amount, table.c.date, table.c.primary_category)
+        .join(BankAccount, BankAccount.id == table.c.account_id)
+        .where(table.c.account_id == account_id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+    user_id = rows[0].user_id
+    # Partners on the user's other accounts count as spending and income again
+    unpaired = transfers.unpair(row.id for row in rows)
+    db.session.execute(delete(table).where(table.c.id.in_([row.id for row in rows])))
+    change_log.record([change_log.deleted(row) for row in rows])
+    if unpaired:
+        transfers.match(user_id, [(row.amount, row.date) for row in rows])
+        data_version.bump(user_id)
+    db.session.commit()
+    return len(rows)
+
+
+def purge_account(account_id, batch_size):
+    """
+    Delete all of an account's transactions in batches, then mark it purged
+
+    Returns:
+        Number of transactions deleted
+    """
+    tables = [Transaction.__table__]
+    if archived_through() is not None:
+        tables.append(archive_table)
+
+    deleted = 0
+    for table in tables:
+        while True:
+            count = _delete_batch(table, account_id, batch_size)
+            if not count:
+                break
+            deleted += count
+
+    db.session.execute(
+        update(BankAccount)
+        .where(BankAccount.id == account_id, BankAccount.is_active.is_(False))
+        .values(purged_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return deleted
+
+
+def revocable_items():
+    """(plaid_item_id, access token) of items whose accounts are all removed and purged"""
+    return db.session.execute(
+        select(BankAccount.plaid_item_id, func.min(BankAccount.plaid_access_token))
+        .group_by(BankAccount.plaid_item_id)
+        .having(func.count() == func.count(BankAccount.purged_at))
+    ).all()
+
+
+def revoke_item(plaid_item_id, access_token):
+    """
+    Revoke an item at Plaid and delete its records
+
+    Returns:
+        True if the item is gone, False if it is being synced or Plaid could
+        not be reached (it is retried next time)
+    """
+    item = PlaidItem.query.filter_by(plaid_item_id=plaid_item_id).first()
+    if item is not None:
+        leased = db.session.execute(
+            select(SyncLease.item_id).where(SyncLease.item_id == item.id, SyncLease.expires_at > datetime.utcnow())
+        ).first()
+        if leased:
+            return False
+        access_token = item.plaid_access_token
+
+    result = plaid_service.remove_item(access_token)
+    if not result['success']:
+        logger.warning(f"Could not revoke item {plaid_item_id}: {result['error']}")
+        return False
+
+    if item is not None:
+        db.session.execute(delete(SyncLease).where(SyncLease.item_id == item.id))
+        db.session.execute(delete(PlaidItem).where(PlaidItem.id == item.id))
+    # Rules scoped to the accounts go with them
+    accounts = db.session.execute(
+        select(BankAccount.id, BankAccount.user_id)
+        .where(BankAccount.plaid_item_id == plaid_item_id, BankAccount.purged_at.is_not(None))
+    ).all()
+    if db.session.execute(
+        delete(CategoryRule).where(CategoryRule.account_id.in_([account.id for account in accounts]))
+    ).rowcount:
+        for user_id in {account.user_id for account in accounts}:
+            categorization.invalidate(user_id)
+    db.session.execute(
+        delete(BankAccount.__table__).where(
+            BankAccount.plaid_item_id == plaid_item_id,
+            BankAccount.purged_at.is_not(None)
+        )
+    )
+    db.session.commit()
+    return True
+
+
+def reclaim_space(tables):
+    """VACUUM ANALYZE tables on Postgres (outside a transaction, as VACUUM requires)"""
+    engine = db.engine
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in tables:
+            conn.execute(text(f'VACUUM (ANALYZE) {table}'))
+
+
+def purge(grace_seconds=None):
+    """
+    Purge accounts removed more than the grace period ago, and revoke items
+    left without active accounts
+
+    Returns:
+        dict with counts of 'accounts' purged, 'transactions' deleted and
+        'items' revoked
+    """
+    config = current_app.config
+    if grace_seconds is None:
+        grace_seconds = config['ACCOUNT_PURGE_GRACE_SECONDS']
+    batch_size = config['ACCOUNT_PURGE_BATCH_SIZE']
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+
+    accounts = due_accounts(cutoff)
+    deleted = 0
+    for account_id in accounts:
+        count = purge_account(account_id, batch_size)
+        logger.info(f"Purged account {account_id}: {count} transactions deleted")
+        deleted += count
+
+    revoked = 0
+    for plaid_item_id, access_token in revocable_items():
+        if revoke_item(plaid_item_id, access_token):
+            logger.info(f"Revoked item {plaid_item_id}")
+            revoked += 1
+
+    if deleted:
+        tables = [Transaction.__tablename__]
+        if archived_through() is not None:
+            tables.append(ARCHIVE)
+        reclaim_space(tables)
+
+    return {'accounts': len(accounts), 'transactions': deleted, 'items': revoked}
+
+
+def status():
+    """Removed accounts waiting for the grace period, due for purging, and purged"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['ACCOUNT_PURGE_GRACE_SECONDS'])
+    removed = and_(BankAccount.is_active.is_(False), BankAccount.superseded_by_id.is_(None))
+    unpurged = BankAccount.purged_at.is_(None)
+    counts = db.session.execute(
+        select(
+            func.count().filter(removed, unpurged, ~_deactivated_before(cutoff)),
+            func.count().filter(removed, unpurged, _deactivated_before(cutoff)),
+            func.count().filter(BankAccount.purged_at.is_not(None)),
+        )
+    ).one()
+    return dict(zip(('in_grace', 'due', 'purged'), counts))
+
+
+def init_account_purge(app):
+    """Register the `flask accounts` commands"""
+
+    @app.cli.group('accounts')
+    def accounts_group():
+        """Purge removed bank accounts."""
+
+    @accounts_group.command('status')
+    def status_command():
+        """Count removed accounts by purge state."""
+        info = status()
+        click.echo(f"{info['in_grace']} in grace period, {info['due']} due, {info['purged']} purged")
+
+    @accounts_group.command('purge')
+    @click.option('--grace-seconds', type=int, help='Override ACCOUNT_PURGE_GRACE_SECONDS.')
+    def purge_command(grace_seconds):
+        """Delete data of accounts removed longer ago than the grace period."""
+        result = purge(grace_seconds)
+        click.echo(f"Purged {result['accounts']} accounts ({result['transactions']} transactions), "
+                   f"revoked {result['items']} items")
@@ -0,0 +1,122 @@
+"""Background history backfill for linked Plaid items
+
+A newly linked item only gets its most recent transactions during the link
+request. The rest of its history is fetched here, newest chunk first, by one
+daemon thread per process. Interactive syncs take priority: the backfill
+waits between chunks while any interactive sync is running in the process.
+
+Work is claimed through PlaidItem.backfill_status, so several processes can
+run a worker without fetching the same item twice, and an item abandoned by
+a crashed process is picked up again once its claim goes stale.
+"""
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_, and_
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillWorker:
+    """Per-process queue of item ids whose history still needs fetching"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._interactive = 0
+        self._idle = threading.Condition()
+
+    def ensure_started(self, app):
+        """Start the worker thread in this process if it isn't running yet"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # A forked worker inherits the parent's queue but not its thread
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(app,), name='plaid-backfill', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, item_id):
+        """Schedule an item's history backfill"""
+        app = current_app._get_current_object()
+        if not app.config['PLAID_BACKFILL_ENABLED']:
+            return
+        self.ensure_started(app)
+        self._queue.put(item_id)
+
+    @contextmanager
+    def interactive(self):
+        """Mark an interactive sync as running so the backfill yields to it"""
+        with self._idle:
+            self._interactive += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._interactive -= 1
+                self._idle.notify_all()
+
+    def wait_for_interactive(self):
+        """Block until no interactive sync is running in this process"""
+        with self._idle:
+            self._idle.wait_for(lambda: self._interactive == 0)
+
+    def _resumable_item_ids(self):
+        from app.models import PlaidItem
+
+        stale = datetime.utcnow() - timedelta(seconds=current_app.config['PLAID_BACKFILL_STALE_SECONDS'])
+        return [item_id for (item_id,) in PlaidItem.query.with_entities(PlaidItem.id).filter(
+            or_(
+                PlaidItem.backfill_status == 'pending',
+                and_(PlaidItem.backfill_status == 'running', PlaidItem.backfill_claimed_at < stale)
+            )
+        )]
+
+    def _run(self, app):
+        # Imported here: plaid_service imports this module
+        from app.models import db
+        from app.utils.plaid_service import plaid_service
+
+        # Resume items left unfinished by an earlier process
+        with app.app_context():
+            try:
+                for item_id in self._resumable_item_ids():
+                    self._queue.put(item_id)
+            except Exception:
+                logger.exception("Could not load pending backfills")
+            finally:
+                db.session.remove()
+
+        while True:
+            item_id = self._queue.get()
+            with app.app_context():
+                try:
+                    plaid_service.backfill_item(item_id, before_chunk=self.wait_for_interactive)
+                except Exception:
+                    logger.exception(f"Backfill for item {item_id} failed")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+
+def init_backfill(app):
+    """Start the backfill worker lazily, on the first request of each process"""
+    if not app.config['PLAID_BACKFILL_ENABLED']:
+        return
+
+    @app.before_request
+    def start_backfill_worker():
+        backfill_worker.ensure_started(app)
+
+
+backfill_worker = BackfillWorker()
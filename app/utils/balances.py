@@ -0,0 +1,135 @@
+"""Account balances with stale-while-revalidate
+
+Pages read balances from bank_accounts and never wait on Plaid. Each item
+records when its balances were last fetched (PlaidItem.balances_refreshed_at).
+When a page finds an item older than PLAID_BALANCE_TTL_SECONDS it still serves
+the stored balances, and queues a refresh on a per-process daemon thread. The
+refresh publishes a balances_refreshed sync event, so open pages re-fetch once
+the new numbers are in.
+
+A refresh is claimed through PlaidItem.balances_claimed_at, so page views in
+several workers queue each stale item once.
+"""
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update, or_, and_
+
+from app.models import db, PlaidItem
+from app.utils.db_routing import primary
+from app.utils.plaid_service import plaid_service
+
+logger = logging.getLogger(__name__)
+
+# A claim older than this belonged to a refresh that died; take it over
+CLAIM_STALE_SECONDS = 120
+
+
+class BalanceRefresher:
+    """Per-process queue of item ids whose balances need fetching"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self, app):
+        """Start the worker thread in this process if it isn't running yet"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # A forked worker inherits the parent's queue but not its thread
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(app,), name='plaid-balances', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, item_id):
+        self.ensure_started(current_app._get_current_object())
+        self._queue.put(item_id)
+
+    def _run(self, app):
+        while True:
+            item_id = self._queue.get()
+            with app.app_context():
+                try:
+                    plaid_service.refresh_balances(db.session.get(PlaidItem, item_id))
+                except Exception:
+                    logger.exception(f"Balance refresh for item {item_id} failed")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+
+def _claim(item_id, now, fresh_after):
+    claimed = db.session.execute(
+        update(PlaidItem)
+        .where(
+            PlaidItem.id == item_id,
+            # Still stale: a refresh may have finished since we looked
+            or_(PlaidItem.balances_refreshed_at.is_(None), PlaidItem.balances_refreshed_at <= fresh_after),
+            or_(
+                PlaidItem.balances_claimed_at.is_(None),
+                PlaidItem.balances_claimed_at < now - timedelta(seconds=CLAIM_STALE_SECONDS)
+            )
+        )
+        .values(balances_claimed_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def revalidate(user_id):
+    """
+    Queue a background refresh for each of a user's items with stale balances
+
+    Items waiting for a relink or backing off are left alone.
+
+    Returns:
+        dict with 'as_of' (when the oldest item's balances were fetched,
+        None if one never was) and 'refreshing' (whether a refresh is queued
+        or running)
+    """
+    config = current_app.config
+    now = datetime.utcnow()
+    fresh_after = now - timedelta(seconds=config['PLAID_BALANCE_TTL_SECONDS'])
+
+    # Freshness and claims must come from the primary even in replica-routed views
+    with primary():
+        rows = db.session.execute(
+            select(PlaidItem.id, PlaidItem.balances_refreshed_at, PlaidItem.balances_claimed_at)
+            .where(
+                PlaidItem.user_id == user_id,
+                or_(
+                    PlaidItem.error_state.is_(None),
+                    and_(PlaidItem.error_state == 'backoff', PlaidItem.retry_after <= now)
+                )
+            )
+        ).all()
+
+        refreshing = False
+        for item_id, refreshed_at, claimed_at in rows:
+            if refreshed_at and refreshed_at > fresh_after:
+                continue
+            if config['PLAID_BALANCE_REFRESH_ENABLED'] and _claim(item_id, now, fresh_after):
+                balance_refresher.enqueue(item_id)
+                refreshing = True
+            elif claimed_at:
+                refreshing = True
+
+    refreshed = [refreshed_at for _, refreshed_at, _ in rows]
+    return {
+        'as_of': None if not refreshed or None in refreshed else min(refreshed),
+        'refreshing': refreshing
+    }
+
+
+balance_refresher = BalanceRefresher()
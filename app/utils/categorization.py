@@ -0,0 +1,413 @@
+"""User categorization rules
+
+A rule says "transactions whose merchant contains X, with an amount between
+A and B, on account C get category Y"; any of the three conditions may be
+left out, but not all of them. When several rules match, the one with the
+lowest position (then the oldest) wins. The result goes to
+transactions.rule_category_id, which reads prefer over Plaid's category_id,
+so Plaid's own categorization is kept and deleting a rule restores it.
+
+Checking every rule against every row would cost rules x rows per page.
+Instead each user's rules are compiled into a Matcher:
+
+- merchant substrings go into one Aho-Corasick automaton, which finds every
+  rule whose text occurs in a merchant name in a single pass over it
+  (pyahocorasick's C automaton when installed, a pure-Python one otherwise)
+- amount-only rules are kept sorted by lower bound, so a bisect finds the
+  ones that can contain an amount
+- account-only rules are looked up by account id
+
+and only the few candidates those return are checked in full. Matchers are
+cached per process and keyed by users.rules_version, which every rule edit
+bumps, so an edit in one worker invalidates the matchers of all of them.
+
+Ingest applies the matcher to each page (apply()). After an edit, the
+routes re-evaluate the dashboards' recent window right away
+(reapply_recent()), and the sync scheduler picks up users whose history is
+behind their rules: reapply() re-evaluates the whole history in batches,
+updating only rows whose category changes. By hand:
+
+    flask rules reapply
+"""
+import bisect
+import logging
+from collections import OrderedDict, deque
+
+import click
+from flask import current_app
+from sqlalchemy import select, update, bindparam
+
+from app.models import db, User, BankAccount, CategoryRule, Transaction
+from app.utils import data_version, dictionary
+from app.utils.partitions import transaction_tables
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+# Users whose compiled matcher is kept per process
+MATCHER_CACHE_SIZE = 1000
+
+_matchers = OrderedDict()  # user id -> (rules_version, Matcher or None)
+
+
+class _Automaton:
+    """Aho-Corasick automaton over lowercase patterns, in pure Python"""
+
+    def __init__(self, patterns):
+        goto = [{}]
+        fail = [0]
+        outputs = [[]]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                following = goto[state].get(char)
+                if following is None:
+                    following = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    outputs.append([])
+                    goto[state][char] = following
+                state = following
+            outputs[state].append(index)
+
+        # Breadth first, so a state's fallback is complete before it is used
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in goto[state].items():
+                queue.append(following)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[following] = goto[fallback].get(char, 0)
+                outputs[following] += outputs[fail[following]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(output) for output in outputs]
+
+    def matches(self, text):
+        """Indices of the patterns that occur in text"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class _NativeAutomaton:
+    """The same automaton built with pyahocorasick"""
+
+    def __init__(self, patterns):
+        indices = {}
+        for index, pattern in enumerate(patterns):
+            indices.setdefault(pattern, []).append(index)
+        self._automaton = ahocorasick.Automaton()
+        for pattern, pattern_indices in indices.items():
+            self._automaton.add_word(pattern, tuple(pattern_indices))
+        self._automaton.make_automaton()
+
+    def matches(self, text):
+        found = set()
+        for _, pattern_indices in self._automaton.iter(text):
+            found.update(pattern_indices)
+        return found
+
+
+def build_automaton(patterns):
+    """Aho-Corasick automaton over lowercase patterns; matches(text) returns pattern indices"""
+    if ahocorasick is not None:
+        return _NativeAutomaton(patterns)
+    return _Automaton(patterns)
+
+
+class Matcher:
+    """One user's rules, compiled"""
+
+    def __init__(self, rules):
+        # In precedence order: a lower index wins
+        self.rules = list(rules)
+        patterns = []
+        self._pattern_rules = []
+        ranged = []
+        self._by_account = {}
+        for index, rule in enumerate(self.rules):
+            if rule.merchant_contains:
+                patterns.append(rule.merchant_contains.lower())
+                self._pattern_rules.append(index)
+            elif rule.min_amount is not None or rule.max_amount is not None:
+                low = rule.min_amount if rule.min_amount is not None else float('-inf')
+                ranged.append((low, index))
+            elif rule.account_id is not None:
+                self._by_account.setdefault(rule.account_id, []).append(index)
+        self._automaton = build_automaton(patterns) if patterns else None
+        ranged.sort()
+        self._range_starts = [low for low, _ in ranged]
+        self._ranged = [index for _, index in ranged]
+
+    def category_for(self, text, amount, account_id):
+        """Category id the rules give a transaction, or None when none matches"""
+        candidates = set()
+        if self._automaton is not None and text:
+            candidates.update(self._pattern_rules[i] for i in self._automaton.matches(text.lower()))
+        if self._ranged:
+            candidates.update(self._ranged[:bisect.bisect_right(self._range_starts, amount)])
+        if self._by_account:
+            candidates.update(self._by_account.get(account_id, ()))
+        for index in sorted(candidates):
+            rule = self.rules[index]
+            if rule.min_amount is not None and amount < rule.min_amount:
+                continue
+            if rule.max_amount is not None and amount > rule.max_amount:
+                continue
+            if rule.account_id is not None and account_id != rule.account_id:
+                continue
+            return rule.category_id
+        return None
+
+
+def _load_rules(user_id):
+    return db.session.execute(
+        select(CategoryRule.merchant_contains, CategoryRule.min_amount, CategoryRule.max_amount,
+               CategoryRule.account_id, CategoryRule.category_id)
+        .where(CategoryRule.user_id == user_id)
+        .order_by(CategoryRule.position, CategoryRule.id)
+    ).all()
+
+
+def matcher_for(user_id):
+    """The user's compiled rules (None when they have none), cached by rules_version"""
+    version = db.session.execute(select(User.rules_version).where(User.id == user_id)).scalar()
+    cached = _matchers.get(user_id)
+    if cached is not None and cached[0] == version:
+        _matchers.move_to_end(user_id)
+        return cached[1]
+    rules = _load_rules(user_id)
+    matcher = Matcher(rules) if rules else None
+    _matchers[user_id] = (version, matcher)
+    _matchers.move_to_end(user_id)
+    while len(_matchers) > MATCHER_CACHE_SIZE:
+        _matchers.popitem(last=False)
+    return matcher
+
+
+def invalidate(user_id):
+    """Mark the user's rules as changed (in the caller's transaction)"""
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(rules_version=User.rules_version + 1, updated_at=User.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    _matchers.pop(user_id, None)
+
+
+def apply(user_id, rows):
+    """Set rule_category_id on transaction row dicts from the user's rules"""
+    matcher = matcher_for(user_id)
+    for row in rows:
+        row['rule_category_id'] = matcher.category_for(
+            row['merchant_name'] or row['name'], row['amount'], row['account_id']
+        ) if matcher is not None else None
+    return rows
+
+
+def _changes(rows, matcher):
+    """Update params for the rows whose rule category differs from the matcher's"""
+    changes = []
+    for row in rows:
+        category_id = matcher.category_for(row.merchant_name or row.name, row.amount, row.account_id) \
+            if matcher is not None else None
+        if category_id != row.rule_category_id:
+            changes.append({'b_id': row.id, 'b_date': row.date, 'b_rule_category_id': category_id})
+    return changes
+
+
+def _write_changes(table, user_id, changes):
+    if not changes:
+        return
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('b_id'), table.c.date == bindparam('b_date'))
+        .values(rule_category_id=bindparam('b_rule_category_id')),
+        changes
+    )
+    data_version.bump(user_id)
+
+
+def _user_rows(table, user_id):
+    return (
+        select(table.c.id, table.c.date, table.c.name, table.c.merchant_name, table.c.amount,
+               table.c.account_id, table.c.rule_category_id)
+        .join(BankAccount, BankAccount.id == table.c.account_id)
+        .where(BankAccount.user_id == user_id)
+    )
+
+
+def _reapply_batch(table, user_id, matcher, after_id, batch_size):
+    """Re-evaluate up to batch_size of the user's rows above after_id; returns (rows, changed, last id)"""
+    rows = db.session.execute(
+        _user_rows(table, user_id).where(table.c.id > after_id).order_by(table.c.id).limit(batch_size)
+    ).all()
+    if not rows:
+        return 0, 0, after_id
+    changes = _changes(rows, matcher)
+    _write_changes(table, user_id, changes)
+    db.session.commit()
+    return len(rows), len(changes), rows[-1].id
+
+
+def reapply_recent(user_id, since):
+    """
+    Re-evaluate the user's rules on rows dated since a date, in one
+    transaction, so dashboards reflect a rule edit at once. The rest of the
+    history is left to reapply_pending().
+
+    Returns:
+        number of transactions whose category changed
+    """
+    table = Transaction.__table__
+    rows = db.session.execute(_user_rows(table, user_id).where(table.c.date >= since)).all()
+    changes = _changes(rows, matcher_for(user_id))
+    _write_changes(table, user_id, changes)
+    db.session.commit()
+    return len(changes)
+
+
+def reapply(user_id, batch_size=None):
+    """
+    Re-evaluate the user's rules across their whole history, batch_size rows
+    per transaction
+
+    Returns:
+        number of transactions whose category changed
+    """
+    batch_size = batch_size or current_app.config['CATEGORY_RULES_BATCH_SIZE']
+    version = db.session.execute(select(User.rules_version).where(User.id == user_id)).scalar()
+    matcher = matcher_for(user_id)
+    changed = 0
+    for table in transaction_tables():
+        after_id = 0
+        while True:
+            count, batch_changed, after_id = _reapply_batch(table, user_id, matcher, after_id, batch_size)
+            if not count:
+                break
+            changed += batch_changed
+    # A newer edit made meanwhile stays pending for the next run
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.rules_applied_version < version)
+        .values(rules_applied_version=version, updated_at=User.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return changed
+
+
+def reapply_pending():
+    """Scheduler chore: re-apply rules for users whose history is behind their rules"""
+    user_ids = db.session.execute(
+        select(User.id).where(User.rules_applied_version != User.rules_version)
+    ).scalars().all()
+    for user_id in user_ids:
+        changed = reapply(user_id)
+        logger.info(f"Re-applied categorization rules for user {user_id}: {changed} transactions changed")
+    return len(user_ids)
+
+
+def _parse_amount(data, key):
+    value = data.get(key)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be a number')
+
+
+def save_rule(user_id, data, rule=None):
+    """
+    Create a rule, or update one, from request data
+
+    Args:
+        user_id: Owner of the rule
+        data: dict with 'category' and any of 'merchant_contains',
+            'min_amount', 'max_amount', 'account_id' and 'position'
+        rule: Existing CategoryRule to update
+
+    Returns:
+        dict with 'success' and 'rule', or 'error'
+    """
+    category = (data.get('category') or '').strip()
+    merchant_contains = (data.get('merchant_contains') or '').strip() or None
+    account_id = data.get('account_id') or None
+    try:
+        min_amount = _parse_amount(data, 'min_amount')
+        max_amount = _parse_amount(data, 'max_amount')
+        position = int(data.get('position') or 0)
+        account_id = int(account_id) if account_id is not None else None
+    except (TypeError, ValueError) as e:
+        return {'success': False, 'error': str(e)}
+
+    if not category or len(category) > CategoryRule.category.type.length:
+        return {'success': False, 'error': 'category is required (up to 100 characters)'}
+    if merchant_contains and len(merchant_contains) > CategoryRule.merchant_contains.type.length:
+        return {'success': False, 'error': 'merchant_contains is too long (up to 200 characters)'}
+    if merchant_contains is None and min_amount is None and max_amount is None and account_id is None:
+        return {'success': False, 'error': 'A rule needs merchant_contains, an amount range or account_id'}
+    if min_amount is not None and max_amount is not None and min_amount > max_amount:
+        return {'success': False, 'error': 'min_amount is above max_amount'}
+    if account_id is not None and db.session.execute(
+        select(BankAccount.id).where(BankAccount.id == account_id, BankAccount.user_id == user_id)
+    ).scalar() is None:
+        return {'success': False, 'error': 'Account not found'}
+
+    # A rule's category is a dictionary entry like Plaid's, with no detailed level
+    category_id = dictionary.categories.ids({(category, category, None)})[category]
+    if rule is None:
+        rule = CategoryRule(user_id=user_id)
+        db.session.add(rule)
+    rule.position = position
+    rule.merchant_contains = merchant_contains
+    rule.min_amount = min_amount
+    rule.max_amount = max_amount
+    rule.account_id = account_id
+    rule.category = category
+    rule.category_id = category_id
+    invalidate(user_id)
+    db.session.commit()
+    return {'success': True, 'rule': rule}
+
+
+def delete_rule(rule):
+    """Delete a rule; returns dict with 'success'"""
+    db.session.delete(rule)
+    invalidate(rule.user_id)
+    db.session.commit()
+    return {'success': True}
+
+
+def init_categorization(app):
+    """Register the `flask rules` commands"""
+
+    @app.cli.group('rules')
+    def rules_group():
+        """User categorization rules."""
+
+    @rules_group.command('reapply')
+    @click.option('--user-id', type=int, help='Re-apply one user\'s rules even if they are up to date.')
+    def reapply_command(user_id):
+        """Re-apply rules across history for users whose rules changed."""
+        if user_id is not None:
+            click.echo(f"{reapply(user_id)} transactions changed")
+        else:
+            click.echo(f"Re-applied rules for {reapply_pending()} users")
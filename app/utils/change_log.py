@@ -0,0 +1,395 @@
+"""Transaction change log (change data capture)
+
+Ingest writes one transaction_changes row per inserted, updated or deleted
+transaction, in the same database transaction as the change itself, so the
+log never disagrees with the transactions table. Each row carries the old
+and new amount, date and category, and a monotonic seq. Updates that leave
+all three alone (a name tidied up, pending turned posted) are not logged,
+except a move to another account (a relinked account's history merged into
+its successor), logged as an update under the new account.
+
+Downstream caches, rollups and exports read deltas with a Consumer, which
+stores its offset (the last seq it processed) in change_log_offsets:
+
+    consumer = Consumer('monthly-rollup')
+    consumer.process(lambda changes: apply_to_rollup(changes))
+
+The handler's own writes are committed together with the new offset, so a
+database-side consumer sees every change exactly once.
+
+On Postgres, seq values are handed out when rows are inserted but become
+visible when their transaction commits, which can be out of order. Writers
+therefore hold an advisory lock in shared mode from their first log insert
+until commit; they don't wait for each other. Readers take the same lock
+exclusively for a moment (committed_through()), which waits out the writers
+in flight, and only read up to the highest seq committed by then. Any later
+writer draws a higher seq, so an offset never passes a change that has yet
+to commit.
+
+compact() rewrites old segments that every consumer has passed into one net
+change per transaction, and purges old tombstones:
+
+    flask change-log status
+    flask change-log compact
+"""
+import logging
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, func, text, bindparam
+
+from app.models import db, BankAccount, Transaction, TransactionChange, ChangeLogOffset
+
+logger = logging.getLogger(__name__)
+
+# Postgres advisory lock key: shared by change-log writers until commit,
+# taken exclusively by readers to wait them out (see above)
+WRITE_LOCK_KEY = 0xCDC
+
+# Offset row that records how far compaction has got (not a consumer)
+COMPACTION_CURSOR = '_compaction'
+
+# Rows per IN (...) list when deleting compacted changes
+DELETE_CHUNK = 500
+
+
+def snapshot(plaid_transaction_ids):
+    """Current id, owner and tracked values of transactions, keyed by Plaid id"""
+    if not plaid_transaction_ids:
+        return {}
+    return {
+        row.plaid_transaction_id: row
+        for row in db.session.execute(
+            select(Transaction.plaid_transaction_id, Transaction.id, Transaction.account_id,
+                   BankAccount.user_id, Transaction.amount, Transaction.date, Transaction.primary_category)
+            .join(BankAccount, BankAccount.id == Transaction.account_id)
+            .where(Transaction.plaid_transaction_id.in_(plaid_transaction_ids))
+        )
+    }
+
+
+def record(changes):
+    """
+    Append changes to the log in the caller's transaction
+
+    Args:
+        changes: dicts with op, transaction_id, plaid_transaction_id,
+            user_id, account_id and whichever old_*/new_* values apply
+    """
+    if not changes:
+        return
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock_shared(:key)'), {'key': WRITE_LOCK_KEY})
+
+    now = datetime.utcnow()
+    columns = ('old_amount', 'new_amount', 'old_date', 'new_date', 'old_category', 'new_category')
+    db.session.execute(insert(TransactionChange.__table__), [
+        {**{column: None for column in columns}, **change, 'created_at': now}
+        for change in changes
+    ])
+
+
+def committed_through():
+    """
+    Highest seq with every change at or below it committed (or rolled back)
+
+    On SQLite writers are serialized by the database, so that is simply the
+    newest seq.
+    """
+    postgres = db.session.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        db.session.execute(text('SELECT pg_advisory_lock(:key)'), {'key': WRITE_LOCK_KEY})
+    try:
+        return db.session.execute(select(func.max(TransactionChange.seq))).scalar() or 0
+    finally:
+        if postgres:
+            db.session.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': WRITE_LOCK_KEY})
+
+
+def inserted(row):
+    """Change for a newly stored transaction (a Row with the snapshot() columns)"""
+    return {
+        'op': 'insert',
+        'transaction_id': row.id,
+        'plaid_transaction_id': row.plaid_transaction_id,
+        'user_id': row.user_id,
+        'account_id': row.account_id,
+        'new_amount': row.amount,
+        'new_date': row.date,
+        'new_category': row.primary_category,
+    }
+
+
+def updated(before, values):
+    """
+    Change from a snapshot() row to new column values, or None if the
+    amount, date and category are all unchanged
+    """
+    if (before.amount, before.date, before.primary_category) == \
+            (values['amount'], values['date'], values['primary_category']):
+        return None
+    return {
+        'op': 'update',
+        'transaction_id': before.id,
+        'plaid_transaction_id': before.plaid_transaction_id,
+        'user_id': before.user_id,
+        'account_id': before.account_id,
+        'old_amount': before.amount,
+        'new_amount': values['amount'],
+        'old_date': before.date,
+        'new_date': values['date'],
+        'old_category': before.primary_category,
+        'new_category': values['primary_category'],
+    }
+
+
+def moved(before, account_id):
+    """Change for a transaction moved to another account, values unchanged (a snapshot() row)"""
+    return {
+        'op': 'update',
+        'transaction_id': before.id,
+        'plaid_transaction_id': before.plaid_transaction_id,
+        'user_id': before.user_id,
+        'account_id': account_id,
+        'old_amount': before.amount,
+        'new_amount': before.amount,
+        'old_date': before.date,
+        'new_date': before.date,
+        'old_category': before.primary_category,
+        'new_category': before.primary_category,
+    }
+
+
+def deleted(before):
+    """Change for a removed transaction (its last snapshot() row)"""
+    return {
+        'op': 'delete',
+        'transaction_id': before.id,
+        'plaid_transaction_id': before.plaid_transaction_id,
+        'user_id': before.user_id,
+        'account_id': before.account_id,
+        'old_amount': before.amount,
+        'old_date': before.date,
+        'old_category': before.primary_category,
+    }
+
+
+def _offset(name):
+    return db.session.execute(
+        select(ChangeLogOffset.seq).where(ChangeLogOffset.consumer == name)
+    ).scalar() or 0
+
+
+def _store_offset(name, seq):
+    moved = db.session.execute(
+        update(ChangeLogOffset)
+        .where(ChangeLogOffset.consumer == name)
+        .values(seq=seq, updated_at=datetime.utcnow())
+    ).rowcount
+    if not moved:
+        db.session.execute(insert(ChangeLogOffset).values(consumer=name, seq=seq, updated_at=datetime.utcnow()))
+    db.session.commit()
+
+
+class Consumer:
+    """A named reader of the change log with a stored offset"""
+
+    def __init__(self, name, batch_size=500):
+        if name == COMPACTION_CURSOR:
+            raise ValueError(f'{name} is reserved')
+        self.name = name
+        self.batch_size = batch_size
+
+    @property
+    def offset(self):
+        """Last seq processed (0 for a consumer that has never committed)"""
+        return _offset(self.name)
+
+    def poll(self):
+        """The next batch of changes after the stored offset, oldest first"""
+        return db.session.execute(
+            select(TransactionChange)
+            .where(TransactionChange.seq > self.offset, TransactionChange.seq <= committed_through())
+            .order_by(TransactionChange.seq)
+            .limit(self.batch_size)
+        ).scalars().all()
+
+    def commit(self, seq):
+        """Store the offset; commits the session, including the caller's writes"""
+        _store_offset(self.name, seq)
+
+    def process(self, handler, max_batches=None):
+        """
+        Feed batches to handler(changes) until the log is drained
+
+        A batch whose handler raises is rolled back and the offset stays
+        put, so it is delivered again next time.
+
+        Returns:
+            Number of changes processed
+        """
+        processed = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            changes = self.poll()
+            if not changes:
+                break
+            try:
+                handler(changes)
+                self.commit(changes[-1].seq)
+            except Exception:
+                db.session.rollback()
+                raise
+            processed += len(changes)
+            batches += 1
+        return processed
+
+    def reset(self, seq=0):
+        """Move the offset, e.g. back to 0 to rebuild a cache from the log"""
+        self.commit(seq)
+
+    def drop(self):
+        """Forget the consumer so it no longer holds back compaction"""
+        db.session.execute(delete(ChangeLogOffset).where(ChangeLogOffset.consumer == self.name))
+        db.session.commit()
+
+
+def status():
+    """Log bounds, consumer offsets and compaction progress"""
+    first, last, count = db.session.execute(
+        select(func.min(TransactionChange.seq), func.max(TransactionChange.seq), func.count())
+    ).one()
+    offsets = dict(db.session.execute(select(ChangeLogOffset.consumer, ChangeLogOffset.seq)).all())
+    compacted = offsets.pop(COMPACTION_CURSOR, 0)
+    return {
+        'first_seq': first,
+        'last_seq': last,
+        'changes': count,
+        'compacted_through': compacted,
+        'consumers': {name: {'offset': seq, 'lag': (last or 0) - seq} for name, seq in offsets.items()},
+    }
+
+
+def _compaction_horizon():
+    """Highest seq that may be compacted: old enough, and passed by every consumer"""
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(seconds=config['CHANGE_LOG_COMPACT_AFTER_SECONDS'])
+    horizon = db.session.execute(
+        select(func.max(TransactionChange.seq)).where(TransactionChange.created_at < cutoff)
+    ).scalar() or 0
+    slowest = db.session.execute(
+        select(func.min(ChangeLogOffset.seq)).where(ChangeLogOffset.consumer != COMPACTION_CURSOR)
+    ).scalar()
+    if slowest is not None:
+        horizon = min(horizon, slowest)
+    return min(horizon, committed_through())
+
+
+def _compact_segment(start, end):
+    """Collapse each transaction's changes in (start, end] into one net change"""
+    changes = db.session.execute(
+        select(TransactionChange)
+        .where(TransactionChange.seq > start, TransactionChange.seq <= end)
+        .order_by(TransactionChange.seq)
+    ).scalars().all()
+
+    by_transaction = {}
+    for change in changes:
+        by_transaction.setdefault(change.plaid_transaction_id, []).append(change)
+
+    rewrites = []
+    dropped = []
+    for history in by_transaction.values():
+        if len(history) == 1:
+            continue
+        first, last = history[0], history[-1]
+        if first.op == 'insert' and last.op == 'delete':
+            # Came and went inside the segment: nothing left to tell
+            dropped.extend(change.seq for change in history)
+            continue
+        dropped.extend(change.seq for change in history[:-1])
+        rewrites.append({
+            'b_seq': last.seq,
+            'b_op': 'insert' if first.op == 'insert' else last.op,
+            'b_old_amount': first.old_amount,
+            'b_old_date': first.old_date,
+            'b_old_category': first.old_category,
+        })
+
+    if rewrites:
+        db.session.execute(
+            update(TransactionChange.__table__)
+            .where(TransactionChange.seq == bindparam('b_seq'))
+            .values(op=bindparam('b_op'), old_amount=bindparam('b_old_amount'),
+                    old_date=bindparam('b_old_date'), old_category=bindparam('b_old_category')),
+            rewrites
+        )
+    for i in range(0, len(dropped), DELETE_CHUNK):
+        db.session.execute(
+            delete(TransactionChange.__table__).where(TransactionChange.seq.in_(dropped[i:i + DELETE_CHUNK]))
+        )
+    return len(dropped)
+
+
+def compact():
+    """
+    Compact segments of CHANGE_LOG_SEGMENT_SIZE seqs that are older than
+    CHANGE_LOG_COMPACT_AFTER_SECONDS and behind every consumer, then drop
+    compacted tombstones older than CHANGE_LOG_RETENTION_SECONDS
+
+    Each segment is committed on its own, so compaction can be interrupted.
+
+    Returns:
+        dict with the seq compacted through, changes removed by compaction
+        and tombstones purged
+    """
+    config = current_app.config
+    segment_size = config['CHANGE_LOG_SEGMENT_SIZE']
+
+    start = _offset(COMPACTION_CURSOR)
+    horizon = _compaction_horizon()
+    removed = 0
+    # Only whole segments, so a segment is never compacted twice
+    while start + segment_size <= horizon:
+        end = start + segment_size
+        removed += _compact_segment(start, end)
+        _store_offset(COMPACTION_CURSOR, end)
+        logger.info(f"Compacted change log segment ({start}, {end}]")
+        start = end
+
+    cutoff = datetime.utcnow() - timedelta(seconds=config['CHANGE_LOG_RETENTION_SECONDS'])
+    purged = db.session.execute(
+        delete(TransactionChange.__table__).where(
+            TransactionChange.op == 'delete',
+            TransactionChange.seq <= start,
+            TransactionChange.created_at < cutoff
+        )
+    ).rowcount
+    db.session.commit()
+
+    return {'compacted_through': start, 'removed': removed, 'tombstones_purged': purged}
+
+
+def init_change_log(app):
+    """Register the `flask change-log` commands"""
+
+    @app.cli.group('change-log')
+    def change_log_group():
+        """Inspect and compact the transaction change log."""
+
+    @change_log_group.command('status')
+    def status_command():
+        """Show log bounds and consumer offsets."""
+        info = status()
+        click.echo(f"seq {info['first_seq']}..{info['last_seq']} ({info['changes']} changes), "
+                   f"compacted through {info['compacted_through']}")
+        for name, consumer in sorted(info['consumers'].items()):
+            click.echo(f"  {name}: offset {consumer['offset']}, lag {consumer['lag']}")
+
+    @change_log_group.command('compact')
+    def compact_command():
+        """Compact old segments every consumer has passed."""
+        result = compact()
+        click.echo(f"Compacted through seq {result['compacted_through']}: removed {result['removed']} "
+                   f"changes, purged {result['tombstones_purged']} tombstones")
@@ -0,0 +1,142 @@
+"""Response compression and ETags
+
+Text responses (JSON, NDJSON, HTML, CSS, JS, SVG) of at least
+COMPRESS_MIN_SIZE bytes are compressed with brotli or gzip, whichever the
+client's Accept-Encoding prefers; brotli only when the brotli package is
+installed. Streamed responses (NDJSON listings) are compressed chunk by
+chunk, flushed after each one so rows still reach the client as they are
+produced. Server-sent events are never compressed.
+
+JSON GET responses get a strong ETag, and a matching If-None-Match is
+answered with an empty 304. The ETag identifies the uncompressed body;
+compressed variants are different byte sequences, so they carry the tag
+with the coding appended ("<tag>-gzip", "<tag>-br"), and every variant of
+the current tag counts as a match. Views can set their own ETag (cheaper
+than hashing the body); it is treated the same way.
+"""
+import hashlib
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'text/javascript',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'image/svg+xml',
+}
+
+
+def negotiate(accept_encodings):
+    """Content coding to use for a request's Accept-Encoding: 'br', 'gzip' or None"""
+    candidates = [('br', accept_encodings['br'])] if brotli is not None else []
+    candidates.append(('gzip', accept_encodings['gzip']))
+    coding, quality = max(candidates, key=lambda candidate: candidate[1])
+    return coding if quality > 0 else None
+
+
+def variant_etag(etag, coding):
+    return f'{etag}-{coding}' if coding else etag
+
+
+def compress(data, coding, level):
+    if coding == 'br':
+        return brotli.compress(data, quality=level['br'])
+    # zlib writes the gzip header with mtime 0, so equal bodies compress equally
+    compressor = zlib.compressobj(level['gzip'], zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, coding, level):
+    """Compress an iterable of byte chunks, flushing after each chunk"""
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=level['br'])
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(level['gzip'], zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def matching_etag(etag):
+    """The variant of etag named by the request's If-None-Match, or None"""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    for coding in (None, 'gzip', 'br'):
+        variant = variant_etag(etag, coding)
+        if if_none_match.contains_weak(variant):
+            return variant
+    return None
+
+
+def init_compression(app):
+    """Register the after-request hook that adds ETags and compresses responses"""
+    config = app.config
+    if not config['RESPONSE_COMPRESSION']:
+        return
+    min_size = config['COMPRESS_MIN_SIZE']
+    level = {'gzip': config['COMPRESS_GZIP_LEVEL'], 'br': config['COMPRESS_BROTLI_QUALITY']}
+
+    @app.after_request
+    def encode_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough:
+            return response
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        coding = None if 'Content-Encoding' in response.headers else negotiate(request.accept_encodings)
+
+        if response.is_streamed:
+            if coding:
+                chunks = response.response
+                if hasattr(chunks, 'close'):
+                    response.call_on_close(chunks.close)
+                response.response = compress_stream(chunks, coding, level)
+                response.headers['Content-Encoding'] = coding
+                response.headers.pop('Content-Length', None)
+                etag, weak = response.get_etag()
+                if etag is not None:
+                    response.set_etag(variant_etag(etag, coding), weak)
+            return response
+
+        cacheable = request.method in ('GET', 'HEAD') and response.status_code == 200
+        etag, weak = response.get_etag()
+        if etag is None and cacheable and response.mimetype == 'application/json':
+            etag, weak = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest(), False
+            response.set_etag(etag)
+            if 'Cache-Control' not in response.headers:
+                # Per-user data: browsers may keep it, but must revalidate
+                response.headers['Cache-Control'] = 'private, no-cache'
+
+        if response.content_length is None or response.content_length < min_size:
+            coding = None
+
+        matched = matching_etag(etag) if etag is not None and cacheable else None
+        if matched:
+            response.status_code = 304
+            response.set_data(b'')
+            response.set_etag(matched, weak)
+            return response
+
+        if coding is None:
+            return response
+
+        response.set_data(compress(response.get_data(), coding, level))
+        response.headers['Content-Encoding'] = coding
+        if etag is not None:
+            response.set_etag(variant_etag(etag, coding), weak)
+        return response
@@ -0,0 +1,86 @@
+"""Per-user data version for conditional API responses
+
+users.data_version is bumped in the same transaction as every write that
+changes what /api/financials returns for a user: transactions ingested,
+modified or removed, accounts linked or removed, balances refreshed.
+
+Views decorated with @conditional() get a strong ETag derived from the
+version and the request (endpoint, query string, Accept, and today's UTC date,
+since overview and categories read ranges relative to today). A matching
+If-None-Match is answered with 304 before the view runs a single query:
+the version arrives with current_user, which Flask-Login has already
+loaded. A body is only read from a replica that has replayed the user's
+version; until then the view reads from the primary (see
+app/utils/db_routing.py), so a tag never stands for an older body.
+Compressed responses carry the tag with the coding appended (see
+app/utils/compression.py); any variant matches.
+"""
+import hashlib
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import update
+
+from app.models import db, User
+from app.utils.compression import matching_etag
+from app.utils.db_routing import require_data_version
+
+
+def bump(*user_ids):
+    """Invalidate the users' conditional responses (in the caller's transaction)"""
+    if not user_ids:
+        return
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        # Not a profile change, so updated_at stays as it was
+        .values(data_version=User.data_version + 1, updated_at=User.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def etag_for(user, window_seconds=None):
+    """ETag of the current request's response for a user at their current data version"""
+    parts = [
+        str(user.id),
+        str(user.data_version or 0),
+        request.endpoint,
+        repr(sorted(request.args.items(multi=True))),
+        request.headers.get('Accept', ''),
+        datetime.utcnow().date().isoformat(),
+    ]
+    if window_seconds:
+        parts.append(str(int(time.time() // window_seconds)))
+    return hashlib.blake2b('\0'.join(parts).encode(), digest_size=16).hexdigest()
+
+
+def conditional(window_config=None):
+    """
+    Serve a login-required GET view conditionally on the user's data version
+
+    window_config names a config value in seconds after which the ETag
+    changes even without new data, for views whose response also depends
+    on time (e.g. balances that refresh once stale).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            window = current_app.config[window_config] if window_config else None
+            etag = etag_for(current_user, window)
+            matched = matching_etag(etag)
+            if matched:
+                response = current_app.response_class(status=304)
+            else:
+                # The body must be at least as new as the version in its tag
+                require_data_version(current_user.id, current_user.data_version or 0)
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(matched or etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,160 @@
+"""Read-replica routing for the SQLAlchemy session
+
+Views decorated with @read_replica send their SELECTs to the 'replica' bind
+when one is configured. Everything else - flushes, PlaidService ingest, any
+request from a user who wrote recently, and conditional responses the replica
+hasn't caught up with yet - stays on the primary.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, select, text
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+LAST_WRITE_KEY = '_db_last_write'
+
+_lag_lock = threading.Lock()
+_lag_state = {'checked_at': 0.0, 'lag': 0.0}
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica when the current request allows it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _replica_selected():
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(db_session, flush_context):
+    """Remember when this browser session last wrote, for read-your-writes"""
+    if has_request_context():
+        session[LAST_WRITE_KEY] = time.time()
+
+
+def _replica_selected():
+    return has_app_context() and g.get('db_route') == REPLICA_BIND
+
+
+def replica_lag():
+    """
+    Seconds the replica is behind the primary, cached per process.
+
+    Returns infinity if the replica cannot be reached, so callers fall back to
+    the primary instead of erroring.
+    """
+    now = time.monotonic()
+    interval = current_app.config['DB_REPLICA_LAG_CHECK_INTERVAL']
+    if now - _lag_state['checked_at'] < interval:
+        return _lag_state['lag']
+
+    with _lag_lock:
+        if now - _lag_state['checked_at'] < interval:
+            return _lag_state['lag']
+
+        from app.models import db
+        engine = db.engines[REPLICA_BIND]
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    lag = conn.execute(text(
+                        "SELECT CASE WHEN NOT pg_is_in_recovery() "
+                        "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                    )).scalar() or 0.0
+                else:
+                    conn.execute(text('SELECT 1'))
+                    lag = 0.0
+        except Exception as e:
+            logger.warning(f"Replica unavailable, reading from primary: {e}")
+            lag = float('inf')
+
+        _lag_state.update(checked_at=now, lag=float(lag))
+        return _lag_state['lag']
+
+
+def choose_route():
+    """Decide whether the current request can read from the replica"""
+    from app.models import db
+    if REPLICA_BIND not in db.engines:
+        return None
+
+    lag = replica_lag()
+    if lag > current_app.config['DB_REPLICA_MAX_LAG']:
+        return None
+
+    # Read-your-writes: a user who just synced or edited something must not
+    # see the replica's older snapshot
+    last_write = session.get(LAST_WRITE_KEY)
+    if last_write and time.time() - last_write < lag + current_app.config['DB_READ_YOUR_WRITES_WINDOW']:
+        return None
+
+    # A response tagged with the user's data version (see
+    # app/utils/data_version.conditional) must be built from a replica that
+    # has replayed that version, or the tag would cache an older body
+    required = g.get('required_data_version')
+    if required and _replica_data_version(required[0]) < required[1]:
+        return None
+
+    return REPLICA_BIND
+
+
+def require_data_version(user_id, version):
+    """Keep the current request off a replica that hasn't reached a user's data version"""
+    g.required_data_version = (user_id, version)
+
+
+def _replica_data_version(user_id):
+    from app.models import db, User
+    return db.session.execute(
+        select(User.data_version).where(User.id == user_id),
+        bind_arguments={'bind': db.engines[REPLICA_BIND]}
+    ).scalar() or 0
+
+
+def read_replica(view):
+    """Route a read-only view's queries to the replica when it is fresh enough"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_route = choose_route()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Force queries inside the block onto the primary"""
+    previous = g.get('db_route') if has_app_context() else None
+    if has_app_context():
+        g.db_route = None
+    try:
+        yield
+    finally:
+        if has_app_context():
+            g.db_route = previous
+
+
+def on_primary(func):
+    """Decorator form of primary() for write paths such as PlaidService ingest"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with primary():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def init_replica_schema(db):
+    """Create tables on a SQLite replica stand-in; real replicas get them via replication"""
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is not None and engine.dialect.name == 'sqlite':
+        db.metadata.create_all(bind=engine)
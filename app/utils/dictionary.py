@@ -0,0 +1,294 @@
+"""Merchant and category dictionaries
+
+Transactions repeat their merchant name and category path as strings on
+every row. The merchants and categories tables hold each distinct value
+once, and transactions reference them by merchant_id and category_id, so
+aggregates group on small integers instead of comparing strings (see
+FinancialSnapshot). The string columns stay for listing and search.
+
+Ingest encodes rows with encode(). Ids come from a per-process cache;
+values it hasn't seen are looked up, and inserted when new, with one
+statement per dictionary for the whole page. An id read or inserted inside
+a transaction that also inserted into the dictionary is cached only once
+that transaction commits, so a rollback never leaves the cache holding an
+id the database doesn't have.
+
+Transactions stored before the dictionaries existed are encoded by
+backfill(), a batch at a time, each batch in its own short transaction.
+The sync scheduler runs it until none are left:
+
+    flask dictionary status
+    flask dictionary backfill
+"""
+import logging
+
+import click
+from flask import current_app
+from sqlalchemy import event, select, insert, update, func, bindparam, or_, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import db, BankAccount, Merchant, Category
+from app.utils import data_version
+from app.utils.db_routing import RoutingSession
+from app.utils.partitions import transaction_tables
+
+logger = logging.getLogger(__name__)
+
+# Values per IN (...) list when looking up dictionary entries
+LOOKUP_CHUNK = 500
+
+# Batches backfilled per scheduler run
+BACKFILL_BATCHES_PER_RUN = 20
+
+# session.info key: {table name: {key: (id, values)}} read or inserted by the
+# session's current transaction, cached when it commits
+PENDING_KEY = 'dictionary_pending'
+
+_backfill_state = {'complete': False, 'after_id': {}}
+
+
+class Dictionary:
+    """One dictionary table and its process-wide cache of ids"""
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.table = model.__table__
+        # Order of value tuples; the first column is the unique key
+        self.columns = columns
+        self._ids = {}  # key -> id
+        self._values = {}  # id -> value tuple
+
+    def ids(self, values):
+        """
+        Ids of value tuples (ordered as columns), inserting the ones the
+        table doesn't have yet
+
+        Returns:
+            dict of key -> id
+        """
+        values = {value[0]: value for value in values}
+        pending = self._pending()
+        found = {}
+        for key in values:
+            if key in self._ids:
+                found[key] = self._ids[key]
+            elif key in pending:
+                found[key] = pending[key][0]
+        missing = [key for key in values if key not in found]
+        if not missing:
+            return found
+
+        found.update(self._lookup(self.table.c[self.columns[0]], missing))
+        new = [values[key] for key in missing if key not in found]
+        if new:
+            self._insert(new)
+            # Concurrent ingest may have inserted some of them first
+            inserted = self._lookup(self.table.c[self.columns[0]], [value[0] for value in new], pending=True)
+            found.update(inserted)
+        return found
+
+    def values(self, ids):
+        """Value tuples of dictionary ids, as a dict of id -> tuple"""
+        found = {id_: self._values[id_] for id_ in ids if id_ in self._values}
+        missing = [id_ for id_ in ids if id_ is not None and id_ not in found]
+        if missing:
+            pending = {entry[0]: entry[1] for entry in self._pending().values()}
+            found.update({id_: pending[id_] for id_ in missing if id_ in pending})
+            missing = [id_ for id_ in missing if id_ not in found]
+        if missing:
+            rows = self._select(self.table.c.id, missing)
+            self._remember(rows)
+            found.update({row[0]: tuple(row[1:]) for row in rows})
+        return found
+
+    def _select(self, column, keys):
+        columns = [self.table.c.id] + [self.table.c[name] for name in self.columns]
+        rows = []
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            rows += db.session.execute(
+                select(*columns).where(column.in_(keys[start:start + LOOKUP_CHUNK]))
+            ).all()
+        return rows
+
+    def _lookup(self, column, keys, pending=False):
+        rows = self._select(column, keys)
+        self._remember(rows, pending)
+        return {row[1]: row[0] for row in rows}
+
+    def _insert(self, values):
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            stmt = (pg_insert if dialect == 'postgresql' else sqlite_insert)(self.table)
+            stmt = stmt.on_conflict_do_nothing(index_elements=[self.columns[0]])
+        else:
+            stmt = insert(self.table)
+        db.session.execute(stmt, [dict(zip(self.columns, value)) for value in values])
+        db.session.info.setdefault(PENDING_KEY, {}).setdefault(self.table.name, {})
+
+    def _pending(self):
+        return db.session.info.get(PENDING_KEY, {}).get(self.table.name, {})
+
+    def _remember(self, rows, pending=False):
+        """Cache rows now, or at commit when this transaction inserted into the table"""
+        pending_entries = db.session.info.get(PENDING_KEY, {}).get(self.table.name)
+        if pending or pending_entries is not None:
+            pending_entries = db.session.info.setdefault(PENDING_KEY, {}).setdefault(self.table.name, {})
+            pending_entries.update({row[1]: (row[0], tuple(row[1:])) for row in rows})
+            return
+        self.cache([(row[1], row[0], tuple(row[1:])) for row in rows])
+
+    def cache(self, entries):
+        """Add (key, id, values) entries, starting over once DICTIONARY_CACHE_SIZE is reached"""
+        if len(self._ids) + len(entries) > current_app.config['DICTIONARY_CACHE_SIZE']:
+            self._ids.clear()
+            self._values.clear()
+        for key, id_, value in entries:
+            self._ids[key] = id_
+            self._values[id_] = value
+
+
+merchants = Dictionary(Merchant, ('name',))
+categories = Dictionary(Category, ('name', 'primary_category', 'detailed_category'))
+
+DICTIONARIES = {dictionary.table.name: dictionary for dictionary in (merchants, categories)}
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _cache_committed(session):
+    for name, entries in session.info.pop(PENDING_KEY, {}).items():
+        DICTIONARIES[name].cache([(key, id_, value) for key, (id_, value) in entries.items()])
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _discard_uncommitted(session, transaction):
+    # Rolled back or closed without committing (a commit popped them already)
+    if transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
+
+
+def encode(rows):
+    """Set merchant_id and category_id on transaction row dicts from their values"""
+    merchant_ids = merchants.ids({(row['merchant_name'],) for row in rows if row['merchant_name']})
+    category_ids = categories.ids({
+        (row['category'], row['primary_category'], row['detailed_category'])
+        for row in rows if row['category']
+    })
+    for row in rows:
+        row['merchant_id'] = merchant_ids.get(row['merchant_name'])
+        row['category_id'] = category_ids.get(row['category'])
+    return rows
+
+
+def primary_categories(category_ids):
+    """Primary category name of each category id"""
+    return {id_: value[1] for id_, value in categories.values(list(category_ids)).items()}
+
+
+def _unencoded(table):
+    return or_(
+        and_(table.c.merchant_name.is_not(None), table.c.merchant_id.is_(None)),
+        and_(table.c.category.is_not(None), table.c.category_id.is_(None)),
+    )
+
+
+def _backfill_batch(table, after_id, batch_size):
+    """Encode up to batch_size rows of table with ids above after_id; returns (count, last id)"""
+    rows = db.session.execute(
+        select(table.c.id, table.c.date, table.c.merchant_name, table.c.category,
+               table.c.primary_category, table.c.detailed_category, BankAccount.user_id)
+        .join(BankAccount, BankAccount.id == table.c.account_id)
+        .where(table.c.id > after_id, _unencoded(table))
+        .order_by(table.c.id)
+        .limit(batch_size)
+    ).mappings().all()
+    if not rows:
+        return 0, after_id
+    encoded = encode([dict(row) for row in rows])
+    # date is the partition key: it lets Postgres go straight to the right partition
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('b_id'), table.c.date == bindparam('b_date'))
+        .values(merchant_id=bindparam('b_merchant_id'), category_id=bindparam('b_category_id')),
+        [{'b_id': row['id'], 'b_date': row['date'], 'b_merchant_id': row['merchant_id'],
+          'b_category_id': row['category_id']} for row in encoded]
+    )
+    # Cached responses were built from the unencoded values
+    data_version.bump(*{row['user_id'] for row in rows})
+    db.session.commit()
+    return len(rows), rows[-1]['id']
+
+
+def backfill(batch_size=None, max_batches=None):
+    """
+    Encode transactions stored without dictionary ids, batch_size at a time
+
+    Stops after max_batches batches when given; the next call carries on
+    where this one stopped.
+
+    Returns:
+        number of transactions encoded
+    """
+    batch_size = batch_size or current_app.config['DICTIONARY_BACKFILL_BATCH_SIZE']
+    encoded = 0
+    batches = 0
+    for table in transaction_tables():
+        after_id = _backfill_state['after_id'].get(table.name, 0)
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                return encoded
+            count, after_id = _backfill_batch(table, after_id, batch_size)
+            _backfill_state['after_id'][table.name] = after_id
+            if not count:
+                break
+            encoded += count
+            batches += 1
+    if not encoded:
+        _backfill_state['complete'] = True
+    return encoded
+
+
+def backfill_pending():
+    """Scheduler chore: backfill a few batches until nothing is left to encode"""
+    if _backfill_state['complete']:
+        return 0
+    encoded = backfill(max_batches=BACKFILL_BATCHES_PER_RUN)
+    if encoded:
+        logger.info(f"Encoded {encoded} transactions with dictionary ids")
+    return encoded
+
+
+def status():
+    """Dictionary sizes and transactions still to encode"""
+    counts = {
+        'merchants': db.session.execute(select(func.count()).select_from(Merchant)).scalar(),
+        'categories': db.session.execute(select(func.count()).select_from(Category)).scalar(),
+        'unencoded': 0,
+    }
+    for table in transaction_tables():
+        counts['unencoded'] += db.session.execute(
+            select(func.count()).select_from(table).where(_unencoded(table))
+        ).scalar()
+    return counts
+
+
+def init_dictionary(app):
+    """Register the `flask dictionary` commands"""
+
+    @app.cli.group('dictionary')
+    def dictionary_group():
+        """Merchant and category dictionaries."""
+
+    @dictionary_group.command('status')
+    def status_command():
+        """Count dictionary entries and transactions not yet encoded."""
+        info = status()
+        click.echo(f"{info['merchants']} merchants, {info['categories']} categories, "
+                   f"{info['unencoded']} transactions to encode")
+
+    @dictionary_group.command('backfill')
+    @click.option('--batch-size', type=int, help='Override DICTIONARY_BACKFILL_BATCH_SIZE.')
+    def backfill_command(batch_size):
+        """Encode transactions stored before the dictionaries existed."""
+        _backfill_state['after_id'].clear()
+        click.echo(f"Encoded {backfill(batch_size)} transactions")
@@ -1,7 +1,12 @@
 """Email sending utility using Brevo (SendinBlue) for transactional emails."""
+from datetime import datetime, timedelta
+
 import sib_api_v3_sdk
 from flask import current_app
 
+from app.models import db, OutboundEmail
+from app.utils.resilience import guarded, is_dependency_failure, CircuitOpen, DependencyUnavailable
+
 
 def send_verification_email(user_email, verification_code):
     """
@@ -34,35 +39,7 @@ def send_verification_email(user_email, verification_code):
     </html>
     """
     
-    try:
-        configuration = sib_api_v3_sdk.Configuration()
-        configuration.api_key['api-key'] = current_app.config['BREVO_API_KEY']
-        
-        api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
-            sib_api_v3_sdk.ApiClient(configuration)
-        )
-        
-        sender = {
-            "name": current_app.config['SENDER_NAME'],
-            "email": current_app.config['SENDER_EMAIL']
-        }
-        
-        to = [{"email": user_email}]
-        
-        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-            to=to,
-            html_content=html_content,
-            sender=sender,
-            subject=subject
-        )
-        
-        api_instance.send_transac_email(send_smtp_email)
-        print(f"✅ Verification email sent via Brevo to {user_email}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to send email via Brevo: {str(e)}")
-        return False
+    return _send_email(user_email, subject, html_content, "Verification email")
 
 
 def send_mfa_enabled_notification(user_email, phone_number):
@@ -95,32 +72,108 @@ def send_mfa_enabled_notification(user_email, phone_number):
     </html>
     """
     
+    return _send_email(user_email, subject, html_content, "MFA notification email")
+
+
+def _deliver(to_email, subject, html_content):
+    """Send one email through Brevo under the circuit breaker; raises on failure"""
+    configuration = sib_api_v3_sdk.Configuration()
+    configuration.api_key['api-key'] = current_app.config['BREVO_API_KEY']
+    
+    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
+        sib_api_v3_sdk.ApiClient(configuration)
+    )
+    
+    sender = {
+        "name": current_app.config['SENDER_NAME'],
+        "email": current_app.config['SENDER_EMAIL']
+    }
+    
+    to = [{"email": to_email}]
+    
+    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
+        to=to,
+        html_content=html_content,
+        sender=sender,
+        subject=subject
+    )
+    
+    with guarded('brevo', 'send_transac_email') as timeout:
+        api_instance.send_transac_email(send_smtp_email, _request_timeout=timeout)
+
+
+def _send_email(to_email, subject, html_content, label):
+    """
+    Send now, or queue for later delivery if Brevo is down or slow.
+    
+    Returns:
+        bool: True if the email was sent or queued
+    """
     try:
-        configuration = sib_api_v3_sdk.Configuration()
-        configuration.api_key['api-key'] = current_app.config['BREVO_API_KEY']
-        
-        api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
-            sib_api_v3_sdk.ApiClient(configuration)
-        )
-        
-        sender = {
-            "name": current_app.config['SENDER_NAME'],
-            "email": current_app.config['SENDER_EMAIL']
-        }
-        
-        to = [{"email": user_email}]
-        
-        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-            to=to,
-            html_content=html_content,
-            sender=sender,
-            subject=subject
-        )
-        
-        api_instance.send_transac_email(send_smtp_email)
-        print(f"✅ MFA notification email sent to {user_email}")
+        _deliver(to_email, subject, html_content)
+        print(f"✅ {label} sent via Brevo to {to_email}")
         return True
         
     except Exception as e:
-        print(f"❌ Failed to send MFA notification: {str(e)}")
-        return False
+        if not (isinstance(e, DependencyUnavailable) or is_dependency_failure(e)):
+            print(f"❌ Failed to send email via Brevo: {str(e)}")
+            return False
+        
+        db.session.add(OutboundEmail(to_email=to_email, subject=subject, html_content=html_content,
+                                     last_error=str(e)[:1000]))
+        db.session.commit()
+        print(f"📨 Brevo unavailable ({str(e)[:100]}) - {label} to {to_email} queued for retry")
+        return True
+
+
+def deliver_queued_emails(limit=50):
+    """
+    Retry queued emails that are due, oldest first.
+    
+    Stops early while Brevo's breaker is open. An email is given up on after
+    EMAIL_OUTBOX_MAX_ATTEMPTS attempts.
+    
+    Returns:
+        int: Number of emails sent
+    """
+    config = current_app.config
+    now = datetime.utcnow()
+    due = OutboundEmail.query.filter(
+        OutboundEmail.status == 'pending',
+        OutboundEmail.next_attempt_at <= now
+    ).order_by(OutboundEmail.id).limit(limit).all()
+    
+    sent = 0
+    for email in due:
+        try:
+            _deliver(email.to_email, email.subject, email.html_content)
+            email.status = 'sent'
+            email.sent_at = datetime.utcnow()
+            sent += 1
+        except CircuitOpen:
+            break
+        except Exception as e:
+            email.attempts += 1
+            email.last_error = str(e)[:1000]
+            if email.attempts >= config['EMAIL_OUTBOX_MAX_ATTEMPTS']:
+                email.status = 'failed'
+                print(f"❌ Giving up on queued email to {email.to_email}: {str(e)}")
+            else:
+                email.next_attempt_at = datetime.utcnow() + timedelta(
+                    seconds=config['EMAIL_OUTBOX_RETRY_SECONDS'] * 2 ** (email.attempts - 1)
+                )
+        db.session.commit()
+    
+    if sent:
+        print(f"✅ Delivered {sent} queued email(s) via Brevo")
+    return sent
+
+
+def init_email_outbox(app):
+    """Register the `flask email-outbox` command"""
+    
+    @app.cli.command('email-outbox')
+    def email_outbox_command():
+        """Deliver emails queued while Brevo was unavailable."""
+        db.create_all()
+        deliver_queued_emails(limit=1000)
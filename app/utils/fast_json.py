@@ -0,0 +1,106 @@
+"""Fast JSON responses for row-heavy endpoints
+
+jsonify() runs the stdlib encoder over dicts that views usually build from
+ORM objects, which means hydrating every column of every row into the
+identity map first. Listing endpoints instead select just the columns they
+return, as plain rows, and answer with json_response(). It encodes with
+orjson (pinned in requirements.txt), or msgspec when only that is installed;
+both write dates as ISO 8601 natively, in C. Without either it falls back to
+the stdlib encoder, so the output is the same either way.
+
+Large lists can also go out as NDJSON (one JSON object per line) with
+ndjson_response(), streamed from a server-side cursor so neither the rows
+nor the body are ever held in memory whole.
+
+FastJSONProvider puts orjson behind jsonify() for every other view, with
+Flask's own conventions kept (sorted keys, RFC 822 dates).
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    ENCODER = 'orjson'
+
+    def dumps(obj):
+        """Encode obj as UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default)
+elif msgspec is not None:
+    ENCODER = 'msgspec'
+    _encoder = msgspec.json.Encoder(enc_hook=_default, decimal_format='number')
+
+    def dumps(obj):
+        """Encode obj as UTF-8 JSON bytes"""
+        return _encoder.encode(obj)
+else:
+    ENCODER = 'json'
+
+    def dumps(obj):
+        """Encode obj as UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, separators=(',', ':')).encode()
+
+
+def records(keys, rows):
+    """Dicts from result rows, keyed by keys in column order"""
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def json_response(payload, status=200):
+    """Response with payload encoded by dumps(), like jsonify() but faster"""
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
+
+
+def ndjson_response(keys, rows, headers=None, batch_size=500):
+    """
+    Streamed application/x-ndjson response with one object per row
+
+    rows is iterated while the body is sent, so pass a result executed with
+    yield_per to keep memory flat. Lines are written batch_size at a time.
+    """
+    def generate():
+        lines = []
+        for row in rows:
+            lines.append(dumps(dict(zip(keys, row))))
+            if len(lines) >= batch_size:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson',
+                                      headers=headers)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with orjson doing the compact encoding when installed"""
+
+    def dumps(self, obj, **kwargs):
+        # Pretty-printing (debug mode) and custom encoders stay with the stdlib
+        if orjson is None or set(kwargs) - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
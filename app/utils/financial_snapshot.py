@@ -0,0 +1,252 @@
+"""One user's financial data, read once per request
+
+The overview, accounts and categories endpoints, the batch endpoint and the
+dashboard page all describe the same few things: the active accounts, and
+the transactions of the last 30 days. FinancialSnapshot reads each of them
+at most once, lazily (a column-pruned SELECT of plain rows), and derives
+every figure from those rows in a single pass, so a page that needs totals,
+recent transactions and category spend costs two queries however many
+sections it asks for. Spend is summed per category id (the user's rule
+category when one applies, see app/utils/categorization.py, otherwise
+Plaid's; see app/utils/dictionary.py) and only the few distinct ids are
+turned into names. Transfers between the user's own accounts are listed but
+count as neither income nor spending (see app/utils/transfers.py).
+
+Sections are built by name with section(), in the JSON shapes the
+/api/financials endpoints return:
+
+    snapshot = FinancialSnapshot(current_user.id)
+    snapshot.section('cash_flow')
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import cached_property
+
+from sqlalchemy import select, func
+
+from app.models import db, BankAccount, Transaction
+from app.utils.balances import revalidate
+from app.utils.dictionary import primary_categories
+
+# Days covered by recent transactions, cash flow and category spend
+WINDOW_DAYS = 30
+
+# Recent transactions listed on the overview and dashboard
+RECENT_LIMIT = 10
+
+# A recent transaction, with its category resolved from category_id
+RecentTransaction = namedtuple('RecentTransaction', 'id name merchant_name amount date primary_category')
+
+
+class FinancialSnapshot:
+    """Lazily loaded accounts and recent transactions of one user"""
+
+    def __init__(self, user_id, today=None):
+        self.user_id = user_id
+        self.today = today or datetime.utcnow().date()
+        self.window_start = self.today - timedelta(days=WINDOW_DAYS)
+        self.month_start = self.today.replace(day=1)
+
+    # -- shared inputs -----------------------------------------------------
+
+    @cached_property
+    def accounts(self):
+        """Active accounts as rows (attribute access like BankAccount)"""
+        return db.session.execute(
+            select(BankAccount.id, BankAccount.institution_name, BankAccount.account_name,
+                   BankAccount.account_type, BankAccount.account_subtype, BankAccount.mask,
+                   BankAccount.current_balance, BankAccount.available_balance)
+            .where(BankAccount.user_id == self.user_id, BankAccount.is_active.is_(True))
+            .order_by(BankAccount.id)
+        ).all()
+
+    @cached_property
+    def window(self):
+        """Transactions of the active accounts in the last WINDOW_DAYS, newest first"""
+        account_ids = [account.id for account in self.accounts]
+        if not account_ids:
+            return []
+        return db.session.execute(
+            select(Transaction.id, Transaction.name, Transaction.merchant_name, Transaction.amount,
+                   Transaction.date, Transaction.transfer_pair_id, Transaction.primary_category,
+                   func.coalesce(Transaction.rule_category_id, Transaction.category_id).label('category_id'))
+            .where(Transaction.account_id.in_(account_ids), Transaction.date >= self.window_start)
+            .order_by(Transaction.date.desc())
+        ).all()
+
+    @cached_property
+    def _window_totals(self):
+        """
+        Income, expenses, and spend per category id over the window and month
+        to date, without transfers
+
+        Rows the dictionary backfill hasn't encoded yet have no category id;
+        their spend is keyed by their primary category name instead.
+        """
+        income = expenses = 0
+        by_category = {}
+        month_by_category = {}
+        for tx in self.window:
+            if tx.transfer_pair_id is not None:
+                continue
+            if tx.amount < 0:
+                income += -tx.amount
+            elif tx.amount > 0:
+                expenses += tx.amount
+                key = tx.category_id if tx.category_id is not None else tx.primary_category
+                by_category[key] = by_category.get(key, 0) + tx.amount
+                if tx.date >= self.month_start:
+                    month_by_category[key] = month_by_category.get(key, 0) + tx.amount
+        return income, expenses, by_category, month_by_category
+
+    @cached_property
+    def _primary_categories(self):
+        """Primary category name of every category id in the window"""
+        return primary_categories({tx.category_id for tx in self.window if tx.category_id is not None})
+
+    def _by_primary_category(self, totals):
+        """Fold per category id totals into (primary category, total) pairs, largest first"""
+        folded = {}
+        for category_id, total in totals.items():
+            # Keys of unencoded rows are already names
+            name = self._primary_categories.get(category_id, category_id)
+            folded[name] = folded.get(name, 0) + total
+        return sorted(folded.items(), key=lambda pair: pair[1], reverse=True)
+
+    # -- figures -----------------------------------------------------------
+
+    @property
+    def total_balance(self):
+        return sum(account.current_balance or 0 for account in self.accounts)
+
+    @property
+    def total_available(self):
+        return sum(account.available_balance or 0 for account in self.accounts)
+
+    @property
+    def income(self):
+        return self._window_totals[0]
+
+    @property
+    def expenses(self):
+        return self._window_totals[1]
+
+    @property
+    def recent_transactions(self):
+        return [
+            RecentTransaction(tx.id, tx.name, tx.merchant_name, tx.amount, tx.date,
+                              self._primary_categories.get(tx.category_id, tx.primary_category))
+            for tx in self.window[:RECENT_LIMIT]
+        ]
+
+    @property
+    def spending_by_category(self):
+        """(category, total) pairs over the window, largest first"""
+        return self._by_primary_category(self._window_totals[2])
+
+    @property
+    def month_spending_by_category(self):
+        """(category, total) pairs month to date, largest first"""
+        return self._by_primary_category(self._window_totals[3])
+
+    # -- API sections ------------------------------------------------------
+
+    def section(self, name):
+        """JSON-ready section by name (see SECTIONS)"""
+        return getattr(self, f'_section_{name}')()
+
+    def _section_accounts(self):
+        return [{
+            'id': account.id,
+            'name': account.account_name,
+            'institution': account.institution_name,
+            'type': account.account_type,
+            'subtype': account.account_subtype,
+            'mask': account.mask,
+            'balance': float(account.current_balance or 0),
+            'available': float(account.available_balance or 0)
+        } for account in self.accounts]
+
+    def _section_balances(self):
+        # Serve stored balances now; stale items refresh in the background
+        balances = revalidate(self.user_id)
+        return {
+            'as_of': balances['as_of'].isoformat() if balances['as_of'] else None,
+            'refreshing': balances['refreshing']
+        }
+
+    def _section_totals(self):
+        def subtype_total(subtype):
+            return sum(account.current_balance or 0 for account in self.accounts
+                       if account.account_subtype == subtype)
+
+        return {
+            'total_assets': self.total_balance,
+            'total_liabilities': 0,
+            'net_worth': self.total_balance,
+            'checking': subtype_total('checking'),
+            'savings': subtype_total('savings'),
+            'credit': 0,
+            'investment': 0
+        }
+
+    def _section_net_worth(self):
+        return {
+            'net_worth': self.total_balance,
+            'total_assets': self.total_available,
+            'total_liabilities': 0,
+            'changes': {
+                'monthly': {'amount': 0, 'percentage': 0}
+            }
+        }
+
+    def _section_cash_flow(self):
+        income, expenses = self.income, self.expenses
+        savings_rate = (income - expenses) / income * 100 if income > 0 else 0
+        return {
+            'total_income': income,
+            'total_expenses': expenses,
+            'net_cash_flow': income - expenses,
+            'savings_rate': savings_rate,
+            'insights': {
+                'recommendations': [
+                    f"You've spent ${expenses:.2f} in the last 30 days",
+                    f"Your savings rate is {savings_rate:.1f}%"
+                ]
+            }
+        }
+
+    def _section_portfolio(self):
+        return {
+            'total_value': 0,
+            'total_gain': 0
+        }
+
+    def _section_recent_transactions(self):
+        return [{
+            'id': tx.id,
+            'name': tx.name,
+            'merchant_name': tx.merchant_name,
+            'amount': tx.amount,
+            'date': tx.date.isoformat(),
+            'category': tx.primary_category
+        } for tx in self.recent_transactions]
+
+    def _section_spending_by_category(self):
+        return [{
+            'category': category or 'Uncategorized',
+            'amount': float(total)
+        } for category, total in self.spending_by_category]
+
+    def _section_categories(self):
+        return [
+            {'name': category or 'UNCATEGORIZED', 'total': float(total or 0)}
+            for category, total in self.month_spending_by_category
+        ]
+
+
+# Section names accepted by FinancialSnapshot.section() and the batch endpoint
+SECTIONS = (
+    'accounts', 'balances', 'totals', 'net_worth', 'cash_flow', 'portfolio',
+    'recent_transactions', 'spending_by_category', 'categories',
+)
@@ -0,0 +1,375 @@
+"""Request, SQL and outbound-call metrics exposed in Prometheus text format
+
+Writers never take a lock: every thread increments its own shard, and shards
+are only merged when /metrics is scraped. When a thread (or, under gevent, a
+greenlet) ends, its shard is folded into a retired total, so short-lived
+threads don't pile up shards. With several gunicorn workers each process
+periodically dumps its merged snapshot to METRICS_DIR, and the worker that
+serves the scrape sums every file in that directory. When a worker exits,
+the gunicorn master folds its file into retired.json (retire_process()), so
+recycled workers don't leave a file each behind.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+HELP = {
+    'http_requests_total': ('counter', 'HTTP requests by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency'),
+    'db_statements_total': ('counter', 'SQL statements executed'),
+    'db_statement_duration_seconds_total': ('counter', 'Time spent executing SQL'),
+    'db_statements_per_request': ('histogram', 'SQL statements per HTTP request'),
+    'db_time_per_request_seconds': ('histogram', 'SQL time per HTTP request'),
+    'outbound_requests_total': ('counter', 'Calls to external APIs by outcome'),
+    'outbound_request_duration_seconds': ('histogram', 'External API call latency'),
+    'circuit_breaker_state': ('gauge', 'Worker processes with the breaker in each state'),
+    'circuit_breaker_transitions_total': ('counter', 'Circuit breaker state changes'),
+    'circuit_breaker_rejections_total': ('counter', 'Outbound calls refused by an open breaker'),
+}
+
+# Gauges in snapshots older than this belong to workers that have exited
+GAUGE_MAX_AGE_SECONDS = 300
+
+# Counters and histograms of exited workers, in METRICS_DIR
+RETIRED_FILENAME = 'retired.json'
+
+
+class _ShardOwner:
+    """Held only by a thread's local storage: collected, and so finalized, when the thread ends"""
+
+
+class MetricsRegistry:
+    """Per-thread sharded counters and histograms"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        # Taken once per new thread, when a thread ends, and to merge shards
+        self._shards_lock = threading.Lock()
+        self._retired = {'counters': {}, 'histograms': {}}  # shards of threads that have ended
+        self._gauges = {}  # process-wide; a set is a single dict store
+        self._last_flush = 0.0
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {'counters': {}, 'histograms': {}}
+            self._local.shard = shard
+            self._local.owner = _ShardOwner()
+            weakref.finalize(self._local.owner, self._retire, shard)
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _retire(self, shard):
+        """Fold an ended thread's shard into the retired total"""
+        with self._shards_lock:
+            self._shards.remove(shard)
+            _merge_shard(self._retired, shard)
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard()['counters']
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        histograms = self._shard()['histograms']
+        key = (name, labels)
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist['counts'][i] += 1
+                break
+        hist['sum'] += value
+        hist['count'] += 1
+
+    def set(self, name, labels, value):
+        self._gauges[(name, labels)] = value
+
+    def snapshot(self):
+        """Merge all thread shards into plain (JSON-serializable) lists"""
+        merged = {'counters': {}, 'histograms': {}}
+        # Under the lock, so a shard being retired is counted exactly once
+        with self._shards_lock:
+            _merge_shard(merged, self._retired)
+            for shard in self._shards:
+                _merge_shard(merged, shard)
+        counters, histograms = merged['counters'], merged['histograms']
+        return {
+            'counters': [[name, list(map(list, labels)), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(map(list, labels)), hist] for (name, labels), hist in histograms.items()],
+            'gauges': [[name, list(map(list, labels)), value] for (name, labels), value in list(self._gauges.items())],
+            'time': time.time(),
+        }
+
+    def flush(self, directory, force=False, interval=5.0):
+        """Write this process's snapshot to the shared directory"""
+        now = time.monotonic()
+        if not force and now - self._last_flush < interval:
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        _write_snapshot(os.path.join(directory, f'{os.getpid()}.json'), self.snapshot())
+
+
+def _merge_histogram(histograms, key, hist):
+    merged = histograms.get(key)
+    if merged is None:
+        histograms[key] = {
+            'buckets': list(hist['buckets']),
+            'counts': list(hist['counts']),
+            'sum': hist['sum'],
+            'count': hist['count'],
+        }
+        return
+    merged['counts'] = [a + b for a, b in zip(merged['counts'], hist['counts'])]
+    merged['sum'] += hist['sum']
+    merged['count'] += hist['count']
+
+
+def _merge_shard(total, shard):
+    for key, value in list(shard['counters'].items()):
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for key, hist in list(shard['histograms'].items()):
+        _merge_histogram(total['histograms'], key, hist)
+
+
+def _freeze(labels):
+    return tuple(tuple(pair) for pair in labels)
+
+
+def _write_snapshot(path, snapshot):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def retire_process(directory, pid):
+    """
+    Fold an exited worker's snapshot into retired.json and remove its file
+    (from gunicorn's child_exit hook: the master is the only writer)
+
+    Its gauges are dropped; they described the live process. retired.json
+    lists the pids folded into it, with when, so a scrape that reads both
+    it and the worker's file before the file is gone counts the worker once.
+    """
+    path = os.path.join(directory, f'{pid}.json')
+    retired_path = os.path.join(directory, RETIRED_FILENAME)
+    try:
+        snap = _read_snapshot(path)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        os.remove(path)
+        return
+    retired = {'counters': [], 'histograms': [], 'folded': {}}
+    if os.path.exists(retired_path):
+        retired = _read_snapshot(retired_path)
+
+    counters = {}
+    histograms = {}
+    for part in (retired, snap):
+        for name, labels, value in part['counters']:
+            key = (name, _freeze(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, hist in part['histograms']:
+            _merge_histogram(histograms, (name, _freeze(labels)), hist)
+    folded = {folded_pid: at for folded_pid, at in retired['folded'].items()
+              if os.path.exists(os.path.join(directory, f'{folded_pid}.json'))}
+    folded[str(pid)] = time.time()
+    _write_snapshot(retired_path, {
+        'counters': [[name, list(map(list, labels)), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(map(list, labels)), hist] for (name, labels), hist in histograms.items()],
+        'folded': folded,
+    })
+    os.remove(path)
+
+
+def collect(directory=None):
+    """Aggregate metrics from every worker (or just this process)"""
+    snapshots = []
+    if directory and os.path.isdir(directory):
+        registry.flush(directory, force=True)
+        workers = {}
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == RETIRED_FILENAME:
+                continue
+            try:
+                workers[filename[:-len('.json')]] = _read_snapshot(os.path.join(directory, filename))
+            except (OSError, ValueError):
+                continue  # file replaced or retired mid-read; the next scrape picks it up
+        # Read last: a worker retired meanwhile is in it, and skipped below
+        try:
+            retired = _read_snapshot(os.path.join(directory, RETIRED_FILENAME))
+        except (OSError, ValueError):
+            retired = None
+        if retired is not None:
+            snapshots.append(retired)
+            for pid, folded_at in retired['folded'].items():
+                # A later snapshot is a new process that was given the same pid
+                if pid in workers and workers[pid]['time'] <= folded_at:
+                    del workers[pid]
+        snapshots.extend(workers.values())
+    else:
+        snapshots.append(registry.snapshot())
+
+    counters = {}
+    histograms = {}
+    gauges = {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, _freeze(labels))
+            counters[key] = counters.get(key, 0) + value
+        if time.time() - snap.get('time', 0) <= GAUGE_MAX_AGE_SECONDS:
+            for name, labels, value in snap.get('gauges', ()):
+                key = (name, _freeze(labels))
+                gauges[key] = gauges.get(key, 0) + value
+        for name, labels, hist in snap['histograms']:
+            _merge_histogram(histograms, (name, _freeze(labels)), hist)
+    return counters, histograms, gauges
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus(directory=None):
+    """Render aggregated metrics in the Prometheus text exposition format"""
+    counters, histograms, gauges = collect(directory)
+    lines = []
+    seen = set()
+
+    def header(name):
+        if name in seen:
+            return
+        seen.add(name)
+        kind, help_text = HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    for (name, labels), value in sorted(gauges.items()):
+        header(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    for (name, labels), hist in sorted(histograms.items(), key=lambda item: item[0]):
+        header(name)
+        cumulative = 0
+        for bound, count in zip(hist['buckets'], hist['counts']):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {hist["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {hist["sum"]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {hist["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def track_outbound(service, operation):
+    """Time a call to an external API (Plaid, Brevo, Vonage)"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        labels = (('service', service), ('operation', operation), ('outcome', outcome))
+        registry.observe('outbound_request_duration_seconds', labels, time.perf_counter() - start)
+        registry.inc('outbound_requests_total', labels)
+
+
+def timed_outbound(service, operation):
+    """Decorator form of track_outbound()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_outbound(service, operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    registry.inc('db_statements_total')
+    registry.inc('db_statement_duration_seconds_total', value=elapsed)
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+
+
+def init_metrics(app):
+    """Register request hooks that record latency and per-request SQL cost"""
+    directory = app.config.get('METRICS_DIR')
+    interval = app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        if endpoint == '/metrics':
+            return response
+        labels = (('endpoint', endpoint), ('method', request.method))
+        registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        registry.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        registry.observe('db_statements_per_request', labels, g.get('sql_count', 0), buckets=COUNT_BUCKETS)
+        registry.observe('db_time_per_request_seconds', labels, g.get('sql_time', 0.0))
+        if directory:
+            try:
+                registry.flush(directory, interval=interval)
+            except OSError as e:
+                logger.warning(f"Could not write metrics snapshot: {e}")
+        return response
+
+
+registry = MetricsRegistry()
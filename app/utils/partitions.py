@@ -0,0 +1,507 @@
+"""Monthly range partitioning of transactions on Postgres
+
+SQLite deployments keep the plain table created by db.create_all(); nothing
+here runs for them.
+
+Partitioning is opt-in: `flask partitions convert` partitions an existing
+table, and TRANSACTIONS_PARTITIONING=true partitions a fresh database at
+startup. Until then nothing here changes the table.
+
+Once partitioned, the transactions table is split by RANGE (date), one
+partition per month plus a default partition for dates outside them. Every
+partition gets a btree index on (account_id, date) and a BRIN index on date.
+Those indexes are created on the parent, so Postgres adds them to each new
+partition. Partitions cover the Plaid history window and are kept
+TRANSACTIONS_PARTITIONS_AHEAD_MONTHS ahead of today.
+
+A partitioned table can only enforce uniqueness on keys that include the
+partition key, so the primary key becomes (id, date) and plaid_transaction_id
+is unique per date. Ingest therefore skips ON CONFLICT on a partitioned
+table: it splits new and existing ids itself (see
+PlaidService._insert_transactions), and the item's sync lease (see
+app/utils/sync_leases.py) keeps two syncs off the same item.
+
+Partitions older than TRANSACTIONS_ARCHIVE_AFTER_MONTHS are detached and
+attached to transactions_archive, an identically partitioned table, after
+being moved to TRANSACTIONS_ARCHIVE_TABLESPACE when one is set. That
+tablespace can live on cheap, compressed storage. Dashboards only read
+recent dates, so they never touch the archive. Reads that span all history
+use transactions_source(), which adds the archive when the requested range
+reaches into it.
+
+    flask partitions status
+    flask partitions convert     # one-off: partition an existing table
+    flask partitions maintain    # future partitions + archival (also run by the sync scheduler)
+"""
+import logging
+import re
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import MetaData, select, text, func
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import CreateIndex
+
+from app.models import db, Transaction, TransactionChange
+
+logger = logging.getLogger(__name__)
+
+PARENT = 'transactions'
+ARCHIVE = 'transactions_archive'
+DEFAULT_PARTITION = 'transactions_default'
+# Built next to the live table during convert(), then renamed over it
+STAGING = 'transactions_partitioned'
+# The original table after convert(), kept until an operator drops it
+RETIRED = 'transactions_unpartitioned'
+
+# Postgres advisory lock keys: partitioning a fresh database at startup,
+# partition maintenance, and building missing indexes
+PREPARE_LOCK_KEY = 0x7A27
+PARTITION_LOCK_KEY = 0x7A28
+INDEX_LOCK_KEY = 0x7A29
+
+PARTITION_NAME = re.compile(r'^transactions_p(\d{4})_(\d{2})$')
+
+# Same columns as transactions, for reading the archive (not created by create_all)
+archive_table = Transaction.__table__.to_metadata(MetaData(), name=ARCHIVE)
+
+_state = {'checked_at': 0.0, 'partitioned': False, 'archived_through': None}
+# Seconds the partitioned/archived state is cached per process
+STATE_TTL = 60
+
+
+def partition_name(month):
+    return f'transactions_p{month:%Y_%m}'
+
+
+def add_months(month, months):
+    years, index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def _postgres(engine):
+    return engine.dialect.name == 'postgresql'
+
+
+def _relkind(conn, name):
+    return conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {'name': name}
+    ).scalar()
+
+
+def _partitions(conn, parent):
+    """Months of a parent's monthly partitions, oldest first (default partition excluded)"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent)"
+    ), {'parent': parent}).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def _refresh_state():
+    engine = db.engine
+    partitioned = False
+    archived_through = None
+    if _postgres(engine):
+        with engine.connect() as conn:
+            partitioned = _relkind(conn, PARENT) == 'p'
+            if partitioned and _relkind(conn, ARCHIVE) == 'p':
+                archived = _partitions(conn, ARCHIVE)
+                if archived:
+                    archived_through = add_months(archived[-1], 1)
+    _state.update(checked_at=time.monotonic(), partitioned=partitioned, archived_through=archived_through)
+
+
+def _cached_state():
+    if time.monotonic() - _state['checked_at'] > STATE_TTL:
+        _refresh_state()
+    return _state
+
+
+def is_partitioned():
+    """Whether transactions is a partitioned table (cached per process)"""
+    return _cached_state()['partitioned']
+
+
+def archived_through():
+    """First date still in the live table when partitions have been archived, else None"""
+    return _cached_state()['archived_through']
+
+
+def transaction_tables():
+    """Tables holding transactions: the live table, and the archive when there is one"""
+    if archived_through() is None:
+        return [Transaction.__table__]
+    return [Transaction.__table__, archive_table]
+
+
+def transactions_source(start_date=None):
+    """
+    Entity to query transactions from a date on (None = all history)
+
+    Returns Transaction itself unless the range reaches into archived
+    partitions; then an alias over the live and archived tables, usable
+    anywhere Transaction is (columns, filters, relationships).
+    """
+    boundary = archived_through()
+    if boundary is None or (start_date is not None and start_date >= boundary):
+        return Transaction
+    history = select(Transaction.__table__).union_all(select(archive_table)).subquery('transaction_history')
+    return aliased(Transaction, history)
+
+
+def _create_parent(conn, name, like):
+    """An empty partitioned copy of `like` with the partitioned-table keys and indexes"""
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {like} INCLUDING DEFAULTS) PARTITION BY RANGE (date)"))
+    conn.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT {name}_pkey PRIMARY KEY (id, date)"))
+    conn.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_plaid_transaction_id_date_key "
+        f"UNIQUE (plaid_transaction_id, date)"
+    ))
+    conn.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_account_id_fkey "
+        f"FOREIGN KEY (account_id) REFERENCES bank_accounts (id)"
+    ))
+    conn.execute(text(f"CREATE INDEX {name}_account_id_date_idx ON {name} (account_id, date)"))
+    conn.execute(text(f"CREATE INDEX {name}_date_brin ON {name} USING brin (date)"))
+
+
+def _partition_names(conn, parent):
+    """Names of all a parent's partitions, the default one included"""
+    return conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent) ORDER BY c.relname"
+    ), {'parent': parent}).scalars().all()
+
+
+def add_partitioned_indexes(conn, indexes):
+    """
+    Build the model's transactions indexes on the partitioned table without
+    blocking writes (on an autocommit connection)
+
+    Postgres can't build an index on a partitioned table concurrently. Each
+    one is created on the parent alone, which leaves it invalid, then built
+    concurrently on every partition and attached; once every partition's is
+    attached the parent's becomes valid, and partitions created later get
+    one automatically. Indexes the parent replaces with its own are skipped:
+    unique ones, as uniqueness has to include the partition key
+    (its UNIQUE (plaid_transaction_id, date) stands in), and the one on date
+    alone (the BRIN index).
+    """
+    for index in indexes:
+        if index.unique or [column.name for column in index.columns] == ['date']:
+            continue
+        valid = conn.execute(text(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+        ), {'name': index.name}).scalar()
+        if valid:
+            continue
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+        conn.execute(text(ddl.replace(f' ON {PARENT} (', f' ON ONLY {PARENT} (', 1)))
+        suffix = index.name.removeprefix(f'ix_{PARENT}_')
+        for partition in _partition_names(conn, PARENT):
+            name = f'{partition}_{suffix}_idx'[:63]
+            partition_valid = conn.execute(text(
+                "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+            ), {'name': name}).scalar()
+            if partition_valid is False:
+                # Left behind by an interrupted concurrent build
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            conn.execute(text(
+                ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+                .replace(f' {index.name} ', f' {name} ', 1)
+                .replace(f' ON {PARENT} (', f' ON {partition} (', 1)
+            ))
+            # A no-op when it is attached already
+            conn.execute(text(f"ALTER INDEX {index.name} ATTACH PARTITION {name}"))
+        logger.info(f"Added index {index.name}")
+
+
+def _retire_indexes(conn):
+    """
+    Rename the retired table's indexes out of the way: the models' index
+    names belong to the partitioned table now
+    """
+    names = conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+    ), {'table': RETIRED}).scalars().all()
+    for name in names:
+        retired = name.replace(PARENT, RETIRED, 1) if PARENT in name else f'{name}_{RETIRED}'
+        conn.execute(text(f"ALTER INDEX {name} RENAME TO {retired[:63]}"))
+
+
+def _create_partition(conn, parent, month):
+    """
+    Add the partition for a month if it is missing
+
+    Rows for that month already sitting in the default partition are moved
+    into it first; Postgres refuses the attach otherwise.
+    """
+    name = partition_name(month)
+    if _relkind(conn, name):
+        return False
+    start, end = month, add_months(month, 1)
+    bounds = {'start': start, 'end': end}
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)"))
+    if parent == PARENT and _relkind(conn, DEFAULT_PARTITION):
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), bounds)
+    conn.execute(text(
+        f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    logger.info(f"Created partition {name}")
+    return True
+
+
+def _copy_rows(conn, where, params):
+    return conn.execute(text(f"INSERT INTO {STAGING} SELECT * FROM {PARENT} WHERE {where}"), params).rowcount
+
+
+def convert(batch_size=20000, echo=logger.info):
+    """
+    Turn an existing transactions table into a partitioned one
+
+    Rows are copied in id order, one committed batch at a time, while the app
+    keeps running. A final short transaction blocks writers, copies whatever
+    was inserted or updated meanwhile, applies deletes from the change log,
+    and swaps the tables. The old table is kept as transactions_unpartitioned
+    until an operator drops it.
+    """
+    engine = db.engine
+    if not _postgres(engine):
+        raise click.ClickException('Partitioning needs Postgres')
+
+    with engine.begin() as conn:
+        if _relkind(conn, PARENT) == 'p':
+            echo('transactions is already partitioned')
+            return False
+        if _relkind(conn, RETIRED):
+            raise click.ClickException(f'{RETIRED} exists from an earlier conversion; drop it first')
+        # Changes made while copying are caught up from these marks; updated_at
+        # is set by app servers, so allow for clock skew
+        started_at = datetime.utcnow() - timedelta(minutes=5)
+        start_seq = conn.execute(select(func.max(TransactionChange.seq))).scalar() or 0
+        first_date, max_id = conn.execute(text(f"SELECT min(date), max(id) FROM {PARENT}")).one()
+
+        conn.execute(text(f"DROP TABLE IF EXISTS {STAGING} CASCADE"))
+        _create_parent(conn, STAGING, PARENT)
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {STAGING} DEFAULT"))
+        ensure_partitions(conn, STAGING, first_date.replace(day=1) if first_date else None)
+
+    copied_through = 0
+    while copied_through < (max_id or 0):
+        with engine.begin() as conn:
+            copied = _copy_rows(conn, 'id > :low AND id <= :high',
+                                {'low': copied_through, 'high': copied_through + batch_size})
+        copied_through += batch_size
+        echo(f"Copied ids up to {min(copied_through, max_id)} of {max_id} ({copied} rows)")
+
+    with engine.begin() as conn:
+        # Readers carry on; writers wait for the swap
+        conn.execute(text(f"LOCK TABLE {PARENT} IN SHARE ROW EXCLUSIVE MODE"))
+        caught_up = _copy_rows(conn, 'id > :high', {'high': copied_through})
+        changed = conn.execute(text(
+            f"SELECT id FROM {PARENT} WHERE id <= :high AND updated_at >= :started_at"
+        ), {'high': copied_through, 'started_at': started_at}).scalars().all()
+        removed = conn.execute(
+            select(TransactionChange.transaction_id.distinct())
+            .where(TransactionChange.seq > start_seq, TransactionChange.op == 'delete')
+        ).scalars().all()
+        stale = list(set(changed) | set(removed))
+        if stale:
+            conn.execute(text(f"DELETE FROM {STAGING} WHERE id = ANY(:ids)"), {'ids': stale})
+        if changed:
+            _copy_rows(conn, 'id = ANY(:ids)', {'ids': list(changed)})
+
+        sequence = conn.execute(text(f"SELECT pg_get_serial_sequence('{PARENT}', 'id')")).scalar()
+        conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {RETIRED}"))
+        _retire_indexes(conn)
+        conn.execute(text(f"ALTER TABLE {STAGING} RENAME TO {PARENT}"))
+        if sequence:
+            # Keep the id sequence alive when the old table is dropped
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT}.id"))
+    echo(f"Swapped in the partitioned table ({caught_up} late inserts, {len(stale)} rows re-copied); "
+         f"drop {RETIRED} once satisfied")
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        add_partitioned_indexes(conn, Transaction.__table__.indexes)
+
+    _state['checked_at'] = 0.0
+    return True
+
+
+def history_start():
+    """First month ingest can write to (backfills reach back PLAID_HISTORY_DAYS)"""
+    return (date.today() - timedelta(days=current_app.config['PLAID_HISTORY_DAYS'])).replace(day=1)
+
+
+def ensure_partitions(conn, parent=PARENT, first=None):
+    """
+    Create the monthly partitions ingest can write to: from the start of the
+    Plaid history window (or `first`) through the configured months ahead
+    """
+    month = min(first or history_start(), history_start())
+    last = add_months(date.today().replace(day=1), current_app.config['TRANSACTIONS_PARTITIONS_AHEAD_MONTHS'])
+    created = 0
+    while month <= last:
+        # Months already moved to the archive keep their name there
+        created += _create_partition(conn, parent, month)
+        month = add_months(month, 1)
+    return created
+
+
+def archive_cutoff():
+    """Months before this are archived; never inside the Plaid history window, which still gets updates"""
+    by_age = add_months(date.today().replace(day=1), -current_app.config['TRANSACTIONS_ARCHIVE_AFTER_MONTHS'])
+    return min(by_age, history_start())
+
+
+def add_archive_columns(conn):
+    """
+    Add columns added to transactions since the archive was created: a
+    partition only attaches to a parent with the same columns
+    """
+    existing = set(conn.execute(text(
+        "SELECT attname FROM pg_attribute WHERE attrelid = to_regclass(:name) AND attnum > 0 AND NOT attisdropped"
+    ), {'name': ARCHIVE}).scalars())
+    for column in archive_table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        # IF NOT EXISTS: another worker may be doing the same
+        conn.execute(text(f"ALTER TABLE {ARCHIVE} ADD COLUMN IF NOT EXISTS {column.name} {column_type}"))
+        logger.info(f"Added column {ARCHIVE}.{column.name}")
+
+
+def archive_partitions(conn):
+    """Move whole months before archive_cutoff() from transactions to transactions_archive"""
+    if _relkind(conn, ARCHIVE) is None:
+        _create_parent(conn, ARCHIVE, PARENT)
+    else:
+        add_archive_columns(conn)
+
+    tablespace = current_app.config['TRANSACTIONS_ARCHIVE_TABLESPACE']
+    cutoff = archive_cutoff()
+    archived = []
+    for month in _partitions(conn, PARENT):
+        if add_months(month, 1) > cutoff:
+            break
+        name = partition_name(month)
+        bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        if tablespace:
+            conn.execute(text(f"ALTER TABLE {name} SET TABLESPACE {tablespace}"))
+        conn.execute(text(f"ALTER TABLE {ARCHIVE} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+        archived.append(name)
+        logger.info(f"Archived partition {name}")
+    return archived
+
+
+def maintain():
+    """
+    Create upcoming partitions and archive old ones (no-op unless partitioned)
+
+    Returns:
+        dict with 'created' (count) and 'archived' (partition names), or
+        None when transactions isn't partitioned
+    """
+    engine = db.engine
+    if not _postgres(engine):
+        return None
+    with engine.begin() as conn:
+        if _relkind(conn, PARENT) != 'p':
+            return None
+        # Several schedulers may run this at once
+        conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PARTITION_LOCK_KEY})
+        created = ensure_partitions(conn)
+    with engine.begin() as conn:
+        conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PARTITION_LOCK_KEY})
+        archived = archive_partitions(conn)
+    _state['checked_at'] = 0.0
+    return {'created': created, 'archived': archived}
+
+
+def prepare_partitions(db):
+    """
+    Partition a fresh Postgres database's transactions table at startup,
+    when TRANSACTIONS_PARTITIONING opts in
+
+    An empty table is converted on the spot. A populated one is left alone
+    (converting copies every row) with a pointer to `flask partitions convert`.
+    """
+    engine = db.engine
+    if not _postgres(engine) or not current_app.config['TRANSACTIONS_PARTITIONING']:
+        return
+    with engine.connect() as conn:
+        if _relkind(conn, PARENT) == 'p':
+            if _relkind(conn, ARCHIVE) == 'p':
+                add_archive_columns(conn)
+                conn.commit()
+            return
+        # Every worker gets here on its first request; let one convert
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': PREPARE_LOCK_KEY})
+        try:
+            if _relkind(conn, PARENT) == 'p':
+                return
+            if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {PARENT})")).scalar():
+                logger.warning("transactions is not partitioned; run `flask partitions convert` to partition it")
+                return
+            conn.commit()
+            convert()
+            maintain()
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': PREPARE_LOCK_KEY})
+            conn.commit()
+
+
+def init_partitions(app):
+    """Register the `flask partitions` commands"""
+
+    @app.cli.group('partitions')
+    def partitions_group():
+        """Monthly partitions of the transactions table (Postgres)."""
+
+    @partitions_group.command('status')
+    def status_command():
+        """List live and archived partitions."""
+        engine = db.engine
+        if not _postgres(engine):
+            click.echo(f'{engine.dialect.name}: transactions is not partitioned')
+            return
+        with engine.connect() as conn:
+            if _relkind(conn, PARENT) != 'p':
+                click.echo('transactions is not partitioned (see `flask partitions convert`)')
+                return
+            for parent in (PARENT, ARCHIVE):
+                months = _partitions(conn, parent) if _relkind(conn, parent) else []
+                span = f"{months[0]:%Y-%m} .. {months[-1]:%Y-%m}" if months else 'none'
+                click.echo(f"{parent}: {len(months)} monthly partitions ({span})")
+            click.echo(f"archive cutoff: {archive_cutoff().isoformat()}")
+
+    @partitions_group.command('convert')
+    @click.option('--batch-size', default=20000, show_default=True, help='Rows copied per transaction.')
+    def convert_command(batch_size):
+        """Partition an existing transactions table without downtime."""
+        db.create_all()
+        convert(batch_size, echo=click.echo)
+        result = maintain()
+        if result:
+            click.echo(f"Created {result['created']} partitions, archived {len(result['archived'])}")
+
+    @partitions_group.command('maintain')
+    def maintain_command():
+        """Create upcoming partitions and archive old ones."""
+        result = maintain()
+        if result is None:
+            click.echo('transactions is not partitioned; nothing to do')
+        else:
+            click.echo(f"Created {result['created']} partitions, archived {', '.join(result['archived']) or 'none'}")
@@ -5,17 +5,66 @@ from plaid.model.link_token_create_request import LinkTokenCreateRequest
 from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
 from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
 from plaid.model.transactions_sync_request import TransactionsSyncRequest
+from plaid.model.transactions_get_request import TransactionsGetRequest
+from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
 from plaid.model.accounts_get_request import AccountsGetRequest
+from plaid.model.item_remove_request import ItemRemoveRequest
 from plaid.model.products import Products
 from plaid.model.country_code import CountryCode
 from flask import current_app
-from datetime import datetime, date
+from sqlalchemy import select, insert, update, delete, bindparam, or_, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime, date, timedelta
+import contextvars
+import json
 import logging
+import queue
+import random
+import threading
+import time
 
-from app.models import db, BankAccount, Transaction
+import urllib3
+
+from app.models import db, BankAccount, PlaidItem, Transaction
+from app.utils.backfill import backfill_worker
+from app.utils import sync_events, sync_leases, change_log, data_version, dictionary, categorization, transfers, relink
+from app.utils.db_routing import on_primary
+from app.utils.partitions import is_partitioned
+from app.utils.resilience import guarded, DependencyUnavailable
 
 logger = logging.getLogger(__name__)
 
+# Column order of the row tuples built from Plaid transactions during sync
+TRANSACTION_COLUMNS = (
+    'account_id', 'plaid_transaction_id', 'name', 'merchant_name', 'amount', 'currency_code',
+    'category', 'primary_category', 'detailed_category', 'date', 'authorized_date',
+    'pending', 'payment_channel',
+)
+# Columns a 'modified' transaction from Plaid may change (the dictionary ids
+# are set by dictionary.encode(), rule_category_id by categorization.apply())
+UPDATABLE_COLUMNS = (
+    'name', 'merchant_name', 'amount', 'currency_code', 'category', 'primary_category',
+    'detailed_category', 'date', 'authorized_date', 'pending', 'payment_channel',
+    'merchant_id', 'category_id', 'rule_category_id',
+)
+
+# BankAccount columns refreshed from /accounts/get when an item is (re)linked
+ACCOUNT_DETAIL_COLUMNS = (
+    'account_name', 'account_type', 'account_subtype', 'mask',
+    'current_balance', 'available_balance', 'credit_limit',
+)
+
+# Poll interval while the history backfill waits for another sync's lease
+LEASE_WAIT_SECONDS = 1
+
+# Item errors no retry can fix: the user has to go through Link update mode
+RELINK_ERROR_CODES = frozenset({
+    'ITEM_LOGIN_REQUIRED', 'INVALID_CREDENTIALS', 'INVALID_MFA', 'INSUFFICIENT_CREDENTIALS',
+    'ITEM_LOCKED', 'USER_SETUP_REQUIRED', 'ITEM_NOT_SUPPORTED', 'NO_ACCOUNTS',
+    'ACCESS_NOT_GRANTED', 'INVALID_ACCESS_TOKEN', 'ITEM_NOT_FOUND',
+})
+
 
 class PlaidService:
     """Service for Plaid API interactions"""
@@ -40,6 +89,9 @@ class PlaidService:
     
     def _get_plaid_host(self):
         """Get Plaid host URL based on environment"""
+        if current_app.config.get('PLAID_HOST'):
+            return current_app.config['PLAID_HOST']
+        
         env = current_app.config['PLAID_ENV']
         hosts = {
             'sandbox': plaid.Environment.Sandbox,
@@ -48,40 +100,46 @@ class PlaidService:
         }
         return hosts.get(env, plaid.Environment.Sandbox)
     
-    def create_link_token(self, user):
+    def create_link_token(self, user, access_token=None):
         """
         Create a Link token for initializing Plaid Link
         
         Args:
             user: User object
+            access_token: Existing item's access token to open Link in update
+                mode (re-authentication) instead of linking a new item
             
         Returns:
             dict with 'success' and 'link_token' or 'error'
         """
         try:
+            if access_token:
+                # Update mode takes the item's token instead of a product list
+                mode = {'access_token': access_token}
+            else:
+                mode = {'products': [Products(p) for p in current_app.config['PLAID_PRODUCTS']]}
             request = LinkTokenCreateRequest(
-                products=[Products(p) for p in current_app.config['PLAID_PRODUCTS']],
                 client_name=current_app.config['SENDER_NAME'],
                 country_codes=[CountryCode(c) for c in current_app.config['PLAID_COUNTRY_CODES']],
                 language='en',
                 user=LinkTokenCreateRequestUser(
                     client_user_id=str(user.id)
                 ),
-                redirect_uri=current_app.config.get('PLAID_REDIRECT_URI')
+                redirect_uri=current_app.config.get('PLAID_REDIRECT_URI'),
+                **mode
             )
             
-            response = self.client.link_token_create(request)
+            with guarded('plaid', 'link_token_create') as timeout:
+                response = self.client.link_token_create(request, _request_timeout=timeout)
             return {
                 'success': True,
                 'link_token': response['link_token'],
                 'expiration': response['expiration']
             }
         except plaid.ApiException as e:
-            logger.error(f"Error creating link token: {e}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return self._api_error(e, 'creating link token')
+        except (DependencyUnavailable, urllib3.exceptions.HTTPError) as e:
+            return self._unavailable(e, 'creating link token')
     
     def exchange_public_token(self, public_token):
         """
@@ -98,18 +156,17 @@ class PlaidService:
                 public_token=public_token
             )
             
-            response = self.client.item_public_token_exchange(request)
+            with guarded('plaid', 'item_public_token_exchange') as timeout:
+                response = self.client.item_public_token_exchange(request, _request_timeout=timeout)
             return {
                 'success': True,
                 'access_token': response['access_token'],
                 'item_id': response['item_id']
             }
         except plaid.ApiException as e:
-            logger.error(f"Error exchanging public token: {e}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return self._api_error(e, 'exchanging public token')
+        except (DependencyUnavailable, urllib3.exceptions.HTTPError) as e:
+            return self._unavailable(e, 'exchanging public token')
     
     def get_accounts(self, access_token):
         """
@@ -126,43 +183,75 @@ class PlaidService:
                 access_token=access_token
             )
             
-            response = self.client.accounts_get(request)
+            with guarded('plaid', 'accounts_get') as timeout:
+                response = self.client.accounts_get(request, _request_timeout=timeout)
             return {
                 'success': True,
                 'accounts': response['accounts'],
                 'item': response['item']
             }
         except plaid.ApiException as e:
-            logger.error(f"Error getting accounts: {e}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return self._api_error(e, 'getting accounts')
+        except (DependencyUnavailable, urllib3.exceptions.HTTPError) as e:
+            return self._unavailable(e, 'getting accounts')
     
-    def sync_transactions(self, access_token, cursor=None):
+    def remove_item(self, access_token):
+        """
+        Revoke an item's access token at Plaid (/item/remove)
+        
+        An item Plaid no longer knows counts as removed.
+        
+        Returns:
+            dict with 'success' or 'error'
+        """
+        try:
+            request = ItemRemoveRequest(
+                access_token=access_token
+            )
+            
+            with guarded('plaid', 'item_remove') as timeout:
+                self.client.item_remove(request, _request_timeout=timeout)
+            return {'success': True}
+        except plaid.ApiException as e:
+            result = self._api_error(e, 'removing item')
+            if result['error_code'] in ('ITEM_NOT_FOUND', 'INVALID_ACCESS_TOKEN'):
+                return {'success': True}
+            return result
+        except (DependencyUnavailable, urllib3.exceptions.HTTPError) as e:
+            return self._unavailable(e, 'removing item')
+    
+    def sync_transactions(self, access_token, cursor=None, count=None, raw=False):
         """
         Sync transactions using Plaid Sync API
         
         Args:
             access_token: Plaid access token
             cursor: Optional cursor for incremental sync
+            count: Optional page size (Plaid allows up to 500)
+            raw: Return plain JSON dicts instead of Plaid model objects. The
+                SDK's model validation costs several ms per transaction, which
+                dominates bulk ingest.
             
         Returns:
             dict with 'success', transaction data, or 'error'
         """
         try:
-            # Build request - only include cursor if it's not None
+            # Build request - only include cursor/count if they're set
+            options = {}
             if cursor:
-                request = TransactionsSyncRequest(
-                    access_token=access_token,
-                    cursor=cursor
-                )
-            else:
-                request = TransactionsSyncRequest(
-                    access_token=access_token
-                )
+                options['cursor'] = cursor
+            if count:
+                options['count'] = count
+            request = TransactionsSyncRequest(
+                access_token=access_token,
+                **options
+            )
             
-            response = self.client.transactions_sync(request)
+            with guarded('plaid', 'transactions_sync') as timeout:
+                if raw:
+                    response = json.loads(self.client.transactions_sync(request, _preload_content=False, _request_timeout=timeout).data)
+                else:
+                    response = self.client.transactions_sync(request, _request_timeout=timeout)
             return {
                 'success': True,
                 'added': response.get('added', []),
@@ -172,16 +261,99 @@ class PlaidService:
                 'has_more': response['has_more']
             }
         except plaid.ApiException as e:
-            logger.error(f"Error syncing transactions: {e}")
+            return self._api_error(e, 'syncing transactions')
+        except (DependencyUnavailable, urllib3.exceptions.HTTPError) as e:
+            return self._unavailable(e, 'syncing transactions')
+    
+    def get_transactions(self, access_token, start_date, end_date, offset=0, count=500):
+        """
+        Fetch one page of a date range using /transactions/get
+        
+        Args:
+            access_token: Plaid access token
+            start_date, end_date: Inclusive date range
+            offset: Number of transactions to skip
+            count: Page size (Plaid allows up to 500)
+            
+        Returns:
+            dict with 'success', 'transactions' (plain JSON dicts) and
+            'total_transactions', or 'error'
+        """
+        try:
+            request = TransactionsGetRequest(
+                access_token=access_token,
+                start_date=start_date,
+                end_date=end_date,
+                options=TransactionsGetRequestOptions(count=count, offset=offset)
+            )
+            
+            with guarded('plaid', 'transactions_get') as timeout:
+                response = json.loads(self.client.transactions_get(request, _preload_content=False, _request_timeout=timeout).data)
             return {
-                'success': False,
-                'error': str(e)
+                'success': True,
+                'transactions': response['transactions'],
+                'total_transactions': response['total_transactions']
             }
+        except plaid.ApiException as e:
+            return self._api_error(e, 'getting transactions')
+        except (DependencyUnavailable, urllib3.exceptions.HTTPError) as e:
+            return self._unavailable(e, 'getting transactions')
     
+    @on_primary
+    def get_or_create_item(self, user_id, access_token, item_id, institution_name):
+        """
+        Record a newly linked (or relinked) Plaid item
+        
+        Returns:
+            PlaidItem object
+        """
+        item = PlaidItem.query.filter_by(plaid_item_id=item_id).first()
+        if item is None:
+            item = PlaidItem(
+                user_id=user_id,
+                plaid_item_id=item_id,
+                plaid_access_token=access_token,
+                institution_name=institution_name,
+                backfill_status='pending'
+            )
+            db.session.add(item)
+        else:
+            item.plaid_access_token = access_token
+        # Linking just saved the accounts' balances from /accounts/get
+        item.balances_refreshed_at = datetime.utcnow()
+        db.session.commit()
+        return item
+    
+    @on_primary
+    def item_for_account(self, bank_account):
+        """
+        Item record for an account
+        
+        Accounts linked before items were tracked get one on first use. Their
+        history was ingested by a full sync back then, so no backfill is owed.
+        """
+        item = PlaidItem.query.filter_by(plaid_item_id=bank_account.plaid_item_id).first()
+        if item is None:
+            item = PlaidItem(
+                user_id=bank_account.user_id,
+                plaid_item_id=bank_account.plaid_item_id,
+                plaid_access_token=bank_account.plaid_access_token,
+                institution_name=bank_account.institution_name,
+                backfill_status='complete'
+            )
+            db.session.add(item)
+            db.session.commit()
+        return item
+    
+    @on_primary
     def save_accounts_for_user(self, user_id, access_token, item_id, accounts_data, institution_name):
         """
         Save bank accounts to database
         
+        Existing accounts are looked up in one IN query and every account is
+        written by a single upsert keyed on plaid_account_id, so the number
+        of queries doesn't grow with the number of accounts on the item.
+        
         Args:
             user_id: User ID
             access_token: Plaid access token
@@ -189,172 +361,899 @@ class PlaidService:
             accounts_data: List of account dicts from Plaid
             institution_name: Name of financial institution
             
+        A created account that duplicates one the user linked through
+        another item supersedes it (see app/utils/relink.py).
+        
         Returns:
-            List of saved BankAccount objects
+            dict with 'accounts' (the saved BankAccount objects, in Plaid's
+            order), the BankAccount ids that were 'created', 'updated'
+            (details or balances changed) and 'reactivated' (previously
+            removed), and 'superseded' (old account id -> new account id)
         """
-        saved_accounts = []
+        if not accounts_data:
+            return {'accounts': [], 'created': [], 'updated': [], 'reactivated': [], 'superseded': {}}
         
+        now = datetime.utcnow()
+        rows = []
         for account in accounts_data:
-            # Check if account already exists
-            existing = BankAccount.query.filter_by(
-                plaid_account_id=account['account_id']
-            ).first()
-            
-            if existing:
-                # Update existing account
-                existing.account_name = account['name']
-                existing.account_type = str(account['type']) if account.get('type') else None
-                existing.account_subtype = str(account['subtype']) if account.get('subtype') else None
-                existing.mask = account['mask']
-                existing.is_active = True
-                
-                # Update balances
-                balances = account.get('balances', {})
-                existing.current_balance = balances.get('current')
-                existing.available_balance = balances.get('available')
-                existing.credit_limit = balances.get('limit')
-                existing.last_synced_at = datetime.utcnow()
-                
-                saved_accounts.append(existing)
-            else:
-                # Create new account
-                balances = account.get('balances', {})
-                new_account = BankAccount(
-                    user_id=user_id,
-                    plaid_item_id=item_id,
-                    plaid_account_id=account['account_id'],
-                    plaid_access_token=access_token,
-                    institution_name=institution_name,
-                    account_name=account['name'],
-                    account_type=str(account['type']) if account.get('type') else None,
-                    account_subtype=str(account['subtype']) if account.get('subtype') else None,
-                    mask=account['mask'],
-                    current_balance=balances.get('current'),
-                    available_balance=balances.get('available'),
-                    credit_limit=balances.get('limit'),
-                    last_synced_at=datetime.utcnow()
-                )
-                db.session.add(new_account)
-                saved_accounts.append(new_account)
+            balances = account.get('balances', {})
+            rows.append({
+                'user_id': user_id,
+                'plaid_item_id': item_id,
+                'plaid_account_id': account['account_id'],
+                'plaid_access_token': access_token,
+                'institution_name': institution_name,
+                'account_name': account['name'],
+                'account_type': str(account['type']) if account.get('type') else None,
+                'account_subtype': str(account['subtype']) if account.get('subtype') else None,
+                'mask': account['mask'],
+                'current_balance': balances.get('current'),
+                'available_balance': balances.get('available'),
+                'credit_limit': balances.get('limit'),
+                'is_active': True,
+                'deactivated_at': None,
+                'purged_at': None,
+                'last_synced_at': now,
+                'created_at': now,
+                'updated_at': now,
+            })
+        plaid_account_ids = [row['plaid_account_id'] for row in rows]
+        
+        existing = {
+            row.plaid_account_id: row
+            for row in db.session.execute(
+                select(BankAccount.plaid_account_id, BankAccount.is_active, BankAccount.purged_at,
+                       *(BankAccount.__table__.c[column] for column in ACCOUNT_DETAIL_COLUMNS))
+                .where(BankAccount.plaid_account_id.in_(plaid_account_ids))
+            )
+        }
+        
+        self._upsert_accounts(rows, existing)
+        
+        accounts = {
+            account.plaid_account_id: account
+            for account in BankAccount.query.filter(
+                BankAccount.plaid_account_id.in_(plaid_account_ids)
+            ).execution_options(populate_existing=True)
+        }
         
+        created, updated, reactivated = [], [], []
+        for row in rows:
+            account_id = accounts[row['plaid_account_id']].id
+            before = existing.get(row['plaid_account_id'])
+            if before is None:
+                created.append(account_id)
+            elif not before.is_active:
+                reactivated.append(account_id)
+            elif any(getattr(before, column) != row[column] for column in ACCOUNT_DETAIL_COLUMNS):
+                updated.append(account_id)
+        
+        # A purged account is back: its history has to be fetched again
+        if any(before.purged_at for before in existing.values()):
+            db.session.execute(
+                update(PlaidItem)
+                .where(PlaidItem.plaid_item_id == item_id)
+                .values(history_complete_through=None, backfill_status='pending')
+            )
+        superseded = relink.supersede(user_id, item_id, created)
+        data_version.bump(user_id)
         db.session.commit()
-        return saved_accounts
+        
+        # Before the new item's first sync, which claims the fingerprinted rows
+        for old_account_id in superseded:
+            relink.fingerprint_history(old_account_id)
+        
+        return {
+            'accounts': [accounts[plaid_account_id] for plaid_account_id in plaid_account_ids],
+            'created': created,
+            'updated': updated,
+            'reactivated': reactivated,
+            'superseded': superseded
+        }
+    
+    def _upsert_accounts(self, rows, existing):
+        """
+        Insert new accounts and refresh existing ones in one statement
+        
+        An existing account keeps its owner, item and access token; only its
+        details, balances and status are overwritten.
+        """
+        overwritten = ACCOUNT_DETAIL_COLUMNS + ('is_active', 'deactivated_at', 'purged_at', 'last_synced_at',
+                                                'updated_at')
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            stmt = (pg_insert if dialect == 'postgresql' else sqlite_insert)(BankAccount.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['plaid_account_id'],
+                set_={column: stmt.excluded[column] for column in overwritten}
+            )
+            db.session.execute(stmt, rows)
+            return
+        
+        new_rows = [row for row in rows if row['plaid_account_id'] not in existing]
+        if new_rows:
+            db.session.execute(insert(BankAccount), new_rows)
+        changed_rows = [row for row in rows if row['plaid_account_id'] in existing]
+        if changed_rows:
+            db.session.execute(
+                update(BankAccount.__table__)
+                .where(BankAccount.plaid_account_id == bindparam('b_plaid_account_id'))
+                .values({column: bindparam(f'b_{column}') for column in overwritten}),
+                [
+                    {f'b_{column}': row[column] for column in overwritten + ('plaid_account_id',)}
+                    for row in changed_rows
+                ]
+            )
     
-    def sync_and_save_transactions(self, bank_account):
+    @on_primary
+    def refresh_balances(self, item):
+        """
+        Fetch current balances for all of an item's accounts
+        
+        One /accounts/get call per item; balances that changed are written
+        with a single executemany UPDATE.
+        
+        Returns:
+            dict with 'success' and 'updated' (accounts whose balances
+            changed), or 'error'
         """
-        Sync and save transactions for a bank account
+        blocked = self._blocked_result(item)
+        if blocked:
+            item.balances_claimed_at = None
+            db.session.commit()
+            return blocked
+        
+        accounts_result = self.get_accounts(item.plaid_access_token)
+        if not accounts_result['success']:
+            item.balances_claimed_at = None
+            db.session.commit()
+            self._record_health(item, accounts_result)
+            return accounts_result
+        
+        stored = {
+            plaid_account_id: (current, available, limit)
+            for plaid_account_id, current, available, limit in db.session.execute(
+                select(BankAccount.plaid_account_id, BankAccount.current_balance,
+                       BankAccount.available_balance, BankAccount.credit_limit)
+                .where(BankAccount.plaid_item_id == item.plaid_item_id)
+            )
+        }
+        now = datetime.utcnow()
+        params = []
+        for account in accounts_result['accounts']:
+            balances = account.get('balances', {})
+            values = (balances.get('current'), balances.get('available'), balances.get('limit'))
+            if account['account_id'] in stored and stored[account['account_id']] != values:
+                params.append({
+                    'b_plaid_account_id': account['account_id'],
+                    'b_current_balance': values[0],
+                    'b_available_balance': values[1],
+                    'b_credit_limit': values[2],
+                    'b_updated_at': now,
+                })
+        
+        if params:
+            db.session.execute(
+                update(BankAccount.__table__)
+                .where(BankAccount.plaid_account_id == bindparam('b_plaid_account_id'))
+                .values(
+                    current_balance=bindparam('b_current_balance'),
+                    available_balance=bindparam('b_available_balance'),
+                    credit_limit=bindparam('b_credit_limit'),
+                    updated_at=bindparam('b_updated_at'),
+                ),
+                params
+            )
+        item.balances_refreshed_at = now
+        item.balances_claimed_at = None
+        # Balances and their as-of time are both in the API responses
+        data_version.bump(item.user_id)
+        self._publish(item, 'balances_refreshed', changed=len(params))
+        db.session.commit()
+        
+        result = {'success': True, 'updated': len(params)}
+        self._record_health(item, result)
+        return result
+    
+    @on_primary
+    def sync_and_save_transactions(self, bank_account, lease_owner=None):
+        """
+        Sync and save transactions for a bank account's item
+        
+        This is the interactive path (button clicks, scheduled refreshes). It
+        pauses any running history backfill until it finishes. While an item's
+        history is still being backfilled only the recent window is refreshed;
+        the backfill establishes the sync cursor once it reaches the horizon.
+        Balances are refreshed after a successful sync.
+        
+        The item's sync lease is held throughout, so a sync that overlaps
+        another one on the same item returns an 'in_progress' result instead
+        of applying the same pages twice.
         
         Args:
             bank_account: BankAccount object
+            lease_owner: Owner of a lease the caller already holds on the
+                item (the scheduler); otherwise one is taken for this call
             
         Returns:
             dict with sync statistics
         """
-        cursor = None  # For full sync; could store cursor for incremental
-        has_more = True
+        item = self.item_for_account(bank_account)
+        blocked = self._blocked_result(item)
+        if blocked:
+            return blocked
+        
+        def sync(owner):
+            with backfill_worker.interactive():
+                if not item.history_complete:
+                    return self.ingest_recent(item, lease_owner=owner)
+                return self.sync_item(item, lease_owner=owner)
+        
+        result = self._leased(item, lease_owner, sync)
+        self._record_health(item, result)
+        if result['success']:
+            # A sync is when users expect to see new balances too
+            result['balances_updated'] = self.refresh_balances(item).get('updated', 0)
+        return result
+    
+    @on_primary
+    def sync_item(self, item, before_page=None, lease_owner=None):
+        """
+        Apply /transactions/sync pages for an item from its stored cursor
+        
+        Pages are fetched on a background thread while the previous page is
+        written, through a bounded queue so memory stays flat regardless of
+        history size. Each page is applied with set-based statements and
+        committed together with the cursor that follows it, so an interrupted
+        sync resumes where it stopped. The item's sync lease is renewed
+        before every page.
+        
+        Args:
+            item: PlaidItem object
+            before_page: Optional callable run before each page is written
+            lease_owner: Owner of a lease the caller already holds on the
+                item; otherwise one is taken for this call
+            
+        Returns:
+            dict with sync statistics
+        """
+        return self._leased(item, lease_owner, lambda owner: self._apply_sync_pages(item, owner, before_page))
+    
+    def _apply_sync_pages(self, item, lease_owner, before_page):
         added_count = 0
         modified_count = 0
         removed_count = 0
         
-        while has_more:
-            result = self.sync_transactions(bank_account.plaid_access_token, cursor)
+        # transactions/sync returns every account on the item, so route each
+        # row to its own BankAccount
+        item_accounts, default_account_id = self._item_account_ids(item)
+        
+        self._publish(item, 'sync_started', kind='sync')
+        db.session.commit()
+        
+        pages = self._iter_sync_pages(item.plaid_access_token, item.sync_cursor, item_accounts, default_account_id)
+        for page_number, page in enumerate(pages, 1):
+            if not page['success']:
+                return self._sync_failed(item, page)
+            
+            if before_page:
+                before_page()
+            sync_leases.renew(item.id, lease_owner)
             
+            self._insert_transactions(page['added'], item.user_id)
+            self._update_transactions(page['modified'], item.user_id)
+            self._remove_transactions(page['removed'], item.user_id)
+            if page['added'] or page['modified'] or page['removed']:
+                data_version.bump(item.user_id)
+            item.sync_cursor = page['next_cursor']
+            self._publish(item, 'sync_page', page=page_number, added=len(page['added']),
+                          modified=len(page['modified']), removed=len(page['removed']))
+            db.session.commit()
+            
+            added_count += len(page['added'])
+            modified_count += len(page['modified'])
+            removed_count += len(page['removed'])
+        
+        result = {
+            'success': True,
+            'added': added_count,
+            'modified': modified_count,
+            'removed': removed_count
+        }
+        self._publish(item, 'sync_completed', kind='sync', added=added_count,
+                      modified=modified_count, removed=removed_count)
+        self._mark_item_synced(item)
+        
+        return result
+    
+    @on_primary
+    def ingest_recent(self, item, days=None, lease_owner=None):
+        """
+        Ingest the last `days` days via /transactions/get
+        
+        Used right after linking so the dashboard has data immediately, and
+        to refresh recent activity while older history is still backfilling.
+        Holds the item's sync lease like sync_item().
+        """
+        return self._leased(item, lease_owner, lambda owner: self._ingest_recent(item, days))
+    
+    def _ingest_recent(self, item, days):
+        days = days or current_app.config['PLAID_INITIAL_DAYS']
+        today = date.today()
+        start = today - timedelta(days=days)
+        
+        self._publish(item, 'sync_started', kind='recent')
+        db.session.commit()
+        
+        def on_page(page_number, ingested):
+            self._publish(item, 'sync_page', page=page_number, added=ingested, modified=0, removed=0)
+        
+        result = self.ingest_date_range(item, start, today, on_page=on_page)
+        if not result['success']:
+            return self._sync_failed(item, result)
+        
+        if item.history_complete_through is None or item.history_complete_through > start:
+            item.history_complete_through = start
+        self._publish(item, 'sync_completed', kind='recent', added=result['ingested'], modified=0, removed=0,
+                      history_complete_through=item.history_complete_through.isoformat())
+        self._mark_item_synced(item)
+        
+        return {
+            'success': True,
+            'added': result['ingested'],
+            'modified': 0,
+            'removed': 0
+        }
+    
+    @on_primary
+    def ingest_date_range(self, item, start_date, end_date, on_page=None):
+        """
+        Upsert every transaction in a date range, one page per statement
+        
+        on_page(page_number, rows) runs inside each page's transaction.
+        
+        Returns:
+            dict with 'success' and 'ingested' count, or 'error'
+        """
+        page_size = current_app.config['PLAID_SYNC_PAGE_SIZE']
+        item_accounts, default_account_id = self._item_account_ids(item)
+        offset = 0
+        ingested = 0
+        page_number = 0
+        
+        while True:
+            result = self.get_transactions(item.plaid_access_token, start_date, end_date, offset, page_size)
             if not result['success']:
-                return {
-                    'success': False,
-                    'error': result['error']
-                }
+                db.session.rollback()
+                return result
             
-            # Process added transactions
-            for tx in result['added']:
-                self._save_transaction(bank_account.id, tx)
-                added_count += 1
+            rows = self._transaction_rows(result['transactions'], item_accounts, default_account_id)
+            self._insert_transactions(rows, item.user_id, update_existing=True)
+            if rows:
+                data_version.bump(item.user_id)
+            page_number += 1
+            if on_page:
+                on_page(page_number, len(rows))
+            db.session.commit()
             
-            # Process modified transactions
-            for tx in result['modified']:
-                self._update_transaction(tx)
-                modified_count += 1
+            # Paging follows Plaid's rows, including any dropped for removed accounts
+            offset += len(result['transactions'])
+            ingested += len(rows)
+            if not result['transactions'] or offset >= result['total_transactions']:
+                break
+        
+        return {
+            'success': True,
+            'ingested': ingested
+        }
+    
+    @on_primary
+    def backfill_item(self, item_id, before_chunk=None):
+        """
+        Backfill an item's history in chunks, newest first
+        
+        Each chunk advances history_complete_through, so the UI can show how
+        far back data is complete. Once the horizon is reached a full
+        /transactions/sync pass establishes the cursor for incremental syncs.
+        
+        Args:
+            item_id: PlaidItem id
+            before_chunk: Optional callable run before each chunk (used to
+                yield to interactive syncs)
+                
+        Returns:
+            dict with 'success', or None if another worker owns the backfill
+        """
+        item = db.session.get(PlaidItem, item_id)
+        if item is None or self._blocked_result(item) or not self._claim_backfill(item_id):
+            return None
+        db.session.refresh(item)
+        config = current_app.config
+        horizon = date.today() - timedelta(days=config['PLAID_HISTORY_DAYS'])
+        chunk_days = config['PLAID_BACKFILL_CHUNK_DAYS']
+        
+        # Each step holds the item's sync lease, waiting for any sync that
+        # has it, and gives it up between chunks so syncs can run meanwhile
+        if item.history_complete_through is None:
+            result = self._leased(item, None, lambda owner: self.ingest_recent(item, lease_owner=owner),
+                                 wait=True)
+            if not result['success']:
+                return self._release_backfill(item, result)
+        
+        while item.history_complete_through > horizon:
+            if before_chunk:
+                before_chunk()
             
-            # Process removed transactions
-            for tx_id in result['removed']:
-                self._remove_transaction(tx_id)
-                removed_count += 1
+            chunk_end = item.history_complete_through - timedelta(days=1)
+            chunk_start = max(horizon, chunk_end - timedelta(days=chunk_days - 1))
+            result = self._leased(item, None, lambda owner: self.ingest_date_range(
+                item, chunk_start, chunk_end, on_page=lambda *page: sync_leases.renew(item.id, owner)
+            ), wait=True)
+            if result.get('in_progress'):
+                return self._release_backfill(item, result)
+            if not result['success']:
+                return self._release_backfill(item, self._sync_failed(item, result))
             
-            cursor = result['next_cursor']
-            has_more = result['has_more']
+            item.history_complete_through = chunk_start
+            item.backfill_claimed_at = datetime.utcnow()  # heartbeat for the stale-claim check
+            self._publish(item, 'backfill_progress', history_complete_through=chunk_start.isoformat())
+            db.session.commit()
         
-        # Update last synced timestamp
-        bank_account.last_synced_at = datetime.utcnow()
+        result = self._leased(item, None, lambda owner: self.sync_item(item, before_chunk, lease_owner=owner),
+                              wait=True)
+        if not result['success']:
+            return self._release_backfill(item, result)
+        
+        item.backfill_status = 'complete'
+        item.backfill_claimed_at = None
+        self._clear_error(item)
+        self._publish(item, 'backfill_completed', history_complete_through=item.history_complete_through.isoformat())
+        db.session.commit()
+        return {'success': True}
+    
+    def _claim_backfill(self, item_id):
+        """Atomically take ownership of a pending (or abandoned) backfill"""
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=current_app.config['PLAID_BACKFILL_STALE_SECONDS'])
+        claimed = PlaidItem.query.filter(
+            PlaidItem.id == item_id,
+            or_(
+                PlaidItem.backfill_status == 'pending',
+                and_(PlaidItem.backfill_status == 'running', PlaidItem.backfill_claimed_at < stale)
+            )
+        ).update({'backfill_status': 'running', 'backfill_claimed_at': now}, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+    
+    def _release_backfill(self, item, result):
+        """Hand a failed backfill back to the queue for a later attempt"""
+        db.session.rollback()
+        item.backfill_status = 'pending'
+        item.backfill_claimed_at = None
         db.session.commit()
+        self._record_health(item, result)
+        logger.warning(f"Backfill for item {item.plaid_item_id} paused: {result.get('error')}")
+        return result
+    
+    @staticmethod
+    def _api_error(e, action):
+        """Log a Plaid ApiException and return a failure dict carrying Plaid's error code"""
+        logger.error(f"Error {action}: {e}")
+        error_type = error_code = None
+        try:
+            body = json.loads(e.body)
+            error_type = body.get('error_type')
+            error_code = body.get('error_code')
+        except (TypeError, ValueError, AttributeError):
+            pass
+        return {
+            'success': False,
+            'error': str(e),
+            'error_type': error_type,
+            'error_code': error_code
+        }
+    
+    @staticmethod
+    def _unavailable(e, action):
+        """
+        Failure dict for a call that timed out or was refused by the breaker
         
+        Refused calls never reached Plaid, so they are flagged 'skipped' and
+        don't count against the item's health.
+        """
+        logger.error(f"Plaid unavailable while {action}: {e}")
         return {
-            'success': True,
-            'added': added_count,
-            'modified': modified_count,
-            'removed': removed_count
+            'success': False,
+            'skipped': isinstance(e, DependencyUnavailable),
+            'error': str(e),
+            'error_type': 'API_ERROR',
+            'error_code': 'PLAID_UNAVAILABLE'
+        }
+    
+    def _leased(self, item, lease_owner, sync, wait=False):
+        """
+        Run sync(owner) while holding the item's sync lease
+        
+        With lease_owner the caller already holds the lease and keeps it;
+        otherwise it is taken for this call and released afterwards. While
+        another sync holds it an 'in_progress' result is returned without
+        running sync, after waiting up to SYNC_LEASE_SECONDS for it if wait
+        is set. A lease lost mid-sync ends the sync the same way.
+        """
+        owner = lease_owner or sync_leases.new_owner()
+        if lease_owner is None:
+            deadline = time.monotonic() + current_app.config['SYNC_LEASE_SECONDS']
+            while not sync_leases.acquire(item.id, item.institution_name, owner):
+                if not wait or time.monotonic() >= deadline:
+                    return self._in_progress_result(item)
+                time.sleep(LEASE_WAIT_SECONDS)
+        try:
+            return sync(owner)
+        except sync_leases.LeaseLost:
+            db.session.rollback()
+            logger.warning(f"Lost the sync lease on item {item.plaid_item_id}; leaving it to the new holder")
+            return self._in_progress_result(item)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if lease_owner is None:
+                sync_leases.release(item.id, owner)
+    
+    @staticmethod
+    def _in_progress_result(item):
+        """Result for a sync that didn't run because another one holds the item"""
+        return {
+            'success': False,
+            'skipped': True,
+            'in_progress': True,
+            'error': f'A sync of {item.institution_name} is already in progress'
         }
     
-    def _save_transaction(self, account_id, tx_data):
-        """Save a new transaction to database"""
-        # Check if transaction already exists
-        existing = Transaction.query.filter_by(
-            plaid_transaction_id=tx_data['transaction_id']
-        ).first()
+    def _blocked_result(self, item):
+        """Failure dict for an item that must not call Plaid right now, else None"""
+        if item.error_state == 'relink_required':
+            return {
+                'success': False,
+                'skipped': True,
+                'error': f'Item needs to be relinked ({item.error_code})',
+                'error_code': item.error_code,
+                'error_state': item.error_state
+            }
+        if item.error_state == 'backoff' and item.retry_after and item.retry_after > datetime.utcnow():
+            return {
+                'success': False,
+                'skipped': True,
+                'error': f'Backing off after {item.failure_count} failures until {item.retry_after.isoformat()}',
+                'error_code': item.error_code,
+                'error_state': item.error_state,
+                'retry_after': item.retry_after.isoformat()
+            }
+        return None
+    
+    def _record_health(self, item, result):
+        """
+        Update an item's error state from a sync result
         
-        if existing:
-            return existing
+        Login and credential errors block the item until it is relinked;
+        anything else backs off exponentially from PLAID_ERROR_BACKOFF_SECONDS.
+        """
+        if result.get('skipped'):
+            return
+        
+        now = datetime.utcnow()
+        if result['success']:
+            if item.error_state:
+                self._clear_error(item)
+                db.session.commit()
+            return
+        
+        error_code = result.get('error_code')
+        item.failure_count = (item.failure_count or 0) + 1
+        item.first_failed_at = item.first_failed_at or now
+        item.last_failed_at = now
+        item.error_code = error_code
+        item.error_message = (result.get('error') or '')[:1000]
+        if error_code in RELINK_ERROR_CODES:
+            item.error_state = 'relink_required'
+            item.retry_after = None
+        else:
+            config = current_app.config
+            delay = min(config['PLAID_ERROR_BACKOFF_SECONDS'] * 2 ** min(item.failure_count - 1, 20),
+                        config['PLAID_ERROR_BACKOFF_MAX_SECONDS'])
+            item.error_state = 'backoff'
+            item.retry_after = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+        db.session.commit()
+        result['error_state'] = item.error_state
+    
+    @staticmethod
+    def _clear_error(item):
+        item.error_state = None
+        item.error_code = None
+        item.error_message = None
+        item.failure_count = 0
+        item.first_failed_at = None
+        item.last_failed_at = None
+        item.retry_after = None
+    
+    @on_primary
+    def mark_item_relinked(self, item):
+        """Clear an item's error state after the user completed Link update mode"""
+        self._clear_error(item)
+        db.session.commit()
+    
+    def _publish(self, item, event_name, **data):
+        """Queue a sync event for the item's owner (sent when the caller commits)"""
+        sync_events.publish(item.user_id, event_name, item_id=item.plaid_item_id,
+                            institution_name=item.institution_name, **data)
+    
+    def _sync_failed(self, item, failure):
+        db.session.rollback()
+        self._publish(item, 'sync_failed', error=failure['error'], error_code=failure.get('error_code'))
+        db.session.commit()
+        return {
+            'success': False,
+            'skipped': failure.get('skipped', False),
+            'error': failure['error'],
+            'error_code': failure.get('error_code')
+        }
+    
+    def _item_account_ids(self, item):
+        """
+        Map of plaid_account_id -> BankAccount.id for an item, and the
+        account that rows for unknown accounts fall back to
         
-        # Parse categories - handle None or empty list
-        categories = tx_data.get('category') or []
-        primary_cat = categories[0] if categories and len(categories) > 0 else None
-        detailed_cat = categories[1] if categories and len(categories) > 1 else None
+        Removed accounts map to None, so their transactions are dropped.
+        """
+        item_accounts = {
+            plaid_account_id: account_id if is_active else None
+            for plaid_account_id, account_id, is_active in db.session.query(
+                BankAccount.plaid_account_id, BankAccount.id, BankAccount.is_active
+            ).filter(BankAccount.plaid_item_id == item.plaid_item_id).order_by(BankAccount.id)
+        }
+        default_account_id = next((account_id for account_id in item_accounts.values() if account_id), None)
+        return item_accounts, default_account_id
+    
+    def _mark_item_synced(self, item):
+        db.session.query(BankAccount).filter(
+            BankAccount.plaid_item_id == item.plaid_item_id
+        ).update({'last_synced_at': datetime.utcnow()}, synchronize_session='fetch')
+        sync_events.prune(item.user_id)
+        db.session.commit()
+    
+    def _iter_sync_pages(self, access_token, cursor, item_accounts, default_account_id):
+        """
+        Yield converted transactions/sync pages, prefetching ahead of the caller
         
-        # Parse date
-        tx_date = tx_data.get('date')
+        A producer thread keeps up to PLAID_SYNC_PREFETCH_PAGES pages queued, so
+        the next network round trip overlaps with writing the current page.
+        Pages are decoded straight from JSON and converted to row tuples on the
+        producer side, so no Plaid model or ORM objects are ever built.
+        """
+        app = current_app._get_current_object()
+        page_size = app.config['PLAID_SYNC_PAGE_SIZE']
+        pages = queue.Queue(maxsize=max(app.config['PLAID_SYNC_PREFETCH_PAGES'], 1))
+        stop = threading.Event()
+        client = self.client  # initialize on this thread, with the app context
+        
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce():
+            next_cursor = cursor
+            with app.app_context():
+                try:
+                    has_more = True
+                    while has_more and not stop.is_set():
+                        result = self.sync_transactions(access_token, next_cursor, count=page_size, raw=True)
+                        if not result['success']:
+                            put(result)
+                            return
+                        has_more = result['has_more']
+                        page = {
+                            'success': True,
+                            'added': self._transaction_rows(result['added'], item_accounts, default_account_id),
+                            'modified': self._transaction_rows(result['modified'], item_accounts,
+                                                               default_account_id),
+                            'removed': [tx['transaction_id'] for tx in result['removed']],
+                            'next_cursor': result['next_cursor'],
+                        }
+                        del result
+                        if not put(page):
+                            return
+                        next_cursor = page['next_cursor']
+                except Exception as e:
+                    logger.exception("Transaction sync producer failed")
+                    put({'success': False, 'error': str(e)})
+                finally:
+                    put(None)
+        
+        # Run in a copy of this context so the request deadline applies to prefetching too
+        producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                                    name='plaid-sync-prefetch', daemon=True)
+        producer.start()
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                yield page
+                if not page['success']:
+                    return
+        finally:
+            stop.set()
+            producer.join(timeout=5)
+    
+    def _transaction_rows(self, transactions, item_accounts, default_account_id):
+        """Row tuples for Plaid transactions, leaving out those of removed accounts"""
+        rows = (self._transaction_row(tx, item_accounts, default_account_id) for tx in transactions)
+        return [row for row in rows if row[0] is not None]
+    
+    @staticmethod
+    def _transaction_row(tx, item_accounts, default_account_id):
+        """Convert a Plaid transaction into a row tuple ordered as TRANSACTION_COLUMNS"""
+        categories = tx.get('category') or []
+        
+        tx_date = tx.get('date')
         if isinstance(tx_date, str):
-            tx_date = datetime.strptime(tx_date, '%Y-%m-%d').date()
-        
-        transaction = Transaction(
-            account_id=account_id,
-            plaid_transaction_id=tx_data['transaction_id'],
-            name=tx_data['name'],
-            merchant_name=tx_data.get('merchant_name'),
-            amount=tx_data['amount'],
-            currency_code=tx_data.get('iso_currency_code', 'USD'),
-            category=', '.join(categories) if categories else None,
-            primary_category=primary_cat,
-            detailed_category=detailed_cat,
-            date=tx_date,
-            pending=tx_data.get('pending', False),
-            payment_channel=tx_data.get('payment_channel')
+            tx_date = date.fromisoformat(tx_date)
+        authorized_date = tx.get('authorized_date')
+        if isinstance(authorized_date, str):
+            authorized_date = date.fromisoformat(authorized_date)
+        
+        return (
+            item_accounts.get(tx.get('account_id'), default_account_id),
+            tx['transaction_id'],
+            tx['name'],
+            tx.get('merchant_name'),
+            tx['amount'],
+            tx.get('iso_currency_code') or 'USD',
+            ', '.join(categories) if categories else None,
+            categories[0] if categories else None,
+            categories[1] if len(categories) > 1 else None,
+            tx_date,
+            authorized_date,
+            tx.get('pending', False),
+            tx.get('payment_channel'),
         )
+    
+    def _insert_transactions(self, rows, user_id, update_existing=False):
+        """
+        Insert new transactions of a user, categorized by their rules
         
-        db.session.add(transaction)
-        db.session.commit()
-        return transaction
-    
-    def _update_transaction(self, tx_data):
-        """Update an existing transaction"""
-        transaction = Transaction.query.filter_by(
-            plaid_transaction_id=tx_data['transaction_id']
-        ).first()
-        
-        if transaction:
-            transaction.name = tx_data['name']
-            transaction.merchant_name = tx_data.get('merchant_name')
-            transaction.amount = tx_data['amount']
-            transaction.pending = tx_data.get('pending', False)
-            db.session.commit()
+        Ids that already exist are skipped, or overwritten with the incoming
+        values when update_existing is set (date-range refreshes, where a
+        pending transaction may have posted since it was stored). Both kinds
+        of change are recorded in the change log, and transfers between the
+        user's accounts are matched around the rows' dates. New rows that
+        duplicate a superseded account's transactions take those over and
+        update them (see app/utils/relink.py).
+        """
+        if not rows:
+            return
+        
+        params = [dict(zip(TRANSACTION_COLUMNS, row)) for row in rows]
+        categorization.apply(user_id, dictionary.encode(params))
+        transaction_ids = [p['plaid_transaction_id'] for p in params]
+        before = change_log.snapshot(transaction_ids)
+        claimed = relink.claim([p for p in params if p['plaid_transaction_id'] not in before])
+        if claimed:
+            before.update(change_log.snapshot(list(claimed)))
+        update_claimed = bool(claimed) and not update_existing
+        matching = [(p['amount'], p['date']) for p in params]
+        if update_existing:
+            matching += self._unpair_changed(before, params)
+        dialect = db.session.get_bind().dialect.name
+        # A partitioned table has no unique index on plaid_transaction_id alone
+        # for ON CONFLICT to use
+        if dialect in ('postgresql', 'sqlite') and not is_partitioned():
+            stmt = (pg_insert if dialect == 'postgresql' else sqlite_insert)(Transaction)
+            if update_existing:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['plaid_transaction_id'],
+                    set_={
+                        **{column: stmt.excluded[column] for column in UPDATABLE_COLUMNS},
+                        'updated_at': datetime.utcnow(),
+                    }
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=['plaid_transaction_id'])
+            db.session.execute(stmt, params)
+        else:
+            new_params = [p for p in params if p['plaid_transaction_id'] not in before]
+            if new_params:
+                db.session.execute(insert(Transaction), new_params)
+            if update_existing:
+                self._update_transactions(
+                    [row for row, p in zip(rows, params) if p['plaid_transaction_id'] in before], user_id, before
+                )
+                update_existing = False  # logged by _update_transactions
+        
+        created = change_log.snapshot([t for t in transaction_ids if t not in before])
+        changes = [change_log.inserted(row) for row in created.values()]
+        if update_existing:
+            changes += [change_log.updated(before[p['plaid_transaction_id']], p)
+                        for p in params if p['plaid_transaction_id'] in before]
+        change_log.record([change for change in changes if change])
+        if update_claimed:
+            self._update_transactions(
+                [row for row, p in zip(rows, params) if p['plaid_transaction_id'] in claimed], user_id, before
+            )
+        transfers.match(user_id, matching)
     
-    def _remove_transaction(self, transaction_id):
-        """Remove a transaction (mark as inactive or delete)"""
-        transaction = Transaction.query.filter_by(
-            plaid_transaction_id=transaction_id
-        ).first()
+    def _update_transactions(self, rows, user_id, before=None):
+        """
+        Apply a user's modified transactions in one executemany UPDATE
         
-        if transaction:
-            db.session.delete(transaction)
-            db.session.commit()
+        before is the rows' change_log.snapshot() if the caller already took it.
+        Rows whose amount or date changed leave their transfer pair and are
+        matched again.
+        """
+        if not rows:
+            return
+        
+        stmt = (
+            update(Transaction.__table__)
+            .where(Transaction.plaid_transaction_id == bindparam('b_plaid_transaction_id'))
+            .values({
+                **{column: bindparam(f'b_{column}') for column in UPDATABLE_COLUMNS},
+                'updated_at': bindparam('b_updated_at'),
+            })
+        )
+        modified = [dict(zip(TRANSACTION_COLUMNS, row)) for row in rows]
+        categorization.apply(user_id, dictionary.encode(modified))
+        if before is None:
+            before = change_log.snapshot([values['plaid_transaction_id'] for values in modified])
+        matching = self._unpair_changed(before, modified)
+        now = datetime.utcnow()
+        params = []
+        changes = []
+        for values in modified:
+            param = {f'b_{column}': values[column] for column in UPDATABLE_COLUMNS}
+            param['b_plaid_transaction_id'] = values['plaid_transaction_id']
+            param['b_updated_at'] = now
+            params.append(param)
+            if values['plaid_transaction_id'] in before:
+                changes.append(change_log.updated(before[values['plaid_transaction_id']], values))
+        db.session.execute(stmt, params)
+        change_log.record([change for change in changes if change])
+        transfers.match(user_id, matching)
+    
+    def _remove_transactions(self, transaction_ids, user_id):
+        """Delete a user's removed transactions in one statement, re-matching their transfer partners"""
+        if not transaction_ids:
+            return
+        
+        before = change_log.snapshot(transaction_ids)
+        unpaired = transfers.unpair(row.id for row in before.values())
+        db.session.execute(
+            delete(Transaction.__table__).where(Transaction.plaid_transaction_id.in_(transaction_ids))
+        )
+        change_log.record([change_log.deleted(row) for row in before.values()])
+        if unpaired:
+            transfers.match(user_id, [(row.amount, row.date) for row in before.values()])
+    
+    @staticmethod
+    def _unpair_changed(before, values):
+        """
+        Unpair stored transactions whose amount or date the incoming values
+        change; returns (amount, date) of both versions, to match again
+        """
+        changed_ids = []
+        matching = []
+        for row in values:
+            stored = before.get(row['plaid_transaction_id'])
+            if stored is not None and (stored.amount, stored.date) != (row['amount'], row['date']):
+                changed_ids.append(stored.id)
+                matching += [(stored.amount, stored.date), (row['amount'], row['date'])]
+        transfers.unpair(changed_ids)
+        return matching
 
 
 # Singleton instance
@@ -0,0 +1,148 @@
+"""N+1 and slow-query detection
+
+Records every SQL statement executed while a QueryProfile is active. Enabled
+per request with QUERY_PROFILER=true, or directly in tests and scripts:
+
+    with profile_queries() as profile:
+        plaid_service.sync_and_save_transactions(account)
+    profile.assert_no_repeats()
+    profile.assert_max_queries(10)
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_active_profiles = ContextVar('active_query_profiles', default=())
+
+
+class QueryProfile:
+    """Statements captured while the profile was active"""
+
+    def __init__(self, repeat_threshold=5, slow_threshold_ms=100):
+        self.repeat_threshold = repeat_threshold
+        self.slow_threshold_ms = slow_threshold_ms
+        self.statements = []  # (sql, parameters, duration_ms)
+
+    def record(self, statement, parameters, duration_ms):
+        self.statements.append((statement, parameters, duration_ms))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_ms(self):
+        return sum(duration for _, _, duration in self.statements)
+
+    def repeated(self, threshold=None):
+        """
+        Statements whose SQL text ran at least `threshold` times.
+
+        Parameters are ignored on purpose: the same SELECT issued once per row
+        with a different id is exactly the N+1 pattern.
+        """
+        threshold = threshold or self.repeat_threshold
+        counts = {}
+        for sql, _, _ in self.statements:
+            counts[sql] = counts.get(sql, 0) + 1
+        return {sql: n for sql, n in counts.items() if n >= threshold}
+
+    def slow(self, threshold_ms=None):
+        """Statements that took longer than `threshold_ms`"""
+        threshold_ms = self.slow_threshold_ms if threshold_ms is None else threshold_ms
+        return [s for s in self.statements if s[2] >= threshold_ms]
+
+    def summary(self):
+        """Compact one-line summary, e.g. for a response header"""
+        return (f"queries={self.count}; time={self.total_ms:.1f}ms; "
+                f"repeated={len(self.repeated())}; slow={len(self.slow())}")
+
+    def assert_max_queries(self, limit):
+        assert self.count <= limit, f"Expected at most {limit} queries, ran {self.count}:\n{self._dump()}"
+
+    def assert_no_repeats(self, threshold=None):
+        repeats = self.repeated(threshold)
+        assert not repeats, "Repeated statements (possible N+1):\n" + '\n'.join(
+            f"  {n}x {_shorten(sql)}" for sql, n in repeats.items()
+        )
+
+    def _dump(self):
+        return '\n'.join(f"  {duration:.1f}ms {_shorten(sql)}" for sql, _, duration in self.statements)
+
+
+def _shorten(sql, limit=200):
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= limit else sql[:limit] + '...'
+
+
+@contextmanager
+def profile_queries(repeat_threshold=5, slow_threshold_ms=100):
+    """Capture statements executed in this thread/greenlet until the block exits"""
+    profile = QueryProfile(repeat_threshold, slow_threshold_ms)
+    token = _active_profiles.set(_active_profiles.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active_profiles.reset(token)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_profiles.get():
+        conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiles = _active_profiles.get()
+    starts = conn.info.get('profiler_start')
+    if not profiles or not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+    for profile in profiles:
+        profile.record(statement, parameters, duration_ms)
+
+
+def init_query_profiler(app):
+    """Profile every request and report N+1 patterns and slow statements"""
+    if not app.config.get('QUERY_PROFILER'):
+        return
+
+    repeat_threshold = app.config['QUERY_PROFILER_REPEAT_THRESHOLD']
+    slow_threshold_ms = app.config['QUERY_PROFILER_SLOW_MS']
+    add_header = app.config['QUERY_PROFILER_HEADER']
+
+    @app.before_request
+    def start_profile():
+        context = profile_queries(repeat_threshold, slow_threshold_ms)
+        g.query_profile = context.__enter__()
+        g.query_profile_context = context
+
+    @app.after_request
+    def report_profile(response):
+        profile = g.get('query_profile')
+        if profile is None:
+            return response
+
+        for sql, n in profile.repeated().items():
+            logger.warning(f"N+1 suspect on {request.path}: {n}x {_shorten(sql)}")
+        for sql, parameters, duration in profile.slow():
+            logger.warning(f"Slow query on {request.path} ({duration:.1f}ms): {_shorten(sql)} params={parameters!r}")
+
+        if add_header:
+            response.headers['X-Query-Profile'] = profile.summary()
+        return response
+
+    @app.teardown_request
+    def end_profile(exc):
+        context = g.pop('query_profile_context', None)
+        if context is not None:
+            context.__exit__(None, None, None)
+            g.pop('query_profile', None)
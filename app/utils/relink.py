@@ -0,0 +1,352 @@
+"""Relinked items: recognising the same accounts and transactions again
+
+Linking a bank the user has already linked creates a new Plaid item, whose
+accounts and transactions come with new Plaid ids. Stored as they arrive,
+every account would show up twice and every transaction would be counted
+twice.
+
+An account is recognised by its fingerprint: institution, mask and account
+type, looked up through ix_bank_accounts_fingerprint. When exactly one
+active account of the user on another item has the same fingerprint as a
+newly created one, the old account is superseded (supersede()). It is
+deactivated, so reads drop it at once, superseded_by_id points at its
+successor, and categorization rules scoped to it move to the successor.
+Its transactions get their own fingerprint: a 64-bit hash of date, amount
+and name, stored only on these rows and indexed by
+ix_transactions_account_id_fingerprint.
+
+As the new item's sync writes its transactions, each one claims an old row
+with the same fingerprint (claim()). The old row takes the new Plaid id and
+moves to the new account, keeping its id, rule category and transfer pair,
+and the incoming row updates it instead of being inserted. Once the new
+item's history backfill is complete, merge_pending() settles what is left
+in bulk, a batch at a time:
+
+- old rows dated within the history the new item covers were not sent
+  again (removed, or changed beyond recognition), so they are superseded:
+  deleted, and logged to the change log
+- older rows are moved to the new account, logged to the change log as
+  updates
+- the old account is marked purged, so once its item has no other active
+  accounts it is revoked at Plaid (see app/utils/account_purge.py)
+
+    flask relink status
+    flask relink merge
+"""
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import select, update, delete, func, bindparam, or_
+from sqlalchemy.orm import aliased
+
+from app.models import db, BankAccount, CategoryRule, PlaidItem, Transaction
+from app.utils import categorization, change_log, data_version, transfers
+from app.utils.partitions import transaction_tables
+
+logger = logging.getLogger(__name__)
+
+
+def account_fingerprint(account):
+    """Fingerprint of an account (row or dict-like with the BankAccount columns), or None without a mask"""
+    if not account.mask:
+        return None
+    return account.institution_name, account.mask, account.account_type
+
+
+def transaction_fingerprint(tx_date, amount, name):
+    """Signed 64-bit hash of a transaction's date, amount in cents and name"""
+    key = f"{tx_date.isoformat()}|{round(amount * 100)}|{' '.join((name or '').lower().split())}"
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+def supersede(user_id, item_id, account_ids):
+    """
+    Supersede the user's accounts on other items that the new accounts
+    duplicate (in the caller's transaction)
+
+    Returns:
+        dict of superseded account id -> new account id
+    """
+    if not account_ids:
+        return {}
+    columns = (BankAccount.id, BankAccount.institution_name, BankAccount.mask, BankAccount.account_type)
+    new_by_fingerprint = defaultdict(list)
+    for account in db.session.execute(select(*columns).where(BankAccount.id.in_(account_ids))):
+        fingerprint = account_fingerprint(account)
+        if fingerprint is not None:
+            new_by_fingerprint[fingerprint].append(account.id)
+    if not new_by_fingerprint:
+        return {}
+
+    old_by_fingerprint = defaultdict(list)
+    for account in db.session.execute(
+        select(*columns).where(
+            BankAccount.user_id == user_id,
+            BankAccount.plaid_item_id != item_id,
+            BankAccount.is_active.is_(True),
+            BankAccount.mask.in_({fingerprint[1] for fingerprint in new_by_fingerprint}),
+        )
+    ):
+        fingerprint = account_fingerprint(account)
+        if fingerprint in new_by_fingerprint:
+            old_by_fingerprint[fingerprint].append(account.id)
+
+    superseded = {}
+    now = datetime.utcnow()
+    for fingerprint, old_ids in old_by_fingerprint.items():
+        new_ids = new_by_fingerprint[fingerprint]
+        # Two accounts with the same fingerprint on one side can't be told apart
+        if len(old_ids) != 1 or len(new_ids) != 1:
+            logger.warning(f"User {user_id} has several {fingerprint} accounts; not merging them")
+            continue
+        old_id, new_id = old_ids[0], new_ids[0]
+        # Accounts the old one had superseded pass to its successor
+        db.session.execute(
+            update(BankAccount).where(BankAccount.superseded_by_id == old_id).values(superseded_by_id=new_id)
+        )
+        db.session.execute(
+            update(BankAccount)
+            .where(BankAccount.id == old_id)
+            .values(superseded_by_id=new_id, is_active=False, deactivated_at=now)
+        )
+        superseded[old_id] = new_id
+    # Rules scoped to an old account apply to its successor
+    moved_rules = 0
+    for old_id, new_id in superseded.items():
+        moved_rules += db.session.execute(
+            update(CategoryRule).where(CategoryRule.account_id == old_id).values(account_id=new_id)
+        ).rowcount
+    if moved_rules:
+        categorization.invalidate(user_id)
+    return superseded
+
+
+def fingerprint_history(account_id, batch_size=None):
+    """
+    Fingerprint a superseded account's transactions, a batch per transaction
+
+    Returns:
+        number of transactions fingerprinted
+    """
+    batch_size = batch_size or current_app.config['RELINK_MERGE_BATCH_SIZE']
+    table = Transaction.__table__
+    fingerprinted = 0
+    after_id = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.date, table.c.amount, table.c.name)
+            .where(table.c.account_id == account_id, table.c.id > after_id, table.c.fingerprint.is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return fingerprinted
+        # date is the partition key: it lets Postgres go straight to the right partition
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('b_id'), table.c.date == bindparam('b_date'))
+            .values(fingerprint=bindparam('b_fingerprint')),
+            [{'b_id': row.id, 'b_date': row.date,
+              'b_fingerprint': transaction_fingerprint(row.date, row.amount, row.name)} for row in rows]
+        )
+        db.session.commit()
+        fingerprinted += len(rows)
+        after_id = rows[-1].id
+
+
+def claim(rows):
+    """
+    Hand rows of superseded accounts over to the incoming transaction rows
+    that duplicate them (in the caller's transaction)
+
+    Args:
+        rows: new transaction row dicts, none of whose Plaid ids is stored
+
+    Returns:
+        Plaid ids of the rows that claimed a stored transaction
+    """
+    if not rows:
+        return set()
+    account_ids = {row['account_id'] for row in rows}
+    predecessors = defaultdict(list)
+    for old_id, new_id in db.session.execute(
+        select(BankAccount.id, BankAccount.superseded_by_id)
+        .where(BankAccount.superseded_by_id.in_(account_ids), BankAccount.purged_at.is_(None))
+    ):
+        predecessors[new_id].append(old_id)
+    if not predecessors:
+        return set()
+
+    incoming = [row for row in rows if row['account_id'] in predecessors]
+    fingerprints = {
+        row['plaid_transaction_id']: transaction_fingerprint(row['date'], row['amount'], row['name'])
+        for row in incoming
+    }
+    # Same-day purchases of the same amount share a fingerprint: each claims one
+    candidates = defaultdict(list)
+    for stored in db.session.execute(
+        select(Transaction.id, Transaction.date, Transaction.account_id, Transaction.fingerprint)
+        .where(Transaction.account_id.in_([old_id for old_ids in predecessors.values() for old_id in old_ids]),
+               Transaction.fingerprint.is_not(None),  # the partial index's condition
+               Transaction.fingerprint.in_(set(fingerprints.values())))
+        .order_by(Transaction.id)
+    ):
+        candidates[stored.account_id, stored.fingerprint].append(stored)
+
+    params = []
+    for row in incoming:
+        fingerprint = fingerprints[row['plaid_transaction_id']]
+        for old_id in predecessors[row['account_id']]:
+            if candidates.get((old_id, fingerprint)):
+                stored = candidates[old_id, fingerprint].pop(0)
+                params.append({'b_id': stored.id, 'b_date': stored.date, 'b_account_id': row['account_id'],
+                               'b_plaid_transaction_id': row['plaid_transaction_id']})
+                break
+    if params:
+        db.session.execute(
+            update(Transaction.__table__)
+            .where(Transaction.id == bindparam('b_id'), Transaction.date == bindparam('b_date'))
+            .values(account_id=bindparam('b_account_id'), plaid_transaction_id=bindparam('b_plaid_transaction_id'),
+                    fingerprint=None),
+            params
+        )
+    return {param['b_plaid_transaction_id'] for param in params}
+
+
+def _supersede_batch(account_id, user_id, covered_from, batch_size):
+    """Delete up to batch_size of an old account's rows the new item covered; returns how many"""
+    table = Transaction.__table__
+    rows = db.session.execute(
+        select(table.c.plaid_transaction_id, table.c.id, table.c.account_id, BankAccount.user_id,
+               table.c.amount, table.c.date, table.c.primary_category)
+        .join(BankAccount, BankAccount.id == table.c.account_id)
+        .where(table.c.account_id == account_id, table.c.date >= covered_from)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+    unpaired = transfers.unpair(row.id for row in rows)
+    db.session.execute(delete(table).where(table.c.id.in_([row.id for row in rows])))
+    change_log.record([change_log.deleted(row) for row in rows])
+    if unpaired:
+        transfers.match(user_id, [(row.amount, row.date) for row in rows])
+    data_version.bump(user_id)
+    db.session.commit()
+    return len(rows)
+
+
+def _move_batch(table, account_id, new_account_id, user_id, batch_size):
+    """Move up to batch_size of an old account's rows to its successor; returns how many"""
+    rows = db.session.execute(
+        select(table.c.plaid_transaction_id, table.c.id, table.c.account_id, BankAccount.user_id,
+               table.c.amount, table.c.date, table.c.primary_category)
+        .join(BankAccount, BankAccount.id == table.c.account_id)
+        .where(table.c.account_id == account_id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+    db.session.execute(
+        update(table)
+        .where(table.c.id.in_([row.id for row in rows]))
+        .values(account_id=new_account_id, fingerprint=None)
+    )
+    change_log.record([change_log.moved(row, new_account_id) for row in rows])
+    data_version.bump(user_id)
+    db.session.commit()
+    return len(rows)
+
+
+def merge(account_id, batch_size=None):
+    """
+    Settle a superseded account: delete the rows its successor's item
+    covered without claiming them, move the rest to the successor, and
+    mark the account purged
+
+    Returns:
+        dict with counts of transactions 'superseded' and 'moved'
+    """
+    batch_size = batch_size or current_app.config['RELINK_MERGE_BATCH_SIZE']
+    old = db.session.get(BankAccount, account_id)
+    new = db.session.get(BankAccount, old.superseded_by_id)
+    item = PlaidItem.query.filter_by(plaid_item_id=new.plaid_item_id).first()
+    covered_from = item.history_complete_through if item is not None and new.is_active else None
+    user_id = old.user_id
+
+    superseded = moved = 0
+    if covered_from is not None:
+        while True:
+            count = _supersede_batch(account_id, user_id, covered_from, batch_size)
+            if not count:
+                break
+            superseded += count
+    for table in transaction_tables():
+        while True:
+            count = _move_batch(table, account_id, new.id, user_id, batch_size)
+            if not count:
+                break
+            moved += count
+
+    db.session.execute(
+        update(BankAccount).where(BankAccount.id == account_id).values(purged_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return {'superseded': superseded, 'moved': moved}
+
+
+def pending_merges():
+    """Superseded accounts ready to merge: their successor's item has its whole history, or is gone"""
+    successor = aliased(BankAccount)
+    return db.session.execute(
+        select(BankAccount.id)
+        .join(successor, successor.id == BankAccount.superseded_by_id)
+        .outerjoin(PlaidItem, PlaidItem.plaid_item_id == successor.plaid_item_id)
+        .where(
+            BankAccount.purged_at.is_(None),
+            or_(PlaidItem.backfill_status == 'complete', PlaidItem.id.is_(None), successor.is_active.is_(False)),
+        )
+        .order_by(BankAccount.id)
+    ).scalars().all()
+
+
+def merge_pending():
+    """Scheduler chore: merge superseded accounts that are ready"""
+    account_ids = pending_merges()
+    for account_id in account_ids:
+        result = merge(account_id)
+        logger.info(f"Merged superseded account {account_id}: {result['superseded']} transactions "
+                    f"superseded, {result['moved']} moved")
+    return len(account_ids)
+
+
+def status():
+    """Superseded accounts waiting for their successor's history, and ready to merge"""
+    waiting = db.session.execute(
+        select(func.count()).select_from(BankAccount)
+        .where(BankAccount.superseded_by_id.is_not(None), BankAccount.purged_at.is_(None))
+    ).scalar()
+    ready = len(pending_merges())
+    return {'waiting': waiting - ready, 'ready': ready}
+
+
+def init_relink(app):
+    """Register the `flask relink` commands"""
+
+    @app.cli.group('relink')
+    def relink_group():
+        """Accounts superseded by a relinked item."""
+
+    @relink_group.command('status')
+    def status_command():
+        """Count superseded accounts by merge state."""
+        info = status()
+        click.echo(f"{info['waiting']} waiting for their successor's history, {info['ready']} ready to merge")
+
+    @relink_group.command('merge')
+    def merge_command():
+        """Merge superseded accounts whose successor has its whole history."""
+        click.echo(f"Merged {merge_pending()} accounts")
@@ -0,0 +1,231 @@
+"""Circuit breakers, timeouts and deadlines for outbound API calls
+
+Every call to Plaid, Brevo or Vonage goes through guarded():
+
+    with guarded('brevo', 'send_transac_email') as timeout:
+        api.send_transac_email(email, _request_timeout=timeout)
+
+guarded() fails fast with CircuitOpen while the dependency's breaker is open,
+and with DeadlineExceeded when the incoming request has no time left. It
+yields the timeout the call should use: the dependency's own timeout, cut
+down to whatever remains of the request deadline. Outcomes feed the
+breaker: it opens when the failure rate over a sliding window crosses a
+threshold, stays open for a cool-down, then lets a probe call through
+(half-open) and closes again if the probe succeeds.
+
+Breakers are per process. Their states are published as gauges on /metrics
+and as JSON on /health/dependencies.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g
+
+from app.utils.metrics import registry, track_outbound
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+SERVICES = ('plaid', 'brevo', 'vonage')
+
+# Absolute time.monotonic() deadline of the current request (None = no deadline)
+_deadline = ContextVar('outbound_deadline', default=None)
+
+
+class DependencyUnavailable(Exception):
+    """An outbound call was not attempted"""
+
+
+class CircuitOpen(DependencyUnavailable):
+    def __init__(self, service):
+        super().__init__(f'{service} circuit breaker is open')
+        self.service = service
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    def __init__(self, service):
+        super().__init__(f'request deadline exceeded before calling {service}')
+        self.service = service
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over a sliding time window"""
+
+    def __init__(self, service, failure_rate=0.5, window_seconds=60, min_calls=5,
+                 open_seconds=30, half_open_probes=1):
+        self.service = service
+        self.failure_rate = failure_rate
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at = None
+        self._outcomes = deque()  # (monotonic time, ok)
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._publish()
+
+    def allow(self):
+        """Whether a call may go ahead now (counts a half-open probe if so)"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                if ok:
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, ok))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+            calls = len(self._outcomes)
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if self.state == CLOSED and calls >= self.min_calls and failures / calls >= self.failure_rate:
+                self._open(now)
+
+    def snapshot(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = sum(1 for _, success in self._outcomes if not success)
+            return {
+                'state': self.state,
+                'calls_in_window': calls,
+                'failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'open_for_seconds': round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+            }
+
+    def _open(self, now):
+        self.opened_at = now
+        self._outcomes.clear()
+        self._transition(OPEN)
+
+    def _transition(self, state):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker for {self.service}: {self.state} -> {state}")
+        registry.inc('circuit_breaker_transitions_total', (('service', self.service), ('state', state)))
+        self.state = state
+        if state == CLOSED:
+            self.opened_at = None
+        self._publish()
+
+    def _publish(self):
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            registry.set('circuit_breaker_state', (('service', self.service), ('state', state)),
+                         1 if state == self.state else 0)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(service):
+    """The process-wide breaker for a dependency, configured from the app config"""
+    found = _breakers.get(service)
+    if found is not None:
+        return found
+    with _breakers_lock:
+        if service not in _breakers:
+            config = current_app.config
+            _breakers[service] = CircuitBreaker(
+                service,
+                failure_rate=config['CIRCUIT_FAILURE_RATE'],
+                window_seconds=config['CIRCUIT_WINDOW_SECONDS'],
+                min_calls=config['CIRCUIT_MIN_CALLS'],
+                open_seconds=config['CIRCUIT_OPEN_SECONDS'],
+            )
+        return _breakers[service]
+
+
+def breaker_states():
+    """Snapshot of this process's breakers"""
+    return {service: breaker(service).snapshot() for service in SERVICES}
+
+
+def remaining_seconds():
+    """Time left before the current request's deadline, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def call_timeout(service):
+    """Timeout for one call: the service timeout, capped by the request deadline"""
+    timeout = current_app.config[f'{service.upper()}_TIMEOUT_SECONDS']
+    remaining = remaining_seconds()
+    if remaining is not None:
+        if remaining <= 0:
+            raise DeadlineExceeded(service)
+        timeout = min(timeout, remaining)
+    return timeout
+
+
+def is_dependency_failure(exc):
+    """Client errors (4xx other than 429) mean the dependency is healthy"""
+    status = getattr(exc, 'status', None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+@contextmanager
+def guarded(service, operation, is_failure=is_dependency_failure):
+    """
+    Run one outbound call under the service's breaker and deadline; yields its timeout
+
+    is_failure(exc) decides whether an exception says the dependency is
+    unhealthy (and counts against the breaker) or is the caller's fault.
+    """
+    timeout = call_timeout(service)
+    cb = breaker(service)
+    if not cb.allow():
+        registry.inc('circuit_breaker_rejections_total', (('service', service),))
+        raise CircuitOpen(service)
+
+    ok = False
+    try:
+        with track_outbound(service, operation):
+            yield timeout
+        ok = True
+    except Exception as e:
+        ok = not is_failure(e)
+        raise
+    finally:
+        cb.record(ok)
+
+
+def init_resilience(app):
+    """Give every request a deadline for its outbound calls"""
+    seconds = app.config['REQUEST_DEADLINE_SECONDS']
+    if not seconds:
+        return
+
+    @app.before_request
+    def start_deadline():
+        g.outbound_deadline_token = _deadline.set(time.monotonic() + seconds)
+
+    @app.teardown_request
+    def end_deadline(exc):
+        token = g.pop('outbound_deadline_token', None)
+        if token is not None:
+            _deadline.reset(token)
@@ -0,0 +1,104 @@
+"""Additive schema upgrades
+
+The app has no migration tool: tables are created with db.create_all(),
+which never alters a table that already exists. add_missing_columns() fills
+that gap for the common case of a new nullable column on an existing table,
+and add_missing_indexes() for a new index. Anything else (type changes,
+constraints) still needs a manual migration.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(db, bind_key=None):
+    """ALTER TABLE ... ADD COLUMN for model columns the database lacks"""
+    engine = db.engines[bind_key]
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    logger.warning(f"Cannot add NOT NULL column {table.name}.{column.name} automatically")
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = ''
+                if column.server_default is not None:
+                    default = f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}'))
+                logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _index_validity(conn, table_name):
+    """Postgres: name -> whether the index is usable, for a table's indexes"""
+    return dict(conn.execute(text(
+        "SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = to_regclass(:table)"
+    ), {'table': table_name}).all())
+
+
+def add_missing_indexes(db, bind_key=None):
+    """
+    CREATE INDEX for model indexes the database lacks
+
+    Runs from the sync scheduler at startup, never while serving a request:
+    on Postgres each index is built with CREATE INDEX CONCURRENTLY, which
+    leaves the table writable but can take minutes on transactions. A build
+    interrupted halfway leaves an invalid index behind; it is dropped and
+    built again. A partitioned transactions table is left to
+    add_partitioned_indexes().
+    """
+    # Imported here: partitions imports the models, this module only SQLAlchemy
+    from app.utils.partitions import INDEX_LOCK_KEY, PARENT, add_partitioned_indexes
+
+    engine = db.engines[bind_key]
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing:
+                        conn.execute(CreateIndex(index, if_not_exists=True))
+                        logger.info(f"Added index {index.name}")
+        return
+
+    # CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        # Several schedulers may start at once
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': INDEX_LOCK_KEY})
+        try:
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                if table.name == PARENT and conn.execute(
+                    text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {'name': PARENT}
+                ).scalar() == 'p':
+                    add_partitioned_indexes(conn, table.indexes)
+                    continue
+                validity = _index_validity(conn, table.name)
+                for index in table.indexes:
+                    if validity.get(index.name):
+                        continue
+                    if index.name in validity:
+                        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+                    conn.execute(text(ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+                                      .replace('CREATE UNIQUE INDEX', 'CREATE UNIQUE INDEX CONCURRENTLY', 1)))
+                    logger.info(f"Added index {index.name}")
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': INDEX_LOCK_KEY})
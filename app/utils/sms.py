@@ -2,6 +2,8 @@
 import random
 from flask import current_app
 
+from app.utils.resilience import guarded, DependencyUnavailable
+
 try:
     import vonage
     VONAGE_AVAILABLE = True
@@ -10,6 +12,11 @@ except ImportError:
     print("⚠️  Vonage not installed - SMS MFA will be disabled")
 
 
+def _vonage_failure(e):
+    """Vonage raises ClientError for 4xx responses, which don't mean Vonage is down"""
+    return not isinstance(e, vonage.errors.ClientError)
+
+
 def send_sms_code(phone_number, code=None):
     """
     Send SMS verification code using Vonage Verify API.
@@ -34,14 +41,14 @@ def send_sms_code(phone_number, code=None):
             print("❌ Missing Vonage credentials in config")
             return None
         
-        client = vonage.Client(key=api_key, secret=api_secret)
-        
         # Start verification request - Vonage manages the OTP code
-        response = client.verify.start_verification(
-            number=phone_number,
-            brand=brand_name,
-            code_length=6
-        )
+        with guarded('vonage', 'start_verification', is_failure=_vonage_failure) as timeout:
+            client = vonage.Client(key=api_key, secret=api_secret, timeout=timeout)
+            response = client.verify.start_verification(
+                number=phone_number,
+                brand=brand_name,
+                code_length=6
+            )
         
         if response.get('status') == '0':  # Success
             request_id = response.get('request_id')
@@ -52,6 +59,9 @@ def send_sms_code(phone_number, code=None):
             print(f"❌ Vonage error: {error}")
             return None
             
+    except DependencyUnavailable as e:
+        print(f"❌ Vonage unavailable, not sending SMS: {str(e)}")
+        return None
     except Exception as e:
         print(f"❌ Failed to send SMS: {str(e)}")
         return None
@@ -82,9 +92,9 @@ def verify_sms_code(request_id, code):
             print("❌ Missing Vonage credentials in config")
             return False
         
-        client = vonage.Client(key=api_key, secret=api_secret)
-        
-        response = client.verify.check(request_id, code=code)
+        with guarded('vonage', 'check', is_failure=_vonage_failure) as timeout:
+            client = vonage.Client(key=api_key, secret=api_secret, timeout=timeout)
+            response = client.verify.check(request_id, code=code)
         
         if response.get('status') == '0':  # Success
             print(f"✅ Verification successful for request_id={request_id}")
@@ -94,6 +104,9 @@ def verify_sms_code(request_id, code):
             print(f"❌ Verification failed: {error}")
             return False
             
+    except DependencyUnavailable as e:
+        print(f"❌ Vonage unavailable, cannot verify code: {str(e)}")
+        return False
     except Exception as e:
         print(f"❌ Failed to verify code: {str(e)}")
         return False
@@ -0,0 +1,129 @@
+"""Sync lifecycle events streamed to the browser with Server-Sent Events
+
+PlaidService publishes events (sync_started, sync_page, sync_completed,
+sync_failed, backfill_progress, backfill_completed) into the sync_events
+table as part of its own transactions, so a stream served by any worker or
+instance sees them once they are committed.
+
+An open stream is only cheap under the gevent worker class, where it holds a
+greenlet rather than a thread. Under the sync and gthread workers a stream
+therefore sends whatever is pending and closes, and the browser's
+EventSource reconnects after the advertised retry delay (short polling with
+the same client code).
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, select, insert, delete, func
+
+from app.models import db, SyncEvent
+from app.utils.db_routing import RoutingSession
+
+# Wakes streams in this process as soon as a publishing transaction commits
+_published = threading.Condition()
+
+
+def publish(user_id, event_name, **data):
+    """
+    Record an event for a user's streams
+
+    The event is added to the current session and becomes visible when the
+    caller commits, together with the rows it describes.
+    """
+    db.session.execute(insert(SyncEvent).values(
+        user_id=user_id,
+        event=event_name,
+        data=json.dumps(data, default=str),
+        created_at=datetime.utcnow()
+    ))
+    db.session.info['sync_events_published'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _notify_streams(session):
+    if session.info.pop('sync_events_published', False):
+        with _published:
+            _published.notify_all()
+
+
+def prune(user_id):
+    """Drop a user's events older than SYNC_EVENTS_RETENTION_SECONDS"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['SYNC_EVENTS_RETENTION_SECONDS'])
+    db.session.execute(delete(SyncEvent).where(
+        SyncEvent.user_id == user_id,
+        SyncEvent.created_at < cutoff
+    ))
+
+
+def cooperative():
+    """True when running under gevent, where an open stream costs a greenlet instead of a thread"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def latest_event_id(user_id):
+    with db.engine.connect() as conn:
+        return conn.execute(
+            select(func.max(SyncEvent.id)).where(SyncEvent.user_id == user_id)
+        ).scalar() or 0
+
+
+def _events_after(user_id, last_id):
+    # A short-lived connection per poll: a stream must not hold a pooled
+    # connection (or an open transaction) while it waits
+    with db.engine.connect() as conn:
+        return conn.execute(
+            select(SyncEvent.id, SyncEvent.event, SyncEvent.data)
+            .where(SyncEvent.user_id == user_id, SyncEvent.id > last_id)
+            .order_by(SyncEvent.id)
+        ).all()
+
+
+def _format(event_id, event_name, data):
+    return f"id: {event_id}\nevent: {event_name}\ndata: {data}\n\n"
+
+
+def stream(user_id, last_event_id=None):
+    """
+    Generate the SSE body for a user's stream
+
+    Args:
+        user_id: User whose events to send
+        last_event_id: Last id the client saw (the Last-Event-ID header);
+            None starts from now without replaying older events
+    """
+    config = current_app.config
+    long_lived = cooperative()
+    poll_seconds = config['SYNC_EVENTS_POLL_SECONDS']
+    heartbeat_seconds = config['SYNC_EVENTS_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + config['SYNC_EVENTS_MAX_STREAM_SECONDS']
+
+    yield f"retry: {config['SYNC_EVENTS_RETRY_MS']}\n\n"
+
+    if last_event_id is None:
+        # Give the client a position so its reconnects resume from here
+        last_event_id = latest_event_id(user_id)
+        yield _format(last_event_id, 'ready', json.dumps({'cooperative': long_lived}))
+
+    last_sent = time.monotonic()
+    while True:
+        for event_id, event_name, data in _events_after(user_id, last_event_id):
+            yield _format(event_id, event_name, data)
+            last_event_id = event_id
+            last_sent = time.monotonic()
+
+        if not long_lived or time.monotonic() >= deadline:
+            return
+
+        if time.monotonic() - last_sent >= heartbeat_seconds:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+
+        with _published:
+            _published.wait(poll_seconds)
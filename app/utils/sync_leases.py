@@ -0,0 +1,102 @@
+"""Per-item sync leases
+
+Every path that writes an item's transactions or moves its sync cursor (the
+sync scheduler, the sync and relink routes, the history backfill) holds the
+item's lease while it does, so two syncs never apply pages to the same item
+at once. A lease is a sync_leases row with an expiry that the holder renews
+as it goes; a lease left behind by a crashed process lapses on its own.
+
+Callers that take a lease only for one sync (everything but the scheduler)
+get a fresh owner id from new_owner(), so two requests in one process don't
+share a lease.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, func, text
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, SyncLease
+
+# Postgres advisory lock key that serializes lease claims, so two schedulers
+# can't both see room under a limit and both take the last slot
+CLAIM_LOCK_KEY = 0x5C4ED
+
+
+class LeaseLost(Exception):
+    """Another sync took over the item (our lease expired mid-sync)"""
+
+
+def new_owner():
+    """Lease owner id unique to this call: host:pid:uuid"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _expiry(now):
+    return now + timedelta(seconds=current_app.config['SYNC_LEASE_SECONDS'])
+
+
+def acquire(item_id, institution_name, owner, global_limit=None, per_institution_limit=None):
+    """Take the item's lease if it is free and the concurrency limits (if given) allow it"""
+    now = datetime.utcnow()
+    try:
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': CLAIM_LOCK_KEY})
+
+        live = select(func.count()).select_from(SyncLease).where(SyncLease.expires_at > now)
+        if global_limit is not None and db.session.execute(live).scalar() >= global_limit:
+            db.session.rollback()
+            return False
+        if per_institution_limit is not None and \
+                db.session.execute(live.where(SyncLease.institution_name == institution_name)).scalar() \
+                >= per_institution_limit:
+            db.session.rollback()
+            return False
+
+        values = {'owner': owner, 'acquired_at': now, 'expires_at': _expiry(now)}
+        # Take over an expired lease, or create the row
+        taken = db.session.execute(
+            update(SyncLease)
+            .where(SyncLease.item_id == item_id, SyncLease.expires_at <= now)
+            .values(**values)
+        ).rowcount
+        if not taken:
+            db.session.execute(insert(SyncLease).values(
+                item_id=item_id, institution_name=institution_name, **values
+            ))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Someone else holds a live lease on it
+        db.session.rollback()
+        return False
+
+
+def renew(item_id, owner):
+    """Extend our lease; raises LeaseLost if it has been taken over"""
+    renewed = db.session.execute(
+        update(SyncLease)
+        .where(SyncLease.item_id == item_id, SyncLease.owner == owner)
+        .values(expires_at=_expiry(datetime.utcnow()))
+    ).rowcount
+    db.session.commit()
+    if not renewed:
+        raise LeaseLost(item_id)
+
+
+def release(item_id, owner, hold_for=None):
+    """
+    Give the lease up
+
+    With hold_for the lease is kept that much longer instead, which keeps
+    a failing item from being retried on every pass.
+    """
+    owned = (SyncLease.item_id == item_id) & (SyncLease.owner == owner)
+    if hold_for:
+        db.session.execute(update(SyncLease).where(owned).values(expires_at=datetime.utcnow() + hold_for))
+    else:
+        db.session.execute(delete(SyncLease).where(owned))
+    db.session.commit()
@@ -0,0 +1,211 @@
+"""Distributed transaction sync scheduler
+
+Runs next to the web workers, as many copies as needed:
+
+    flask sync-scheduler              # keep syncing whatever is due
+    flask sync-scheduler --once       # sync everything due, then exit
+
+Each pass picks the items whose accounts were synced longest ago and takes a
+lease on each before syncing it (see app/utils/sync_leases.py). The lease is
+renewed after every page, so no other scheduler, sync button or backfill
+syncs the same item at once, and an item held by a scheduler that crashed
+becomes available again when its lease runs out. Sync cursors are committed
+page by page, so the next holder resumes where the crashed one stopped.
+
+Concurrency is capped three ways: worker threads per scheduler, live leases
+across all schedulers, and live leases per institution.
+"""
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import select, func, or_
+
+from app.models import db, BankAccount, PlaidItem, SyncLease
+from app.utils.plaid_service import plaid_service
+from app.utils.schema import add_missing_columns, add_missing_indexes
+from app.utils.email import deliver_queued_emails
+from app.utils import change_log, sync_leases
+from app.utils.partitions import maintain as maintain_partitions, prepare_partitions
+from app.utils.account_purge import purge as purge_accounts
+from app.utils.dictionary import backfill_pending as backfill_dictionary
+from app.utils.categorization import reapply_pending as reapply_category_rules
+from app.utils.relink import merge_pending as merge_relinked_accounts
+
+logger = logging.getLogger(__name__)
+
+class SyncScheduler:
+    """Claims due items through leases and syncs them on a thread pool"""
+
+    def __init__(self, app, workers=None):
+        config = app.config
+        self.app = app
+        self.workers = workers or config['SYNC_SCHEDULER_WORKERS']
+        self.global_limit = config['SYNC_SCHEDULER_GLOBAL_LIMIT']
+        self.per_institution_limit = config['SYNC_SCHEDULER_PER_INSTITUTION']
+        self.interval = timedelta(seconds=config['SYNC_SCHEDULER_INTERVAL_SECONDS'])
+        self.retry_delay = timedelta(seconds=config['SYNC_SCHEDULER_RETRY_SECONDS'])
+        self.poll_seconds = config['SYNC_SCHEDULER_POLL_SECONDS']
+        self.owner = sync_leases.new_owner()
+        # Housekeeping run between passes: (name, interval seconds, function)
+        self.chores = [
+            ('Delivering queued emails', config['EMAIL_OUTBOX_INTERVAL_SECONDS'], deliver_queued_emails),
+            ('Compacting the change log', config['CHANGE_LOG_COMPACT_INTERVAL_SECONDS'], change_log.compact),
+            ('Maintaining transaction partitions', config['PARTITION_MAINTENANCE_INTERVAL_SECONDS'],
+             maintain_partitions),
+            ('Purging removed accounts', config['ACCOUNT_PURGE_INTERVAL_SECONDS'], purge_accounts),
+            ('Encoding merchants and categories', config['DICTIONARY_BACKFILL_INTERVAL_SECONDS'],
+             backfill_dictionary),
+            ('Re-applying categorization rules', config['CATEGORY_RULES_INTERVAL_SECONDS'], reapply_category_rules),
+            ('Merging relinked accounts', config['RELINK_MERGE_INTERVAL_SECONDS'], merge_relinked_accounts),
+        ]
+        self._chores_run = {}
+        self._running = {}  # item id -> Future
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Stop claiming new items; syncs already running are finished"""
+        self._stopping.set()
+
+    def run(self, once=False):
+        with self.app.app_context():
+            # The scheduler may start before any web request has
+            db.create_all()
+            add_missing_columns(db)
+            prepare_partitions(db)
+            # Only built here, as it can take a while; a failure is retried
+            # at the next start rather than keeping syncs from running
+            try:
+                add_missing_indexes(db)
+            except Exception:
+                logger.exception("Adding missing indexes failed")
+                db.session.rollback()
+            self.adopt_untracked_accounts()
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='sync-scheduler') as executor:
+            while not self._stopping.is_set():
+                self._running = {item_id: f for item_id, f in self._running.items() if not f.done()}
+                claimed = 0
+                free = self.workers - len(self._running)
+                if free:
+                    with self.app.app_context():
+                        try:
+                            for item_id, institution_name in self.due_items(free * 4):
+                                if claimed >= free:
+                                    break
+                                if item_id in self._running or not self.acquire(item_id, institution_name):
+                                    continue
+                                self._running[item_id] = executor.submit(self._sync, item_id)
+                                claimed += 1
+                        finally:
+                            db.session.remove()
+
+                self._run_chores()
+                if once and not claimed and not self._running:
+                    break
+                self._stopping.wait(self.poll_seconds)
+
+    def _run_chores(self):
+        """Run housekeeping that is due (the scheduler is the app's only periodic process)"""
+        for name, interval, chore in self.chores:
+            if time.monotonic() - self._chores_run.get(name, float('-inf')) < interval:
+                continue
+            self._chores_run[name] = time.monotonic()
+            with self.app.app_context():
+                try:
+                    chore()
+                except Exception:
+                    logger.exception(f"{name} failed")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def adopt_untracked_accounts(self):
+        """Create item records for accounts linked before items were tracked"""
+        tracked = select(PlaidItem.plaid_item_id)
+        first_account_ids = db.session.execute(
+            select(func.min(BankAccount.id))
+            .where(BankAccount.is_active.is_(True), BankAccount.plaid_item_id.not_in(tracked))
+            .group_by(BankAccount.plaid_item_id)
+        ).scalars().all()
+        for account_id in first_account_ids:
+            plaid_service.item_for_account(db.session.get(BankAccount, account_id))
+
+    def due_items(self, limit):
+        """(item id, institution) pairs due for a sync, stalest first, without a live lease"""
+        now = datetime.utcnow()
+        last_synced = func.min(BankAccount.last_synced_at)
+        leased = select(SyncLease.item_id).where(SyncLease.expires_at > now)
+        return db.session.execute(
+            select(PlaidItem.id, PlaidItem.institution_name)
+            .join(BankAccount, BankAccount.plaid_item_id == PlaidItem.plaid_item_id)
+            .where(
+                BankAccount.is_active.is_(True),
+                PlaidItem.id.not_in(leased),
+                # Items waiting for a relink or backing off after errors
+                or_(
+                    PlaidItem.error_state.is_(None),
+                    (PlaidItem.error_state == 'backoff') & (PlaidItem.retry_after <= now)
+                )
+            )
+            .group_by(PlaidItem.id, PlaidItem.institution_name)
+            .having(or_(last_synced.is_(None), last_synced < now - self.interval))
+            .order_by(last_synced.asc().nulls_first())
+            .limit(limit)
+        ).all()
+
+    def acquire(self, item_id, institution_name):
+        """Take the item's lease if it is free and the concurrency limits allow it"""
+        return sync_leases.acquire(item_id, institution_name, self.owner,
+                                   self.global_limit, self.per_institution_limit)
+
+    def release(self, item_id, hold_for=None):
+        """Give the lease up, or keep it hold_for longer after a failure"""
+        sync_leases.release(item_id, self.owner, hold_for)
+
+    def _sync(self, item_id):
+        with self.app.app_context():
+            hold_for = None
+            try:
+                item = db.session.get(PlaidItem, item_id)
+                account = BankAccount.query.filter_by(plaid_item_id=item.plaid_item_id, is_active=True).first()
+                if account is None:
+                    return
+                # The service renews our lease after every page
+                result = plaid_service.sync_and_save_transactions(account, lease_owner=self.owner)
+                if result['success']:
+                    logger.info(f"Synced item {item.plaid_item_id}: +{result['added']} "
+                                f"~{result['modified']} -{result['removed']}")
+                elif not result.get('skipped'):
+                    logger.warning(f"Sync failed for item {item.plaid_item_id}: {result['error']}")
+                    hold_for = self.retry_delay
+            except Exception:
+                logger.exception(f"Sync failed for item {item_id}")
+                db.session.rollback()
+                hold_for = self.retry_delay
+            finally:
+                try:
+                    self.release(item_id, hold_for)
+                finally:
+                    db.session.remove()
+
+
+def init_sync_scheduler(app):
+    """Register the `flask sync-scheduler` command"""
+
+    @app.cli.command('sync-scheduler')
+    @click.option('--once', is_flag=True, help='Sync everything that is due, then exit.')
+    @click.option('--workers', type=int, help='Concurrent syncs in this process.')
+    def sync_scheduler_command(once, workers):
+        """Keep Plaid items synced, stalest first."""
+        scheduler = SyncScheduler(app, workers)
+        signal.signal(signal.SIGTERM, lambda *args: scheduler.stop())
+        click.echo(f"Sync scheduler {scheduler.owner} running with {scheduler.workers} workers")
+        try:
+            scheduler.run(once=once)
+        except KeyboardInterrupt:
+            scheduler.stop()
@@ -0,0 +1,207 @@
+"""Transfers between a user's own accounts
+
+Moving money from checking to savings, or paying a card from checking,
+shows up twice: an outflow on one account and an inflow of the same amount
+on the other. Counted as spending and income, every transfer inflates both
+and skews the savings rate. Matched pairs are marked by pointing each side's
+transactions.transfer_pair_id at the other, and aggregates skip marked rows
+(see FinancialSnapshot); listings still show them.
+
+Two rows pair up when they belong to different active accounts of the same
+user, have opposite signs and the same amount to the cent, and are dated at
+most TRANSFER_WINDOW_DAYS apart. Rather than comparing every outflow with every
+inflow, candidates are bucketed by amount, and within a bucket inflows are
+sorted by date, so each outflow only looks at the inflows a bisect puts
+inside its window. Each outflow takes the closest unmatched inflow.
+
+Ingest runs match() on each page it writes. The same bucketing narrows the
+query: only unmatched rows with the opposite amount of a new row, dated
+within the window, are read, however much history a page spans. Changing a
+row's amount or date, or deleting it, unpairs it first (unpair()). History
+stored before detection existed is matched a few months at a time with:
+
+    flask transfers detect
+"""
+import bisect
+from datetime import timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import select, update, func, bindparam
+
+from app.models import db, User, BankAccount, Transaction
+from app.utils import data_version
+
+# Ids per IN (...) list when unpairing
+UNPAIR_CHUNK = 500
+
+# Days of history read at a time by detect()
+DETECT_CHUNK_DAYS = 90
+
+
+def _cents(amount):
+    return round(abs(amount) * 100)
+
+
+def pairs(rows, window_days):
+    """
+    Pair transfers among rows with id, account_id, amount and date
+
+    Returns:
+        list of (outflow id, inflow id)
+    """
+    buckets = {}
+    for row in rows:
+        if row.amount:
+            bucket = buckets.setdefault(_cents(row.amount), ([], []))
+            # Plaid's sign: money leaving an account is positive
+            bucket[0 if row.amount > 0 else 1].append(row)
+
+    window = timedelta(days=window_days)
+    matched = []
+    for outflows, inflows in buckets.values():
+        if not outflows or not inflows:
+            continue
+        inflows.sort(key=lambda row: (row.date, row.id))
+        dates = [row.date for row in inflows]
+        taken = set()
+        for outflow in sorted(outflows, key=lambda row: (row.date, row.id)):
+            best = None
+            start = bisect.bisect_left(dates, outflow.date - window)
+            end = bisect.bisect_right(dates, outflow.date + window)
+            for index in range(start, end):
+                inflow = inflows[index]
+                if index in taken or inflow.account_id == outflow.account_id:
+                    continue
+                if best is None or abs(inflow.date - outflow.date) < abs(inflows[best].date - outflow.date):
+                    best = index
+            if best is not None:
+                taken.add(best)
+                matched.append((outflow.id, inflows[best].id))
+    return matched
+
+
+def _mark(user_id, start, end, amounts=None):
+    """Pair the user's unmatched rows dated start to end, only of the given amounts when set"""
+    window_days = current_app.config['TRANSFER_WINDOW_DAYS']
+    query = (
+        select(Transaction.id, Transaction.account_id, Transaction.amount, Transaction.date)
+        .join(BankAccount, BankAccount.id == Transaction.account_id)
+        .where(BankAccount.user_id == user_id,
+               # Removed and superseded accounts' rows are on their way out
+               BankAccount.is_active.is_(True),
+               Transaction.date >= start,
+               Transaction.date <= end,
+               Transaction.transfer_pair_id.is_(None))
+    )
+    if amounts is not None:
+        query = query.where(Transaction.amount.in_(amounts))
+    rows = db.session.execute(query).all()
+    matched = pairs(rows, window_days)
+    if not matched:
+        return 0
+    dates_by_id = {row.id: row.date for row in rows}
+    params = []
+    for outflow_id, inflow_id in matched:
+        params.append({'b_id': outflow_id, 'b_date': dates_by_id[outflow_id], 'b_pair_id': inflow_id})
+        params.append({'b_id': inflow_id, 'b_date': dates_by_id[inflow_id], 'b_pair_id': outflow_id})
+    # date is the partition key: it lets Postgres go straight to the right partition
+    db.session.execute(
+        update(Transaction.__table__)
+        .where(Transaction.id == bindparam('b_id'), Transaction.date == bindparam('b_date'))
+        .values(transfer_pair_id=bindparam('b_pair_id')),
+        params
+    )
+    return len(matched)
+
+
+def match(user_id, transactions):
+    """
+    Pair the user's transactions, given as (amount, date), with unmatched
+    transfers (in the caller's transaction)
+
+    Returns:
+        number of pairs marked
+    """
+    transactions = [(amount, tx_date) for amount, tx_date in transactions if amount]
+    if not transactions:
+        return 0
+    window = timedelta(days=current_app.config['TRANSFER_WINDOW_DAYS'])
+    # Both sides of each amount: rows already stored may be either
+    amounts = {amount for amount, _ in transactions} | {-amount for amount, _ in transactions}
+    dates = [tx_date for _, tx_date in transactions]
+    return _mark(user_id, min(dates) - window, max(dates) + window, sorted(amounts))
+
+
+def unpair(transaction_ids):
+    """
+    Clear the pairs the transactions belong to, on both sides (in the
+    caller's transaction)
+
+    Returns:
+        number of rows unpaired
+    """
+    transaction_ids = list(transaction_ids)
+    unpaired = 0
+    for start in range(0, len(transaction_ids), UNPAIR_CHUNK):
+        paired = db.session.execute(
+            select(Transaction.id, Transaction.transfer_pair_id)
+            .where(Transaction.id.in_(transaction_ids[start:start + UNPAIR_CHUNK]),
+                   Transaction.transfer_pair_id.is_not(None))
+        ).all()
+        # Both sides by primary key, so no index on transfer_pair_id is needed
+        ids = {row.id for row in paired} | {row.transfer_pair_id for row in paired}
+        if ids:
+            db.session.execute(
+                update(Transaction.__table__)
+                .where(Transaction.id.in_(ids))
+                .values(transfer_pair_id=None)
+            )
+            unpaired += len(ids)
+    return unpaired
+
+
+def detect(user_id=None):
+    """
+    Match transfers across whole histories, DETECT_CHUNK_DAYS per transaction
+
+    Returns:
+        number of pairs marked
+    """
+    window = timedelta(days=current_app.config['TRANSFER_WINDOW_DAYS'])
+    query = select(User.id).order_by(User.id)
+    if user_id is not None:
+        query = query.where(User.id == user_id)
+    matched = 0
+    for uid in db.session.execute(query).scalars().all():
+        first, last = db.session.execute(
+            select(func.min(Transaction.date), func.max(Transaction.date))
+            .join(BankAccount, BankAccount.id == Transaction.account_id)
+            .where(BankAccount.user_id == uid, BankAccount.is_active.is_(True),
+                   Transaction.transfer_pair_id.is_(None))
+        ).one()
+        start = first
+        while start is not None and start <= last:
+            end = start + timedelta(days=DETECT_CHUNK_DAYS)
+            # Reading a window past the chunk catches pairs that straddle its end
+            chunk_matched = _mark(uid, start, end + window)
+            if chunk_matched:
+                data_version.bump(uid)
+            db.session.commit()
+            matched += chunk_matched
+            start = end
+    return matched
+
+
+def init_transfers(app):
+    """Register the `flask transfers` commands"""
+
+    @app.cli.group('transfers')
+    def transfers_group():
+        """Transfers between a user's own accounts."""
+
+    @transfers_group.command('detect')
+    @click.option('--user-id', type=int, help='Only match this user\'s transactions.')
+    def detect_command(user_id):
+        """Match transfers across stored history."""
+        click.echo(f"Marked {detect(user_id)} transfer pairs")
@@ -0,0 +1,232 @@
+"""
+Deterministic synthetic data for benchmarks
+
+Populates users, bank accounts and transactions with realistic category,
+merchant and amount distributions. The same seed always produces the same
+rows, so runs against different code versions are comparable.
+
+    python -m benchmarks.datagen --users 1000 --transactions 10000
+    DATABASE_URL=postgresql://... python -m benchmarks.datagen --users 100 --transactions 1000
+"""
+import argparse
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+
+BENCH_PASSWORD = 'benchmark'
+EMAIL_DOMAIN = 'bench.example.com'
+
+# (primary category, weight, [(detailed category, [merchants])], (median amount, sigma))
+CATEGORIES = [
+    ('FOOD_AND_DRINK', 30, [
+        ('FOOD_AND_DRINK_RESTAURANT', ['Chipotle', 'Olive Garden', 'Panera Bread', 'Local Diner', 'Sushi House']),
+        ('FOOD_AND_DRINK_COFFEE', ['Starbucks', 'Dunkin', 'Blue Bottle Coffee']),
+        ('FOOD_AND_DRINK_FAST_FOOD', ['McDonald\'s', 'Taco Bell', 'Wendy\'s', 'Subway']),
+        ('FOOD_AND_DRINK_GROCERIES', ['Whole Foods', 'Trader Joe\'s', 'Kroger', 'Safeway']),
+    ], (18, 0.7)),
+    ('GENERAL_MERCHANDISE', 18, [
+        ('GENERAL_MERCHANDISE_ONLINE_MARKETPLACES', ['Amazon', 'eBay', 'Etsy']),
+        ('GENERAL_MERCHANDISE_SUPERSTORES', ['Target', 'Walmart', 'Costco']),
+        ('GENERAL_MERCHANDISE_CLOTHING_AND_ACCESSORIES', ['Old Navy', 'Nike', 'Uniqlo']),
+    ], (45, 0.9)),
+    ('TRANSPORTATION', 10, [
+        ('TRANSPORTATION_GAS', ['Shell', 'Chevron', 'ExxonMobil']),
+        ('TRANSPORTATION_TAXIS_AND_RIDE_SHARES', ['Uber', 'Lyft']),
+        ('TRANSPORTATION_PUBLIC_TRANSIT', ['MTA', 'BART']),
+    ], (25, 0.6)),
+    ('ENTERTAINMENT', 7, [
+        ('ENTERTAINMENT_TV_AND_MOVIES', ['Netflix', 'Hulu', 'AMC Theatres']),
+        ('ENTERTAINMENT_MUSIC_AND_AUDIO', ['Spotify', 'Apple Music']),
+    ], (15, 0.5)),
+    ('RENT_AND_UTILITIES', 5, [
+        ('RENT_AND_UTILITIES_RENT', ['Greystar Properties', 'Equity Residential']),
+        ('RENT_AND_UTILITIES_GAS_AND_ELECTRICITY', ['PG&E', 'ConEd', 'Duke Energy']),
+        ('RENT_AND_UTILITIES_INTERNET_AND_CABLE', ['Comcast', 'Verizon Fios', 'AT&T']),
+    ], (150, 1.0)),
+    ('MEDICAL', 3, [
+        ('MEDICAL_PHARMACIES_AND_SUPPLEMENTS', ['CVS', 'Walgreens']),
+        ('MEDICAL_PRIMARY_CARE', ['One Medical', 'Kaiser Permanente']),
+    ], (40, 0.8)),
+    ('TRAVEL', 3, [
+        ('TRAVEL_FLIGHTS', ['Delta', 'United Airlines', 'Southwest']),
+        ('TRAVEL_LODGING', ['Marriott', 'Airbnb', 'Hilton']),
+    ], (280, 0.7)),
+    ('PERSONAL_CARE', 3, [
+        ('PERSONAL_CARE_GYMS_AND_FITNESS_CENTERS', ['Planet Fitness', 'Equinox']),
+        ('PERSONAL_CARE_HAIR_AND_BEAUTY', ['Great Clips', 'Sephora']),
+    ], (35, 0.6)),
+    ('LOAN_PAYMENTS', 3, [
+        ('LOAN_PAYMENTS_CREDIT_CARD_PAYMENT', [None]),
+        ('LOAN_PAYMENTS_STUDENT_LOAN_PAYMENT', ['Navient', 'Nelnet']),
+    ], (300, 0.8)),
+    ('TRANSFER_OUT', 3, [
+        ('TRANSFER_OUT_SAVINGS', [None]),
+        ('TRANSFER_OUT_ACCOUNT_TRANSFER', ['Venmo', 'Zelle']),
+    ], (200, 1.0)),
+]
+
+INCOME = ('INCOME', [
+    ('INCOME_WAGES', ['Acme Corp Payroll', 'Globex Payroll', 'Initech Direct Dep']),
+    ('INCOME_INTEREST_EARNED', [None]),
+], (2200, 0.3))
+
+INSTITUTIONS = [
+    ('ins_3', 'Chase'), ('ins_4', 'Wells Fargo'), ('ins_5', 'Citi'),
+    ('ins_1', 'Bank of America'), ('ins_7', 'US Bank'), ('ins_13', 'PNC'),
+]
+ACCOUNT_KINDS = [
+    ('depository', 'checking', 'Checking'),
+    ('depository', 'savings', 'Savings'),
+    ('credit', 'credit card', 'Credit Card'),
+]
+PAYMENT_CHANNELS = ['in store', 'online', 'other']
+
+
+def transaction_rows(rng, account_ids, n, days, today, id_prefix):
+    """Yield `n` Transaction row dicts spread over the last `days` days"""
+    weights = [c[1] for c in CATEGORIES]
+    for i in range(n):
+        # Payroll roughly twice a month, spending otherwise
+        if rng.random() < 0.04:
+            primary, details, (median, sigma) = INCOME
+            detailed, merchants = details[0] if rng.random() < 0.9 else details[1]
+            amount = -round(rng.lognormvariate(math.log(median), sigma), 2)
+            account_id = account_ids[0]
+        else:
+            primary, _, details, (median, sigma) = rng.choices(CATEGORIES, weights)[0]
+            detailed, merchants = rng.choice(details)
+            amount = round(rng.lognormvariate(math.log(median), sigma), 2)
+            account_id = rng.choice(account_ids)
+
+        merchant = rng.choice(merchants)
+        # Recent days are denser, like a real feed that grows over time
+        age = min(int(rng.expovariate(2.5 / days)), days - 1)
+        tx_date = today - timedelta(days=age)
+        yield {
+            'account_id': account_id,
+            'plaid_transaction_id': f'{id_prefix}-{i}',
+            'name': (merchant or detailed.replace('_', ' ').title())[:200],
+            'merchant_name': merchant,
+            'amount': amount,
+            'currency_code': 'USD',
+            'category': f'{primary}, {detailed}',
+            'primary_category': primary,
+            'detailed_category': detailed,
+            'date': tx_date,
+            'authorized_date': tx_date,
+            'pending': age < 2 and rng.random() < 0.3,
+            'payment_channel': rng.choice(PAYMENT_CHANNELS),
+        }
+
+
+def generate(users=100, transactions_per_user=1000, accounts_per_user=3, days=365,
+             seed=42, chunk_size=5000, today=None, log=print):
+    """
+    Insert synthetic users, accounts and transactions.
+
+    Users are created as bench-<seed>-<n>@bench.example.com; existing ones with
+    the same seed are skipped, so re-running tops a dataset up instead of
+    duplicating it.
+
+    Returns:
+        list of generated user ids
+    """
+    # Imported lazily so the constants above can be used without loading the
+    # app (and its Config) before the caller has set DATABASE_URL
+    from app.models import db, User, BankAccount, Transaction
+    from app.utils.dictionary import encode
+
+    rng = random.Random(seed)
+    today = today or date.today()
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+    started = time.time()
+    user_ids = []
+
+    existing = set(db.session.execute(
+        select(User.email).where(User.email.like(f'bench-{seed}-%'))
+    ).scalars())
+
+    for u in range(users):
+        email = f'bench-{seed}-{u}@{EMAIL_DOMAIN}'
+        # Consume the RNG identically whether or not the user exists
+        user_rng = random.Random(rng.getrandbits(64))
+        if email in existing:
+            user_ids.append(db.session.execute(select(User.id).where(User.email == email)).scalar_one())
+            continue
+
+        user_id = db.session.execute(insert(User).values(
+            email=email, password_hash=password_hash, is_verified=True, verified_at=now,
+            created_at=now, updated_at=now,
+        )).inserted_primary_key[0]
+        user_ids.append(user_id)
+
+        institution_id, institution_name = user_rng.choice(INSTITUTIONS)
+        item_id = f'bench-item-{seed}-{u}'
+        account_ids = []
+        for a in range(accounts_per_user):
+            account_type, subtype, label = ACCOUNT_KINDS[a % len(ACCOUNT_KINDS)]
+            balance = round(user_rng.lognormvariate(math.log(4000), 1.0), 2)
+            account_ids.append(db.session.execute(insert(BankAccount).values(
+                user_id=user_id,
+                plaid_item_id=item_id,
+                plaid_account_id=f'bench-acc-{seed}-{u}-{a}',
+                plaid_access_token=f'access-bench-{seed}-{u}',
+                institution_id=institution_id,
+                institution_name=institution_name,
+                account_name=f'{institution_name} {label}',
+                account_type=account_type,
+                account_subtype=subtype,
+                mask=f'{user_rng.randrange(10000):04d}',
+                current_balance=balance,
+                available_balance=balance,
+                is_active=True,
+                last_synced_at=now,
+                created_at=now,
+                updated_at=now,
+            )).inserted_primary_key[0])
+
+        chunk = []
+        for row in transaction_rows(user_rng, account_ids, transactions_per_user, days, today,
+                                    f'bench-tx-{seed}-{u}'):
+            row['created_at'] = row['updated_at'] = now
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                db.session.execute(insert(Transaction), encode(chunk))
+                chunk = []
+        if chunk:
+            db.session.execute(insert(Transaction), encode(chunk))
+        db.session.commit()
+
+        if log and (u + 1) % max(users // 10, 1) == 0:
+            log(f"  {u + 1}/{users} users ({time.time() - started:.1f}s)")
+
+    db.session.commit()
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--transactions', type=int, default=1000, help='Transactions per user')
+    parser.add_argument('--accounts', type=int, default=3, help='Accounts per user')
+    parser.add_argument('--days', type=int, default=365, help='History length in days')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.models import db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print(f"Generating {args.users} users x {args.transactions} transactions "
+              f"into {db.engine.url.render_as_string(hide_password=True)}")
+        generate(args.users, args.transactions, args.accounts, args.days, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""
+Offline stand-in for the Plaid API
+
+Implements just enough of Plaid's HTTP API for PlaidService to link items and
+sync transactions without credentials or network access:
+
+    /link/token/create
+    /item/public_token/exchange
+    /accounts/get
+    /transactions/sync
+    /transactions/get
+
+Everything is derived from a seed, so the same item always yields the same
+accounts, pages, cursors, modified and removed rows. Faults are injected on
+demand: added latency, 429 rate limits and ITEM_LOGIN_REQUIRED items.
+
+    python -m benchmarks.fake_plaid --port 8765 --transactions 100000 --latency-ms 50
+    PLAID_HOST=http://127.0.0.1:8765 python wsgi.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.datagen import CATEGORIES, INCOME, INSTITUTIONS, ACCOUNT_KINDS, PAYMENT_CHANNELS
+
+MAX_SYNC_COUNT = 500
+DEFAULT_SYNC_COUNT = 100
+
+
+class FakePlaid:
+    """
+    Deterministic Plaid data model behind the HTTP handler.
+
+    A sync cursor is simply the offset into an item's transaction stream. Each
+    page after the first also carries a few modified and removed rows that
+    refer to transactions delivered on earlier pages, like a real feed.
+    """
+
+    def __init__(self, seed=42, transactions_per_item=10000, accounts_per_item=3, days=730,
+                 modified_rate=0.02, removed_rate=0.01, latency_ms=0, latency_jitter_ms=0,
+                 rate_limit_rate=0.0, login_required_rate=0.0, today=None):
+        self.seed = seed
+        self.transactions_per_item = transactions_per_item
+        self.accounts_per_item = accounts_per_item
+        self.days = days
+        self.modified_rate = modified_rate
+        self.removed_rate = removed_rate
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.login_required_rate = login_required_rate
+        self.today = today or date.today()
+        self._fault_rng = random.Random(seed ^ 0x5EED)
+        self._lock = threading.Lock()
+        self.requests = {}
+
+    # -- identifiers -------------------------------------------------------
+
+    def item_for_public_token(self, public_token):
+        # public-fake-<n> maps to item <n>; anything else is hashed to one
+        suffix = public_token.rsplit('-', 1)[-1]
+        return int(suffix) if suffix.isdigit() else abs(hash(public_token)) % 100000
+
+    def access_token(self, item):
+        return f'access-fake-{self.seed}-{item}'
+
+    def item_from_access_token(self, access_token):
+        prefix = f'access-fake-{self.seed}-'
+        if not access_token or not access_token.startswith(prefix):
+            return None
+        return int(access_token[len(prefix):])
+
+    def item_id(self, item):
+        return f'fake-item-{self.seed}-{item}'
+
+    def account_id(self, item, index):
+        return f'fake-acc-{self.seed}-{item}-{index}'
+
+    def transaction_id(self, item, index):
+        return f'fake-tx-{self.seed}-{item}-{index}'
+
+    def login_required(self, item):
+        return random.Random(self.seed * 7919 + item).random() < self.login_required_rate
+
+    # -- payloads ----------------------------------------------------------
+
+    def accounts(self, item):
+        rng = random.Random(self.seed * 31 + item)
+        accounts = []
+        for a in range(self.accounts_per_item):
+            account_type, subtype, label = ACCOUNT_KINDS[a % len(ACCOUNT_KINDS)]
+            balance = round(rng.lognormvariate(8.3, 1.0), 2)
+            accounts.append({
+                'account_id': self.account_id(item, a),
+                'balances': {
+                    'available': balance if account_type != 'credit' else round(5000 - balance, 2),
+                    'current': balance,
+                    'limit': 5000.0 if account_type == 'credit' else None,
+                    'iso_currency_code': 'USD',
+                    'unofficial_currency_code': None,
+                },
+                'mask': f'{rng.randrange(10000):04d}',
+                'name': label,
+                'official_name': f'Fake {label}',
+                'type': account_type,
+                'subtype': subtype,
+            })
+        return accounts
+
+    def item_payload(self, item):
+        institution_id, _ = INSTITUTIONS[item % len(INSTITUTIONS)]
+        return {
+            'item_id': self.item_id(item),
+            'institution_id': institution_id,
+            'webhook': None,
+            'error': None,
+            'available_products': ['balance'],
+            'billed_products': ['transactions'],
+            'consent_expiration_time': None,
+            'update_type': 'background',
+        }
+
+    def transaction(self, item, index, revision=0):
+        """Transaction `index` of an item; `revision` > 0 gives its modified form"""
+        rng = random.Random((self.seed << 40) ^ (item << 24) ^ index)
+        if rng.random() < 0.04:
+            primary, details, (median, sigma) = INCOME
+            detailed, merchants = details[0]
+            amount = -round(rng.lognormvariate(0, sigma) * median, 2)
+            account = 0
+        else:
+            primary, _, details, (median, sigma) = rng.choices(CATEGORIES, [c[1] for c in CATEGORIES])[0]
+            detailed, merchants = rng.choice(details)
+            amount = round(rng.lognormvariate(0, sigma) * median, 2)
+            account = rng.randrange(self.accounts_per_item)
+        merchant = rng.choice(merchants)
+
+        # Newest transactions come first in the stream, older history later
+        age = min(int(index * self.days / max(self.transactions_per_item, 1)), self.days - 1)
+        tx_date = self.today - timedelta(days=age)
+        pending = age < 2 and revision == 0 and rng.random() < 0.5
+        if revision:
+            amount = round(amount * (1 + 0.05 * revision), 2)
+
+        return {
+            'account_id': self.account_id(item, account),
+            'amount': amount,
+            'iso_currency_code': 'USD',
+            'unofficial_currency_code': None,
+            'category': [primary, detailed],
+            'category_id': None,
+            'date': tx_date.isoformat(),
+            'location': {
+                'address': None, 'city': None, 'region': None, 'postal_code': None,
+                'country': None, 'lat': None, 'lon': None, 'store_number': None,
+            },
+            'name': merchant or detailed.replace('_', ' ').title(),
+            'payment_meta': {
+                'reference_number': None, 'ppd_id': None, 'payee': None, 'by_order_of': None,
+                'payer': None, 'payment_method': None, 'payment_processor': None, 'reason': None,
+            },
+            'pending': pending,
+            'pending_transaction_id': None,
+            'account_owner': None,
+            'transaction_id': self.transaction_id(item, index),
+            'authorized_date': tx_date.isoformat(),
+            'authorized_datetime': None,
+            'datetime': None,
+            'payment_channel': rng.choice(PAYMENT_CHANNELS),
+            'transaction_code': None,
+            'merchant_name': merchant,
+        }
+
+    def sync_page(self, item, cursor, count):
+        """Build one transactions/sync page starting at `cursor`"""
+        offset = int(cursor[1:]) if cursor and cursor.startswith('c') else 0
+        total = self.transactions_per_item
+        end = min(offset + count, total)
+
+        added = [self.transaction(item, i) for i in range(offset, end)]
+        modified = []
+        removed = []
+        if offset:
+            # Touch earlier rows: pick them from what has already been delivered
+            rng = random.Random((self.seed << 20) ^ (item << 8) ^ offset)
+            for _ in range(int((end - offset) * self.modified_rate)):
+                modified.append(self.transaction(item, rng.randrange(offset), revision=1))
+            for _ in range(int((end - offset) * self.removed_rate)):
+                removed.append({'transaction_id': self.transaction_id(item, rng.randrange(offset))})
+
+        return {
+            'added': added,
+            'modified': modified,
+            'removed': removed,
+            'next_cursor': f'c{end}',
+            'has_more': end < total,
+            'request_id': uuid.uuid4().hex[:15],
+        }
+
+    def range_page(self, item, start_date, end_date, offset, count):
+        """Build one transactions/get page for an inclusive date range"""
+        total = self.transactions_per_item
+        # age(index) = index * days // total, so the ages a range covers map
+        # back to a contiguous block of indexes
+        first_age = max((self.today - end_date).days, 0)
+        last_age = (self.today - start_date).days
+        lo = min(-(-first_age * total // self.days), total)
+        hi = min(-(-(last_age + 1) * total // self.days), total)
+        hi = max(hi, lo)
+
+        start = min(lo + offset, hi)
+        end = min(start + count, hi)
+        return {
+            'accounts': self.accounts(item),
+            'transactions': [self.transaction(item, i) for i in range(start, end)],
+            'total_transactions': hi - lo,
+            'item': self.item_payload(item),
+            'request_id': uuid.uuid4().hex[:15],
+        }
+
+    # -- faults ------------------------------------------------------------
+
+    def delay(self):
+        if self.latency_ms or self.latency_jitter_ms:
+            with self._lock:
+                jitter = self._fault_rng.uniform(0, self.latency_jitter_ms)
+            time.sleep((self.latency_ms + jitter) / 1000)
+
+    def rate_limited(self):
+        if not self.rate_limit_rate:
+            return False
+        with self._lock:
+            return self._fault_rng.random() < self.rate_limit_rate
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+
+def plaid_error(error_type, error_code, message):
+    return {
+        'error_type': error_type,
+        'error_code': error_code,
+        'error_message': message,
+        'display_message': None,
+        'request_id': uuid.uuid4().hex[:15],
+    }
+
+
+class FakePlaidHandler(BaseHTTPRequestHandler):
+    server_version = 'FakePlaid/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send(400, plaid_error('INVALID_REQUEST', 'INVALID_BODY', 'Body is not valid JSON'))
+
+        endpoint = self.path.rstrip('/')
+        fake.count(endpoint)
+        fake.delay()
+
+        if fake.rate_limited():
+            return self._send(429, plaid_error('RATE_LIMIT_EXCEEDED', 'TRANSACTIONS_SYNC_LIMIT',
+                                               'rate limit exceeded for this item'))
+
+        if endpoint == '/link/token/create':
+            return self._send(200, {
+                'link_token': f'link-sandbox-{uuid.uuid4()}',
+                'expiration': (datetime.now(timezone.utc) + timedelta(hours=4)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'request_id': uuid.uuid4().hex[:15],
+            })
+
+        if endpoint == '/item/public_token/exchange':
+            item = fake.item_for_public_token(body.get('public_token', ''))
+            return self._send(200, {
+                'access_token': fake.access_token(item),
+                'item_id': fake.item_id(item),
+                'request_id': uuid.uuid4().hex[:15],
+            })
+
+        item = fake.item_from_access_token(body.get('access_token'))
+        if item is None:
+            return self._send(400, plaid_error('INVALID_INPUT', 'INVALID_ACCESS_TOKEN',
+                                               'provided access token is in an invalid format'))
+        if fake.login_required(item):
+            return self._send(400, plaid_error('ITEM_ERROR', 'ITEM_LOGIN_REQUIRED',
+                                               'the login details of this item have changed'))
+
+        if endpoint == '/accounts/get':
+            return self._send(200, {
+                'accounts': fake.accounts(item),
+                'item': fake.item_payload(item),
+                'request_id': uuid.uuid4().hex[:15],
+            })
+
+        if endpoint == '/item/remove':
+            return self._send(200, {'request_id': uuid.uuid4().hex[:15]})
+
+        if endpoint == '/transactions/sync':
+            count = min(int(body.get('count') or DEFAULT_SYNC_COUNT), MAX_SYNC_COUNT)
+            return self._send(200, fake.sync_page(item, body.get('cursor'), count))
+
+        if endpoint == '/transactions/get':
+            options = body.get('options') or {}
+            try:
+                start_date = date.fromisoformat(body['start_date'])
+                end_date = date.fromisoformat(body['end_date'])
+            except (KeyError, TypeError, ValueError):
+                return self._send(400, plaid_error('INVALID_REQUEST', 'INVALID_FIELD',
+                                                   'start_date and end_date must be YYYY-MM-DD'))
+            count = min(int(options.get('count') or DEFAULT_SYNC_COUNT), MAX_SYNC_COUNT)
+            return self._send(200, fake.range_page(item, start_date, end_date,
+                                                   int(options.get('offset') or 0), count))
+
+        return self._send(404, plaid_error('INVALID_REQUEST', 'NOT_FOUND', f'unknown endpoint {endpoint}'))
+
+
+def serve(fake, host='127.0.0.1', port=0, verbose=False):
+    """
+    Start the fake server on a background thread.
+
+    Returns:
+        (server, base_url); call server.shutdown() when done
+    """
+    server = ThreadingHTTPServer((host, port), FakePlaidHandler)
+    server.daemon_threads = True
+    server.fake = fake
+    server.verbose = verbose
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--transactions', type=int, default=10000, help='Transactions per item')
+    parser.add_argument('--accounts', type=int, default=3, help='Accounts per item')
+    parser.add_argument('--modified-rate', type=float, default=0.02)
+    parser.add_argument('--removed-rate', type=float, default=0.01)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0, help='Fraction of requests answered with 429')
+    parser.add_argument('--login-required-rate', type=float, default=0,
+                        help='Fraction of items stuck in ITEM_LOGIN_REQUIRED')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakePlaid(
+        seed=args.seed, transactions_per_item=args.transactions, accounts_per_item=args.accounts,
+        modified_rate=args.modified_rate, removed_rate=args.removed_rate,
+        latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+        rate_limit_rate=args.rate_limit_rate, login_required_rate=args.login_required_rate,
+    )
+    server, url = serve(fake, args.host, args.port, args.verbose)
+    print(f"Fake Plaid listening on {url} (set PLAID_HOST={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+End-to-end ingest benchmark against the fake Plaid server
+
+Links one item through PlaidService and times sync_and_save_transactions
+over the whole history. Every scale runs in its own process so peak memory
+is measured cleanly.
+
+    python -m benchmarks.ingest                       # 10k, 100k and 1M rows
+    python -m benchmarks.ingest --scales 10000 --latency-ms 40
+    DATABASE_URL=postgresql://localhost/bench python -m benchmarks.ingest --output pg_ingest.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_single(rows, args):
+    """Run one ingest in this process and return its measurements"""
+    from benchmarks.fake_plaid import FakePlaid, serve
+
+    fake = FakePlaid(
+        seed=args.seed, transactions_per_item=rows,
+        modified_rate=args.modified_rate, removed_rate=args.removed_rate,
+        latency_ms=args.latency_ms,
+    )
+    server, url = serve(fake)
+
+    tmp = None
+    if not os.getenv('DATABASE_URL'):
+        tmp = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'ingest.db')}"
+    os.environ['PLAID_HOST'] = url
+    os.environ.setdefault('PLAID_CLIENT_ID', 'fake-client')
+    os.environ.setdefault('PLAID_SECRET', 'fake-secret')
+
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+
+    from app import create_app
+    from app.models import db, User, Transaction
+    from app.utils.plaid_service import plaid_service
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(email=f'ingest-{os.getpid()}-{time.time_ns()}@bench.example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+
+        # A distinct item per run keeps repeated runs on a shared database apart
+        item_number = time.time_ns() % 10 ** 9
+        exchange = plaid_service.exchange_public_token(f'public-fake-{item_number}')
+        accounts = plaid_service.get_accounts(exchange['access_token'])
+        saved = plaid_service.save_accounts_for_user(
+            user.id, exchange['access_token'], exchange['item_id'], accounts['accounts'], 'Fake Bank'
+        )['accounts']
+
+        baseline_rss = peak_rss_mb()
+        started = time.perf_counter()
+        result = plaid_service.sync_and_save_transactions(saved[0])
+        elapsed = time.perf_counter() - started
+
+        stored = db.session.query(Transaction).join(Transaction.account).filter_by(user_id=user.id).count()
+
+    measurements = {
+        'rows': rows,
+        'success': result.get('success'),
+        'added': result.get('added'),
+        'modified': result.get('modified'),
+        'removed': result.get('removed'),
+        'stored': stored,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round((result.get('added', 0) + result.get('modified', 0)
+                                  + result.get('removed', 0)) / elapsed, 1) if elapsed else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'rss_growth_mb': round(peak_rss_mb() - baseline_rss, 1),
+        'plaid_requests': fake.requests,
+    }
+    if args.tracemalloc:
+        measurements['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+
+    server.shutdown()
+    if tmp:
+        tmp.cleanup()
+    return measurements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--modified-rate', type=float, default=0.02)
+    parser.add_argument('--removed-rate', type=float, default=0.01)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated Plaid latency per request')
+    parser.add_argument('--tracemalloc', action='store_true', help='Also report Python heap peak (slower)')
+    parser.add_argument('--timeout', type=float, default=3600, help='Per-scale timeout in seconds')
+    parser.add_argument('--output', default='bench_ingest.json')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.single, args)))
+        return
+
+    forwarded = ['--seed', str(args.seed), '--modified-rate', str(args.modified_rate),
+                 '--removed-rate', str(args.removed_rate), '--latency-ms', str(args.latency_ms)]
+    if args.tracemalloc:
+        forwarded.append('--tracemalloc')
+
+    results = []
+    for rows in args.scales:
+        print(f"Ingesting {rows:,} rows...")
+        try:
+            proc = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.ingest', '--single', str(rows), *forwarded],
+                capture_output=True, text=True, timeout=args.timeout,
+            )
+        except subprocess.TimeoutExpired:
+            results.append({'rows': rows, 'error': f'timed out after {args.timeout:.0f}s'})
+            print(f"  timed out after {args.timeout:.0f}s")
+            continue
+        if proc.returncode != 0:
+            results.append({'rows': rows, 'error': proc.stderr[-2000:]})
+            print(f"  failed:\n{proc.stderr[-2000:]}")
+            continue
+        measurements = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(measurements)
+        print(f"  {measurements['rows_per_second']:,} rows/s  {measurements['seconds']}s  "
+              f"peak RSS {measurements['peak_rss_mb']} MB (+{measurements['rss_growth_mb']} MB during sync)")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'database': os.getenv('DATABASE_URL', 'sqlite (temporary)').split(':', 1)[0],
+            'latency_ms': args.latency_ms,
+            'results': results,
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Load test comparing gunicorn worker models
+
+Starts gunicorn once per worker model using gunicorn.conf.py, drives it with
+concurrent keep-alive clients for a fixed duration and reports throughput and
+latency percentiles for each mode.
+
+    python benchmarks/load_test.py --modes sync gthread gevent --duration 15
+    python benchmarks/load_test.py --path /health --path /auth/login --clients 64
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATHS = ['/health', '/', '/auth/login']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(mode, port, workers, db_url):
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'GUNICORN_WORKER_CLASS': mode,
+        'LOG_LEVEL': 'warning',
+        'DATABASE_URL': db_url,
+    })
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+
+def client_loop(port, paths, stop_at, latencies, errors, lock):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    local_latencies = []
+    local_errors = 0
+    i = 0
+    while time.time() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def run_mode(mode, args, db_url):
+    server = start_server(mode, args.port, args.workers, db_url)
+    try:
+        if not wait_for_server(args.port):
+            server.terminate()
+            _, stderr = server.communicate(timeout=10)
+            return {'mode': mode, 'error': stderr.decode(errors='replace')[-2000:]}
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        stop_at = time.time() + args.duration
+        threads = [
+            threading.Thread(target=client_loop, args=(args.port, args.path, stop_at, latencies, errors, lock))
+            for _ in range(args.clients)
+        ]
+        started = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - started
+
+        latencies.sort()
+        return {
+            'mode': mode,
+            'requests': len(latencies),
+            'errors': sum(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--path', action='append', help='Path to request (repeatable)')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, help='Override WEB_CONCURRENCY for every mode')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+    args.path = args.path or DEFAULT_PATHS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = os.getenv('DATABASE_URL') or f"sqlite:///{os.path.join(tmp, 'loadtest.db')}"
+        results = []
+        for mode in args.modes:
+            print(f"Running {mode} for {args.duration:.0f}s with {args.clients} clients...")
+            result = run_mode(mode, args, db_url)
+            results.append(result)
+            if 'error' in result:
+                print(f"  {mode} failed to start:\n{result['error']}")
+            else:
+                print(f"  {result['rps']} req/s  p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  "
+                      f"p99={result['p99_ms']}ms  errors={result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'paths': args.path, 'clients': args.clients, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
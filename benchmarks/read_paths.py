@@ -0,0 +1,167 @@
+"""
+Read-path benchmark for the financials API and dashboard
+
+Measures p50/p95 latency and queries per request for each read endpoint,
+in-process through the Flask test client so network noise stays out of the
+numbers. Results are written as JSON for comparing runs.
+
+    python -m benchmarks.read_paths --users 20 --transactions 10000
+    DATABASE_URL=postgresql://localhost/bench python -m benchmarks.read_paths --output pg.json
+    python -m benchmarks.read_paths --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+
+
+def scenarios(deep_page):
+    month_ago = (date.today() - timedelta(days=30)).isoformat()
+    today = date.today().isoformat()
+    return {
+        'overview': '/api/financials/overview',
+        'accounts': '/api/financials/accounts',
+        'transactions_first_page': '/api/financials/transactions?page=1&per_page=50',
+        'transactions_deep_page': f'/api/financials/transactions?page={deep_page}&per_page=50',
+        'transactions_large_page': '/api/financials/transactions?page=1&per_page=500',
+        'transactions_search': '/api/financials/transactions?search=coffee&per_page=50',
+        'transactions_filtered': (f'/api/financials/transactions?category=FOOD_AND_DRINK'
+                                  f'&start_date={month_ago}&end_date={today}&per_page=50'),
+        'categories': '/api/financials/categories',
+        'dashboard': '/dashboard',
+    }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(app, user_ids, iterations, warmup, deep_page, only=None):
+    from app.utils.query_profiler import profile_queries
+
+    client = app.test_client()
+    client.get('/health')  # trigger table creation outside the measurements
+    results = {}
+
+    for name, path in scenarios(deep_page).items():
+        if only and name not in only:
+            continue
+        latencies = []
+        queries = []
+        status_codes = set()
+        for i in range(warmup + iterations):
+            user_id = user_ids[i % len(user_ids)]
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+            with profile_queries() as profile:
+                start = time.perf_counter()
+                response = client.get(path)
+                elapsed = time.perf_counter() - start
+            status_codes.add(response.status_code)
+            if i >= warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(profile.count)
+
+        results[name] = {
+            'path': path,
+            'iterations': iterations,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries_per_request': round(statistics.fmean(queries), 2),
+            'status_codes': sorted(status_codes),
+            'response_bytes': len(response.data),
+        }
+        print(f"  {name:28s} p50={results[name]['p50_ms']:8.2f}ms  p95={results[name]['p95_ms']:8.2f}ms  "
+              f"queries={results[name]['queries_per_request']:5.1f}")
+    return results
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'scenario':28s} {'p50 before':>11s} {'p50 after':>10s} {'change':>8s} {'queries':>12s}")
+    for name, new in after['results'].items():
+        old = before['results'].get(name)
+        if not old:
+            continue
+        change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+        print(f"{name:28s} {old['p50_ms']:10.2f}ms {new['p50_ms']:9.2f}ms {change:+7.1f}% "
+              f"{old['queries_per_request']:5.1f} -> {new['queries_per_request']:<5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--transactions', type=int, default=5000, help='Transactions per user')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--deep-page', type=int, default=80)
+    parser.add_argument('--scenario', action='append', help='Only run these scenarios (repeatable)')
+    parser.add_argument('--output', default='bench_read_paths.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    tmp = None
+    if not os.getenv('DATABASE_URL'):
+        tmp = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+
+    # Imported only now: app.config reads DATABASE_URL at import time
+    from app import create_app
+    from app.models import db
+    from benchmarks.datagen import generate
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        dialect = db.engine.dialect.name
+        print(f"Preparing {args.users} users x {args.transactions} transactions on {dialect}...")
+        user_ids = generate(args.users, args.transactions, seed=args.seed, log=None)
+
+    print("Running scenarios:")
+    results = run(app, user_ids, args.iterations, args.warmup, args.deep_page, args.scenario)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git_revision': git_revision(),
+            'database': dialect,
+            'python': platform.python_version(),
+            'scale': {'users': args.users, 'transactions_per_user': args.transactions, 'seed': args.seed},
+            'results': results,
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+CPU cost of turning transaction rows into a JSON response body
+
+Compares the ORM path (Transaction entities -> dicts -> jsonify) with the
+lean path the listing endpoints use (column-pruned Core SELECT -> tuples ->
+app.utils.fast_json), split into fetch and encode, and reports process CPU
+milliseconds per 1,000 rows. The database is local, so fetch time is mostly
+driver and hydration work rather than waiting.
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --rows 500 5000 --output serialization.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+
+def cpu_ms(fn, repeat):
+    """Median process CPU milliseconds of fn() over repeat runs, and its last result"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def measure(app, user_id, rows, repeat):
+    from flask import jsonify
+    from sqlalchemy import select
+    from app.models import db, BankAccount, Transaction
+    from app.utils.fast_json import dumps, records
+
+    fields = ('id', 'name', 'merchant_name', 'amount', 'date', 'category', 'detailed_category', 'account_id')
+    owned = (BankAccount.user_id == user_id, BankAccount.is_active.is_(True))
+
+    def orm_fetch():
+        db.session.expunge_all()
+        return (Transaction.query.join(BankAccount).filter(*owned)
+                .order_by(Transaction.date.desc()).limit(rows).all())
+
+    def orm_encode(transactions):
+        return jsonify({'transactions': [{
+            'id': tx.id,
+            'name': tx.name,
+            'merchant_name': tx.merchant_name,
+            'amount': float(tx.amount),
+            'date': tx.date.isoformat(),
+            'category': tx.primary_category,
+            'detailed_category': tx.detailed_category,
+            'account_id': tx.account_id
+        } for tx in transactions]}).get_data()
+
+    def lean_fetch():
+        return db.session.execute(
+            select(Transaction.id, Transaction.name, Transaction.merchant_name, Transaction.amount,
+                   Transaction.date, Transaction.primary_category, Transaction.detailed_category,
+                   Transaction.account_id)
+            .join(BankAccount, BankAccount.id == Transaction.account_id)
+            .where(*owned)
+            .order_by(Transaction.date.desc())
+            .limit(rows)
+        ).all()
+
+    def lean_encode(result):
+        return dumps({'transactions': records(fields, result)})
+
+    with app.test_request_context():
+        orm_fetch_ms, transactions = cpu_ms(orm_fetch, repeat)
+        orm_encode_ms, orm_body = cpu_ms(lambda: orm_encode(transactions), repeat)
+        lean_fetch_ms, result = cpu_ms(lean_fetch, repeat)
+        lean_encode_ms, lean_body = cpu_ms(lambda: lean_encode(result), repeat)
+        if json.loads(orm_body) != json.loads(lean_body):
+            raise SystemExit('ORM and lean paths produced different JSON')
+
+    fetched = len(result)
+    per_1k = 1000 / fetched if fetched else 0
+    orm_ms = (orm_fetch_ms + orm_encode_ms) * per_1k
+    lean_ms = (lean_fetch_ms + lean_encode_ms) * per_1k
+    return {
+        'rows': fetched,
+        'orm_fetch_ms_per_1k': round(orm_fetch_ms * per_1k, 3),
+        'orm_encode_ms_per_1k': round(orm_encode_ms * per_1k, 3),
+        'lean_fetch_ms_per_1k': round(lean_fetch_ms * per_1k, 3),
+        'lean_encode_ms_per_1k': round(lean_encode_ms * per_1k, 3),
+        'orm_total_ms_per_1k': round(orm_ms, 3),
+        'lean_total_ms_per_1k': round(lean_ms, 3),
+        'cpu_saved_ms_per_1k': round(orm_ms - lean_ms, 3),
+        'speedup': round(orm_ms / lean_ms, 2) if lean_ms else None,
+        'response_bytes': len(lean_body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_serialization.json')
+    args = parser.parse_args()
+
+    tmp = None
+    if not os.getenv('DATABASE_URL'):
+        tmp = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+
+    # Imported only now: app.config reads DATABASE_URL at import time
+    from app import create_app
+    from app.models import db
+    from app.utils.fast_json import ENCODER
+    from benchmarks.datagen import generate
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        dialect = db.engine.dialect.name
+        print(f"Preparing {max(args.rows)} transactions on {dialect} (encoder: {ENCODER})...")
+        user_id = generate(1, max(args.rows), seed=args.seed, log=None)[0]
+
+        results = {}
+        for rows in args.rows:
+            results[rows] = measure(app, user_id, rows, args.repeat)
+            r = results[rows]
+            print(f"  {rows:6d} rows  ORM {r['orm_total_ms_per_1k']:7.2f}ms/1k  lean {r['lean_total_ms_per_1k']:7.2f}ms/1k"
+                  f"  saved {r['cpu_saved_ms_per_1k']:7.2f}ms/1k  ({r['speedup']}x)")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'database': dialect,
+            'encoder': ENCODER,
+            'python': platform.python_version(),
+            'results': results,
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Gunicorn runtime profile for BBA Services
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment so the same file works
+on Railway, in Docker and locally:
+
+    GUNICORN_WORKER_CLASS   gthread (default), gevent or sync
+    WEB_CONCURRENCY         number of worker processes
+    GUNICORN_THREADS        threads per worker (gthread only)
+    GUNICORN_CONNECTIONS    concurrent greenlets per worker (gevent only)
+    GUNICORN_MAX_REQUESTS   recycle a worker after this many requests (0 = never)
+    GUNICORN_TIMEOUT        hard worker timeout in seconds
+    GUNICORN_PRELOAD        load the app in the master before forking (default on)
+    LOG_LEVEL               gunicorn log level
+    METRICS_DIR             where workers share metrics snapshots
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+cpu_count = multiprocessing.cpu_count()
+
+# Server socket
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+backlog = _env_int('GUNICORN_BACKLOG', 2048)
+
+# Worker model
+#   gthread - default; threads cover the blocking Plaid/Brevo/Vonage calls
+#   gevent  - cooperative mode for I/O-heavy deployments (requires gevent); also
+#             keeps /plaid/events streams open without tying up a thread
+#   sync    - one request per process, mostly useful as a load-test baseline
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before anything else imports socket/ssl, otherwise the preloaded
+    # app holds unpatched references and calls block the whole worker.
+    from gevent import monkey
+    monkey.patch_all()
+
+    # Greenlets multiplex I/O inside a process, so one worker per core is enough
+    workers = _env_int('WEB_CONCURRENCY', cpu_count)
+    worker_connections = _env_int('GUNICORN_CONNECTIONS', 200)
+elif worker_class == 'gthread':
+    workers = _env_int('WEB_CONCURRENCY', min(cpu_count * 2 + 1, 8))
+    threads = _env_int('GUNICORN_THREADS', 4)
+else:
+    workers = _env_int('WEB_CONCURRENCY', cpu_count * 2 + 1)
+
+# Preload the app in the master so workers share its memory copy-on-write
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+
+# Recycle workers periodically to cap slow memory growth; jitter keeps them
+# from all restarting at the same moment
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', max(max_requests // 10, 0))
+
+# Timeouts
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Logging
+loglevel = os.getenv('LOG_LEVEL', 'info')
+accesslog = '-'
+errorlog = '-'
+
+# Keep worker heartbeat files off overlay filesystems in containers
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Workers dump metrics snapshots here so /metrics can aggregate all of them.
+# Must be set before the app (and its Config) is loaded.
+_metrics_root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+os.environ.setdefault('METRICS_DIR', os.path.join(_metrics_root, 'bba-metrics'))
+
+
+def on_starting(server):
+    """Start each master with empty metrics so counters don't mix across deploys"""
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+
+
+def post_fork(server, worker):
+    """
+    Drop database connections inherited from the master.
+
+    With preload_app the master may have opened pooled connections (e.g. while
+    creating tables). Sharing a socket between processes corrupts the protocol
+    stream, so each worker starts with fresh pools. close=False leaves the
+    parent's connections untouched instead of closing them out from under it.
+    """
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen not installed - psycopg2 calls will block the gevent loop")
+
+    from app.models import db
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+    server.log.info(f"Worker {worker.pid} ready ({worker_class})")
+
+
+def worker_exit(server, worker):
+    """Write the exiting worker's final metrics snapshot"""
+    from app.utils.metrics import registry
+
+    try:
+        registry.flush(os.environ['METRICS_DIR'], force=True)
+    except OSError as e:
+        server.log.warning(f"Could not write metrics snapshot: {e}")
+
+
+def child_exit(server, worker):
+    """Fold an exited worker's metrics into the retired total and drop its file"""
+    from app.utils.metrics import retire_process
+
+    try:
+        retire_process(os.environ['METRICS_DIR'], worker.pid)
+    except OSError as e:
+        server.log.warning(f"Could not retire metrics of worker {worker.pid}: {e}")
@@ -0,0 +1,80 @@
+import itertools
+from datetime import date
+
+import pytest
+
+from app import create_app
+from app.config import Config, _engine_options
+from app.models import db, User, BankAccount, Transaction
+from app.utils import categorization, dictionary, partitions
+
+
+def _configure(monkeypatch, url):
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', url)
+    monkeypatch.setattr(Config, 'SQLALCHEMY_ENGINE_OPTIONS', _engine_options(url))
+    monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', {})
+    monkeypatch.setattr(Config, 'PLAID_BACKFILL_ENABLED', False)
+    monkeypatch.setattr(Config, 'METRICS_DIR', None)
+
+
+def _reset_caches():
+    """Drop process-wide caches of ids and state from an earlier test's database"""
+    for table in dictionary.DICTIONARIES.values():
+        table._ids.clear()
+        table._values.clear()
+    dictionary._backfill_state.update(complete=False, after_id={})
+    categorization._matchers.clear()
+    partitions._state['checked_at'] = 0.0
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app on an empty SQLite database, inside an app context"""
+    _configure(monkeypatch, f"sqlite:///{tmp_path / 'test.db'}")
+    _reset_caches()
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(**fields):
+        user = User(email=f"user{next(_ids)}@example.com", password_hash='x', **fields)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+
+@pytest.fixture
+def make_account(app):
+    def make_account(user, **fields):
+        n = next(_ids)
+        fields.setdefault('plaid_item_id', f'item-{n}')
+        fields.setdefault('institution_name', 'Test Bank')
+        fields.setdefault('account_type', 'depository')
+        fields.setdefault('mask', f'{n:04d}')
+        account = BankAccount(user_id=user.id, plaid_account_id=f'account-{n}', plaid_access_token='token', **fields)
+        db.session.add(account)
+        db.session.commit()
+        return account
+    return make_account
+
+
+@pytest.fixture
+def make_transaction(app):
+    def make_transaction(account, amount, tx_date=date(2026, 3, 2), name='Payment', **fields):
+        tx = Transaction(account_id=account.id, plaid_transaction_id=f'tx-{next(_ids)}', name=name,
+                         amount=amount, date=tx_date, **fields)
+        db.session.add(tx)
+        db.session.commit()
+        return tx
+    return make_transaction
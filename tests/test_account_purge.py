@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+
+from app.models import db, BankAccount, CategoryRule, Transaction, TransactionChange, User
+from app.utils import account_purge, categorization, transfers
+
+DAY = date(2026, 3, 2)
+
+
+def _remove(account):
+    account.is_active = False
+    account.deactivated_at = datetime.utcnow() - timedelta(days=60)
+    db.session.commit()
+
+
+def test_purge_unpairs_and_rematches_transfers(monkeypatch, make_user, make_account, make_transaction):
+    revoked = []
+    monkeypatch.setattr(account_purge.plaid_service, 'remove_item',
+                        lambda token: revoked.append(token) or {'success': True, 'error': None})
+    user = make_user()
+    removed, checking, savings = make_account(user), make_account(user), make_account(user)
+    outflow = make_transaction(removed, 500.0, DAY)
+    inflow = make_transaction(checking, -500.0, DAY)
+    purchase = make_transaction(removed, 12.5, DAY)
+    purged_ids = sorted([outflow.id, purchase.id])
+    removed_id = removed.id
+    transfers.match(user.id, [(inflow.amount, inflow.date)])
+    db.session.commit()
+    assert db.session.get(Transaction, inflow.id).transfer_pair_id == purged_ids[0]
+    _remove(removed)
+    # Stored after the pair was made; fits the inflow once its partner is gone
+    other = make_transaction(savings, 500.0, DAY + timedelta(days=1))
+    version = db.session.get(User, user.id).data_version
+
+    result = account_purge.purge(grace_seconds=86400)
+
+    assert result == {'accounts': 1, 'transactions': 2, 'items': 1}
+    assert revoked == ['token']
+    db.session.expire_all()
+    assert db.session.query(Transaction).filter(Transaction.id.in_(purged_ids)).count() == 0
+    assert db.session.get(Transaction, inflow.id).transfer_pair_id == other.id
+    assert db.session.get(Transaction, other.id).transfer_pair_id == inflow.id
+    assert db.session.get(User, user.id).data_version > version
+    assert db.session.get(BankAccount, removed_id) is None
+    deleted = db.session.query(TransactionChange.transaction_id).filter_by(op='delete').all()
+    assert sorted(row.transaction_id for row in deleted) == purged_ids
+
+
+def test_purge_leaves_accounts_in_grace_period(make_user, make_account, make_transaction):
+    user = make_user()
+    account = make_account(user, is_active=False, deactivated_at=datetime.utcnow())
+    make_transaction(account, 10.0)
+
+    assert account_purge.purge(grace_seconds=86400) == {'accounts': 0, 'transactions': 0, 'items': 0}
+    assert db.session.query(Transaction).count() == 1
+
+
+def test_revoking_an_item_deletes_rules_scoped_to_its_accounts(monkeypatch, make_user, make_account):
+    monkeypatch.setattr(account_purge.plaid_service, 'remove_item', lambda token: {'success': True, 'error': None})
+    user = make_user()
+    removed, kept = make_account(user), make_account(user)
+    for account in (removed, kept):
+        assert categorization.save_rule(user.id, {'category': 'Rent', 'account_id': account.id})['success']
+    _remove(removed)
+    version = db.session.get(User, user.id).rules_version
+
+    assert account_purge.purge(grace_seconds=86400)['items'] == 1
+    db.session.expire_all()
+    assert [rule.account_id for rule in CategoryRule.query.all()] == [kept.id]
+    assert db.session.get(User, user.id).rules_version > version
@@ -0,0 +1,35 @@
+def _client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+        s['_fresh'] = True
+    return client
+
+
+def test_batch_requires_known_sections(app, make_user):
+    client = _client(app, make_user().id)
+
+    missing = client.get('/api/financials/batch')
+    assert missing.status_code == 400
+    assert 'include is required' in missing.get_json()['error']
+
+    unknown = client.get('/api/financials/batch?include=accounts,ledger')
+    assert unknown.status_code == 400
+    assert unknown.get_json()['error'] == 'Unknown sections: ledger'
+
+
+def test_batch_trims_sections_to_requested_fields(app, make_user, make_account):
+    user = make_user()
+    user_id = user.id
+    make_account(user, account_name='Checking', current_balance=250.0)
+    client = _client(app, user_id)
+
+    response = client.get('/api/financials/batch?include=accounts,totals'
+                          '&fields[accounts]=name,balance&fields[totals]=net_worth')
+    assert response.status_code == 200
+    assert response.get_json() == {'accounts': [{'name': 'Checking', 'balance': 250.0}],
+                                   'totals': {'net_worth': 250.0}}
+
+    bad = client.get('/api/financials/batch?include=accounts&fields[accounts]=name,secret')
+    assert bad.status_code == 400
+    assert bad.get_json()['error'] == 'Unknown fields for accounts: secret'
@@ -0,0 +1,73 @@
+from collections import namedtuple
+from datetime import date, timedelta
+
+from app.models import db, Transaction, User
+from app.utils import categorization, dictionary
+
+TODAY = date(2026, 3, 20)
+
+
+def _rule_categories(*transactions):
+    db.session.expire_all()
+    ids = [db.session.get(Transaction, tx.id).rule_category_id for tx in transactions]
+    names = dictionary.categories.values(ids)
+    return [names[id_][0] if id_ is not None else None for id_ in ids]
+
+
+def test_rule_edits_reapply_recent_rows_and_leave_history_to_the_scheduler(make_user, make_account,
+                                                                           make_transaction):
+    user = make_user()
+    account = make_account(user)
+    recent = make_transaction(account, 4.5, TODAY - timedelta(days=2), merchant_name='Blue Bottle Coffee')
+    old = make_transaction(account, 4.5, TODAY - timedelta(days=200), merchant_name='Blue Bottle Coffee')
+    assert categorization.save_rule(user.id, {'category': 'Coffee', 'merchant_contains': 'bottle'})['success']
+
+    assert categorization.reapply_recent(user.id, TODAY - timedelta(days=30)) == 1
+    assert _rule_categories(recent, old) == ['Coffee', None]
+    assert db.session.get(User, user.id).rules_applied_version < db.session.get(User, user.id).rules_version
+
+    assert categorization.reapply_pending() == 1
+    assert _rule_categories(recent, old) == ['Coffee', 'Coffee']
+    assert categorization.reapply_pending() == 0
+
+
+Rule = namedtuple('Rule', 'merchant_contains min_amount max_amount account_id category_id')
+
+
+def test_matcher_takes_the_first_matching_rule():
+    matcher = categorization.Matcher([
+        Rule('coffee', None, 10.0, None, 1),   # small coffee purchases
+        Rule(None, 100.0, None, None, 2),      # anything from 100 up
+        Rule('coffee', None, None, None, 3),   # other coffee purchases
+        Rule(None, None, None, 7, 4),          # anything else on account 7
+        Rule('roast', None, None, 8, 5),       # roasters, on account 8 only
+    ])
+    assert matcher.category_for('Blue Bottle Coffee', 4.5, 7) == 1
+    assert matcher.category_for('Blue Bottle Coffee', 150.0, 7) == 2
+    assert matcher.category_for('Blue Bottle Coffee', 50.0, 7) == 3
+    assert matcher.category_for('Grocery', 50.0, 7) == 4
+    assert matcher.category_for('Good Roasters', 50.0, 8) == 5
+    assert matcher.category_for('Good Roasters', 50.0, 9) is None
+    assert matcher.category_for(None, -20.0, 9) is None
+
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = categorization._Automaton(['he', 'she', 'hers', 'his'])
+    assert automaton.matches('ushers') == {0, 1, 2}
+    assert automaton.matches('this') == {3}
+    assert automaton.matches('xyz') == set()
+
+
+def test_rules_apply_by_position_then_age(make_user, make_account):
+    user = make_user()
+    account = make_account(user)
+    categorization.save_rule(user.id, {'category': 'Later', 'merchant_contains': 'market', 'position': 1})
+    categorization.save_rule(user.id, {'category': 'Older', 'merchant_contains': 'market'})
+    categorization.save_rule(user.id, {'category': 'Newer', 'merchant_contains': 'farmers'})
+
+    rows = categorization.apply(user.id, [
+        {'name': 'Farmers Market', 'merchant_name': None, 'amount': 12.0, 'account_id': account.id},
+        {'name': 'Bakery', 'merchant_name': 'Farmers Bakery', 'amount': 12.0, 'account_id': account.id},
+    ])
+    names = dictionary.categories.values([row['rule_category_id'] for row in rows])
+    assert [names[row['rule_category_id']][0] for row in rows] == ['Older', 'Newer']
@@ -0,0 +1,69 @@
+import gzip
+
+from app.models import db
+from app.routes import financials_api
+from app.utils import categorization, data_version
+
+
+def _client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+        s['_fresh'] = True
+    return client
+
+
+def test_compressed_variants_revalidate_against_the_body_etag(app, make_user):
+    user_id = make_user().id
+    for n in range(20):
+        categorization.save_rule(user_id, {'category': f'Category {n}', 'merchant_contains': f'merchant {n}'})
+    client = _client(app, user_id)
+
+    plain = client.get('/api/financials/rules', headers={'Accept-Encoding': 'identity'})
+    zipped = client.get('/api/financials/rules', headers={'Accept-Encoding': 'gzip'})
+    tag = plain.headers['ETag'].strip('"')
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert zipped.headers['ETag'] == f'"{tag}-gzip"'
+    assert gzip.decompress(zipped.data) == plain.data
+
+    # Any variant of the current tag revalidates, whatever the request accepts now
+    for sent, accept in ((f'"{tag}-gzip"', 'gzip'), (f'"{tag}-gzip"', 'identity'), (f'"{tag}-br"', 'gzip'),
+                         (f'"{tag}"', 'gzip')):
+        response = client.get('/api/financials/rules', headers={'If-None-Match': sent, 'Accept-Encoding': accept})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == sent
+
+    stale = client.get('/api/financials/rules', headers={'If-None-Match': '"other-gzip"', 'Accept-Encoding': 'gzip'})
+    assert stale.status_code == 200
+
+
+def test_conditional_view_answers_any_variant_until_data_changes(app, monkeypatch, make_user, make_account,
+                                                                 make_transaction):
+    user = make_user()
+    user_id = user.id
+    account = make_account(user)
+    for n in range(30):
+        make_transaction(account, 10.0 + n, name=f'Purchase {n}')
+    client = _client(app, user_id)
+    url = '/api/financials/transactions?per_page=50'
+
+    first = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == 'gzip'
+    tag = first.headers['ETag'].strip('"')
+    assert tag.endswith('-gzip')
+    base = tag[:-len('-gzip')]
+
+    # A match is answered from the data version alone, before the view runs
+    with monkeypatch.context() as patched:
+        patched.setattr(financials_api, 'transactions_source', None)
+        for sent in (f'"{tag}"', f'"{base}-br"', f'"{base}"'):
+            response = client.get(url, headers={'If-None-Match': sent, 'Accept-Encoding': 'gzip'})
+            assert response.status_code == 304
+            assert response.headers['ETag'] == sent
+
+    data_version.bump(user_id)
+    db.session.commit()
+    changed = client.get(url, headers={'If-None-Match': f'"{tag}"', 'Accept-Encoding': 'gzip'})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != f'"{tag}"'
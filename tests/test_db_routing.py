@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from flask import session
+from sqlalchemy import insert, update
+
+from app import create_app
+from app.config import Config, _engine_options
+from app.models import db, User
+from app.utils import db_routing
+from app.utils.db_routing import REPLICA_BIND, LAST_WRITE_KEY, init_replica_schema
+
+from conftest import _configure, _reset_caches
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app on empty SQLite databases, a second file standing in for the replica"""
+    _configure(monkeypatch, f"sqlite:///{tmp_path / 'primary.db'}")
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', {
+        REPLICA_BIND: {'url': replica_url, **_engine_options(replica_url, read_only=True)}
+    })
+    _reset_caches()
+    db_routing._lag_state.update(checked_at=0.0, lag=0.0)
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        init_replica_schema(db)
+        yield app
+        db.session.remove()
+        db.drop_all()
+        db.metadata.drop_all(bind=db.engines[REPLICA_BIND])
+    # init_app registered a metadata for the bind on the shared extension,
+    # which later apps without a replica would try to create tables for
+    db.metadatas.pop(REPLICA_BIND, None)
+
+
+def _replicate_user(user, data_version):
+    """Copy a user row to the replica as of an older (or the same) data version"""
+    with db.engines[REPLICA_BIND].begin() as conn:
+        conn.execute(insert(User).values(id=user.id, email=user.email, password_hash='x', data_version=data_version))
+
+
+def _client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+        s['_fresh'] = True
+    return client
+
+
+def test_conditional_view_reads_primary_until_replica_has_the_users_version(app, make_user,
+                                                                            make_account):
+    user = make_user(data_version=3)
+    user_id = user.id
+    # Only the primary has the account, so the body shows which database it came from
+    make_account(user)
+    _replicate_user(user, data_version=2)
+    client = _client(app, user_id)
+
+    lagging = client.get('/api/financials/accounts')
+    assert len(lagging.get_json()['accounts']) == 1
+
+    with db.engines[REPLICA_BIND].begin() as conn:
+        conn.execute(update(User).where(User.id == user_id).values(data_version=3))
+    caught_up = client.get('/api/financials/accounts')
+    assert caught_up.get_json()['accounts'] == []
+    assert caught_up.headers['ETag'] == lagging.headers['ETag']
+
+
+def test_choose_route_prefers_a_fresh_replica(app):
+    with app.test_request_context():
+        assert db_routing.choose_route() == REPLICA_BIND
+
+        db_routing._lag_state.update(checked_at=time.monotonic(), lag=app.config['DB_REPLICA_MAX_LAG'] + 1)
+        assert db_routing.choose_route() is None
+
+
+def test_choose_route_reads_your_writes_from_the_primary(app, make_user):
+    window = app.config['DB_READ_YOUR_WRITES_WINDOW']
+    with app.test_request_context():
+        # A flush inside a request marks the browser session as a recent writer
+        make_user()
+        assert session[LAST_WRITE_KEY] == pytest.approx(time.time(), abs=5)
+        assert db_routing.choose_route() is None
+
+        session[LAST_WRITE_KEY] = time.time() - window - 1
+        assert db_routing.choose_route() == REPLICA_BIND
@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+from app.models import db, User
+from app.utils import dictionary
+from app.utils.financial_snapshot import FinancialSnapshot
+
+TODAY = date(2026, 3, 20)
+
+
+def test_unencoded_rows_fall_back_to_primary_category(make_user, make_account, make_transaction):
+    user = make_user()
+    account = make_account(user)
+    make_transaction(account, 12.0, TODAY - timedelta(days=1), category='Food and Drink > Coffee',
+                     primary_category='FOOD_AND_DRINK')
+    make_transaction(account, 30.0, TODAY - timedelta(days=2), category='Travel > Taxi',
+                     primary_category='TRAVEL')
+    dictionary.backfill(max_batches=1, batch_size=1)
+    # One row encoded, one still waiting for the backfill
+    make_transaction(account, 8.0, TODAY - timedelta(days=3), category='Food and Drink > Coffee',
+                     primary_category='FOOD_AND_DRINK')
+
+    snapshot = FinancialSnapshot(user.id, today=TODAY)
+    assert snapshot.spending_by_category == [('TRAVEL', 30.0), ('FOOD_AND_DRINK', 20.0)]
+    assert [tx.primary_category for tx in snapshot.recent_transactions] == [
+        'FOOD_AND_DRINK', 'TRAVEL', 'FOOD_AND_DRINK']
+
+
+def test_backfill_bumps_data_version(make_user, make_account, make_transaction):
+    user, other = make_user(), make_user()
+    make_transaction(make_account(user), 5.0, category='Shops', primary_category='GENERAL_MERCHANDISE')
+    make_transaction(make_account(other), 5.0)
+
+    assert dictionary.backfill() == 1
+    db.session.expire_all()
+    assert db.session.get(User, user.id).data_version == 1
+    assert db.session.get(User, other.id).data_version == 0
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+
+from app.utils import metrics
+from app.utils.metrics import MetricsRegistry
+
+
+def _counter(snapshot, name):
+    return sum(value for counter, _, value in snapshot['counters'] if counter == name)
+
+
+def test_shards_of_ended_threads_are_retired():
+    registry = MetricsRegistry()
+    registry.inc('jobs_total')
+
+    def work():
+        registry.inc('jobs_total', value=2)
+        registry.observe('job_seconds', (), 0.2)
+
+    threads = [threading.Thread(target=work) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(registry._shards) == 1  # this thread's
+    snapshot = registry.snapshot()
+    assert _counter(snapshot, 'jobs_total') == 11
+    assert [hist['count'] for name, _, hist in snapshot['histograms'] if name == 'job_seconds'] == [5]
+
+
+def _write(directory, pid, counter_value, at):
+    with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+        json.dump({'counters': [['jobs_total', [], counter_value]], 'histograms': [], 'gauges': [],
+                   'time': at}, f)
+
+
+def test_retired_workers_are_folded_into_one_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'registry', MetricsRegistry())
+    directory = str(tmp_path)
+    _write(directory, 101, 3, at=1000.0)
+    _write(directory, 102, 4, at=1000.0)
+
+    metrics.retire_process(directory, 101)
+    metrics.retire_process(directory, 102)
+    metrics.retire_process(directory, 103)  # never wrote a snapshot
+
+    assert sorted(os.listdir(directory)) == ['retired.json']
+    assert metrics.collect(directory)[0] == {('jobs_total', ()): 7}
+
+
+def test_worker_read_before_it_was_retired_is_counted_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'registry', MetricsRegistry())
+    directory = str(tmp_path)
+    _write(directory, 101, 3, at=1000.0)
+    metrics.retire_process(directory, 101)
+    # As if the scrape had listed the worker's file just before it was removed
+    _write(directory, 101, 3, at=1000.0)
+    assert metrics.collect(directory)[0] == {('jobs_total', ()): 3}
+
+    # A new worker that was given the same pid is counted on its own
+    _write(directory, 101, 5, at=2 ** 40)
+    assert metrics.collect(directory)[0] == {('jobs_total', ()): 8}
+
+
+def test_metrics_endpoint_needs_a_configured_token(app):
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 404
+
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
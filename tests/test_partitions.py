@@ -0,0 +1,91 @@
+"""Converting transactions to a partitioned table (Postgres only)
+
+Set TEST_POSTGRES_URL to a scratch database to run these; its tables are
+dropped.
+"""
+import os
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app import create_app
+from app.models import db, Transaction
+from app.utils import partitions
+from app.utils.schema import add_missing_indexes
+
+from conftest import _configure
+
+POSTGRES_URL = os.getenv('TEST_POSTGRES_URL')
+
+DROP = (f"DROP TABLE IF EXISTS {partitions.PARENT}, {partitions.STAGING}, {partitions.RETIRED}, "
+        f"{partitions.ARCHIVE} CASCADE")
+
+
+@pytest.fixture
+def pg_app(monkeypatch):
+    if not POSTGRES_URL:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    _configure(monkeypatch, POSTGRES_URL)
+    app = create_app()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text(DROP))
+        db.drop_all()
+        db.create_all()
+        partitions._state['checked_at'] = 0.0
+        yield app
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(text(DROP))
+        db.drop_all()
+        partitions._state['checked_at'] = 0.0
+
+
+def _index_validity(conn, name):
+    return conn.execute(text(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+    ), {'name': name}).scalar()
+
+
+def test_convert_swaps_in_partitioned_table(pg_app, make_user, make_account, make_transaction):
+    account = make_account(make_user())
+    today = date.today()
+    for day in range(0, 400, 4):
+        make_transaction(account, day + 1.25, today - timedelta(days=day))
+    # Older than the Plaid history window: lands in a partition of its own month
+    make_transaction(account, 9.99, date(2015, 6, 1))
+    max_id = db.session.query(db.func.max(Transaction.id)).scalar()
+    db.session.remove()
+
+    assert partitions.convert(batch_size=7, echo=lambda message: None)
+
+    with db.engine.connect() as conn:
+        assert partitions._relkind(conn, partitions.PARENT) == 'p'
+        assert partitions._relkind(conn, partitions.RETIRED) == 'r'
+        assert partitions._relkind(conn, partitions.STAGING) is None
+        assert conn.execute(text("SELECT count(*) FROM transactions")).scalar() == 101
+        assert conn.execute(text("SELECT count(*) FROM transactions_unpartitioned")).scalar() == 101
+        assert date(2015, 6, 1) in partitions._partitions(conn, partitions.PARENT)
+        # The retired table's indexes no longer hold the models' names
+        retired = set(conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+        ), {'table': partitions.RETIRED}).scalars())
+        assert 'ix_transactions_unpartitioned_amount_date' in retired
+        assert not any(name.startswith('ix_transactions_') and 'unpartitioned' not in name for name in retired)
+        # Non-unique model indexes are built on the parent; the ones it replaces are not
+        assert _index_validity(conn, 'ix_transactions_amount_date') is True
+        assert _index_validity(conn, 'ix_transactions_account_id_fingerprint') is True
+        assert _index_validity(conn, 'ix_transactions_plaid_transaction_id') is None
+        assert _index_validity(conn, 'ix_transactions_date') is None
+
+    assert partitions.convert(echo=lambda message: None) is False
+    assert partitions.maintain() is not None
+    assert partitions.is_partitioned()
+    add_missing_indexes(db)
+
+    # Ids carry on from the old table's sequence; new partitions get the indexes
+    tx = make_transaction(account, 5.0, today)
+    assert tx.id > max_id
+    with db.engine.connect() as conn:
+        assert _index_validity(conn, 'ix_transactions_amount_date') is True
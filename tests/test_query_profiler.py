@@ -0,0 +1,59 @@
+from app.utils.plaid_service import plaid_service
+from app.utils.query_profiler import profile_queries
+
+PAGES = 3
+ROWS_PER_PAGE = 40
+
+
+def _plaid_accounts(n):
+    return [{'account_id': f'plaid-account-{i}', 'name': f'Account {i}', 'type': 'depository',
+             'subtype': 'checking', 'mask': f'{i:04d}', 'balances': {'current': 100.0 + i, 'available': 90.0 + i}}
+            for i in range(n)]
+
+
+def _fake_plaid(monkeypatch, pages, accounts):
+    """Serve `pages` pages of ROWS_PER_PAGE added transactions spread over the accounts"""
+    def sync_transactions(access_token, cursor=None, count=None, raw=False):
+        index = int(cursor or 0)
+        added = [{'transaction_id': f'plaid-tx-{index}-{n}', 'account_id': accounts[n % len(accounts)]['account_id'],
+                  'name': f'Shop {n}', 'merchant_name': f'Merchant {n}', 'amount': 10.0 + n,
+                  'date': '2026-03-02', 'category': ['Shops', f'Category {n % 7}']}
+                 for n in range(ROWS_PER_PAGE)] if index < pages else []
+        return {'success': True, 'added': added, 'modified': [], 'removed': [],
+                'next_cursor': str(min(index + 1, pages)), 'has_more': index + 1 < pages}
+
+    monkeypatch.setattr(plaid_service, 'sync_transactions', sync_transactions)
+    monkeypatch.setattr(plaid_service, 'refresh_balances', lambda item: {'updated': 0})
+
+
+def _link(user, accounts):
+    saved = plaid_service.save_accounts_for_user(user.id, 'token', 'item-profiled', accounts, 'Test Bank')
+    plaid_service.item_for_account(saved['accounts'][0])
+    return saved['accounts'][0]
+
+
+def test_saving_accounts_runs_no_statement_per_account(make_user):
+    user_id = make_user().id
+    accounts = _plaid_accounts(12)
+
+    for _ in range(2):  # created, then updated in place
+        with profile_queries() as profile:
+            saved = plaid_service.save_accounts_for_user(user_id, 'token', 'item-profiled', accounts, 'Test Bank')
+        assert len(saved['accounts']) == 12
+        profile.assert_no_repeats(threshold=2)
+        profile.assert_max_queries(10)
+
+
+def test_sync_runs_no_statement_per_row(monkeypatch, make_user):
+    accounts = _plaid_accounts(3)
+    _fake_plaid(monkeypatch, PAGES, accounts)
+    account = _link(make_user(), accounts)
+
+    with profile_queries() as profile:
+        result = plaid_service.sync_and_save_transactions(account)
+
+    assert result['added'] == PAGES * ROWS_PER_PAGE
+    # Each page runs a fixed set of set-based statements (about 20); one
+    # statement per transaction would repeat at least ROWS_PER_PAGE times
+    profile.assert_no_repeats(threshold=ROWS_PER_PAGE)
+    profile.assert_max_queries(25 * PAGES)
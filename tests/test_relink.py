@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+from app.models import db, BankAccount, CategoryRule, PlaidItem, Transaction, TransactionChange, User
+from app.utils import categorization, relink
+
+
+def test_supersede_moves_rules_to_the_successor(make_user, make_account):
+    user = make_user()
+    old = make_account(user, plaid_item_id='old-item', mask='1234')
+    new = make_account(user, plaid_item_id='new-item', mask='1234')
+    assert categorization.save_rule(user.id, {'category': 'Rent', 'account_id': old.id})['success']
+    version = db.session.get(User, user.id).rules_version
+
+    assert relink.supersede(user.id, 'new-item', [new.id]) == {old.id: new.id}
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(BankAccount, old.id).superseded_by_id == new.id
+    assert [rule.account_id for rule in CategoryRule.query.all()] == [new.id]
+    assert db.session.get(User, user.id).rules_version == version + 1
+
+
+def _relinked_accounts(make_user, make_account, covered_from=date(2026, 1, 1)):
+    """An old account superseded by a new one whose item has history from covered_from"""
+    user = make_user()
+    old = make_account(user, plaid_item_id='old-item', mask='1234')
+    new = make_account(user, plaid_item_id='new-item', mask='1234')
+    db.session.add(PlaidItem(user_id=user.id, plaid_item_id='new-item', plaid_access_token='token',
+                             history_complete_through=covered_from, backfill_status='complete'))
+    db.session.commit()
+    relink.supersede(user.id, 'new-item', [new.id])
+    db.session.commit()
+    return user, old, new
+
+
+def test_merge_supersedes_covered_rows_and_moves_older_ones(make_user, make_account, make_transaction):
+    user, old, new = _relinked_accounts(make_user, make_account)
+    unclaimed = make_transaction(old, 20.0, date(2026, 2, 1))
+    older = [make_transaction(old, 5.0 + day, date(2025, 6, 1) + timedelta(days=day)) for day in range(3)]
+    old_id, new_id = old.id, new.id
+    unclaimed_id, older_ids = unclaimed.id, [tx.id for tx in older]
+
+    assert relink.pending_merges() == [old_id]
+    assert relink.merge(old_id, batch_size=2) == {'superseded': 1, 'moved': 3}
+
+    db.session.expire_all()
+    assert db.session.get(Transaction, unclaimed_id) is None
+    assert {db.session.get(Transaction, tx_id).account_id for tx_id in older_ids} == {new_id}
+    assert db.session.get(BankAccount, old_id).purged_at is not None
+    assert relink.pending_merges() == []
+    changes = TransactionChange.query.order_by(TransactionChange.seq).all()
+    assert [(change.op, change.transaction_id) for change in changes] == \
+        [('delete', unclaimed_id)] + [('update', tx_id) for tx_id in older_ids]
+    assert {change.account_id for change in changes[1:]} == {new_id}
+    assert all(change.old_amount == change.new_amount for change in changes[1:])
+
+
+def _incoming(account, plaid_transaction_id, amount, tx_date, name):
+    return {'account_id': account.id, 'plaid_transaction_id': plaid_transaction_id, 'amount': amount,
+            'date': tx_date, 'name': name}
+
+
+def test_claim_hands_each_duplicate_one_stored_row(make_user, make_account, make_transaction):
+    user, old, new = _relinked_accounts(make_user, make_account)
+    day = date(2026, 2, 3)
+    # Two identical coffees on the same day, and one on another day
+    first = make_transaction(old, 3.5, day, name='Corner Cafe')
+    second = make_transaction(old, 3.5, day, name='corner  CAFE')
+    other_day = make_transaction(old, 3.5, day + timedelta(days=1), name='Corner Cafe')
+    stored_ids = [first.id, second.id, other_day.id]
+    new_id = new.id
+    assert relink.fingerprint_history(old.id, batch_size=2) == 3
+
+    claimed = relink.claim([
+        _incoming(new, 'new-1', 3.5, day, 'Corner Cafe'),
+        _incoming(new, 'new-2', 3.5, day, 'Corner Cafe'),
+        _incoming(new, 'new-3', 3.5, day, 'Corner Cafe'),  # a third one the old item never had
+        _incoming(new, 'new-4', 3.6, day, 'Corner Cafe'),
+    ])
+    db.session.commit()
+
+    assert claimed == {'new-1', 'new-2'}
+    db.session.expire_all()
+    rows = [db.session.get(Transaction, tx_id) for tx_id in stored_ids]
+    assert [(row.account_id, row.plaid_transaction_id, row.fingerprint) for row in rows[:2]] == \
+        [(new_id, 'new-1', None), (new_id, 'new-2', None)]
+    assert rows[2].account_id == old.id and rows[2].fingerprint is not None
+
+
+def test_claim_ignores_accounts_without_predecessors(make_user, make_account):
+    account = make_account(make_user())
+    assert relink.claim([_incoming(account, 'new-1', 3.5, date(2026, 2, 3), 'Corner Cafe')]) == set()
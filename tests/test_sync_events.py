@@ -0,0 +1,19 @@
+from app.models import db
+
+
+def test_open_stream_holds_no_pooled_connection(app, make_user):
+    user_id = make_user().id
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+        s['_fresh'] = True
+    db.session.remove()
+    checked_out = db.engine.pool.checkedout()
+
+    response = client.get('/plaid/events')
+    body = iter(response.response)
+    assert next(body).startswith(b'retry:')
+    assert b'event: ready' in next(body)
+
+    assert db.engine.pool.checkedout() == checked_out
+    response.close()
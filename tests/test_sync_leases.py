@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from app.models import db, BankAccount, SyncLease, Transaction
+from app.utils import sync_leases
+from app.utils.plaid_service import plaid_service
+
+
+def _plaid_transaction(n, account):
+    return {'transaction_id': f'plaid-tx-{n}', 'account_id': account.plaid_account_id, 'name': f'Shop {n}',
+            'amount': 10.0 + n, 'date': '2026-03-02', 'category': ['Shops']}
+
+
+def _fake_plaid(monkeypatch, account, pages, during_first_page=None):
+    """Serve pages of added transactions from transactions/sync, one per cursor"""
+    calls = []
+
+    def sync_transactions(access_token, cursor=None, count=None, raw=False):
+        calls.append(cursor)
+        if during_first_page and len(calls) == 1:
+            during_first_page()
+        index = int(cursor or 0)
+        added = pages[index] if index < len(pages) else []
+        return {'success': True, 'added': [_plaid_transaction(n, account) for n in added], 'modified': [],
+                'removed': [], 'next_cursor': str(min(index + 1, len(pages))), 'has_more': index + 1 < len(pages)}
+
+    monkeypatch.setattr(plaid_service, 'sync_transactions', sync_transactions)
+    monkeypatch.setattr(plaid_service, 'refresh_balances', lambda item: {'updated': 0})
+    return calls
+
+
+def test_overlapping_syncs_store_one_set_of_rows(monkeypatch, make_user, make_account):
+    account = make_account(make_user())
+    account_id = account.id
+    overlapping = []
+    # The second sync starts while the first is fetching its first page,
+    # from the prefetch thread, so it runs in its own session
+    _fake_plaid(monkeypatch, account, [[1, 2], [3]], during_first_page=lambda: overlapping.append(
+        plaid_service.sync_and_save_transactions(db.session.get(BankAccount, account_id))
+    ))
+
+    result = plaid_service.sync_and_save_transactions(account)
+
+    assert result['success'] and result['added'] == 3
+    assert overlapping[0]['in_progress'] and not overlapping[0]['success']
+    assert db.session.query(Transaction).count() == 3
+    assert db.session.query(SyncLease).count() == 0
+
+    # Once the first sync is done the next one resumes from its cursor
+    again = plaid_service.sync_and_save_transactions(db.session.get(BankAccount, account_id))
+    assert again['success'] and again['added'] == 0
+    assert db.session.query(Transaction).count() == 3
+
+
+def test_sync_skips_an_item_leased_elsewhere_until_the_lease_lapses(monkeypatch, make_user, make_account):
+    account = make_account(make_user())
+    item = plaid_service.item_for_account(account)
+    calls = _fake_plaid(monkeypatch, account, [[1]])
+    assert sync_leases.acquire(item.id, item.institution_name, 'scheduler')
+
+    result = plaid_service.sync_and_save_transactions(account)
+
+    assert result['in_progress'] and calls == []
+    assert db.session.get(SyncLease, item.id).owner == 'scheduler'
+
+    # A crashed holder's lease lapses and is taken over
+    db.session.get(SyncLease, item.id).expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    result = plaid_service.sync_and_save_transactions(account)
+    assert result['success'] and result['added'] == 1
+    assert db.session.query(SyncLease).count() == 0
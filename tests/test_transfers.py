@@ -0,0 +1,89 @@
+from collections import namedtuple
+from datetime import date, timedelta
+
+from app.models import db, Transaction
+from app.utils import transfers
+
+Row = namedtuple('Row', 'id account_id amount date')
+
+DAY = date(2026, 3, 2)
+
+
+def _pair_ids(*transactions):
+    db.session.expire_all()
+    return [db.session.get(Transaction, tx.id).transfer_pair_id for tx in transactions]
+
+
+def test_pairs_takes_closest_inflow_on_another_account():
+    rows = [
+        Row(1, 1, 100.0, DAY),
+        Row(2, 1, -100.0, DAY),  # same account
+        Row(3, 2, -100.0, DAY + timedelta(days=3)),
+        Row(4, 3, -100.0, DAY + timedelta(days=1)),
+        Row(5, 2, -100.01, DAY),  # a cent off
+        Row(6, 2, -50.0, DAY),
+    ]
+    assert transfers.pairs(rows, window_days=3) == [(1, 4)]
+
+
+def test_pairs_respects_window_and_takes_each_inflow_once():
+    rows = [
+        Row(1, 1, 20.0, DAY),
+        Row(2, 1, 20.0, DAY + timedelta(days=1)),
+        Row(3, 2, -20.0, DAY),
+        Row(4, 2, -20.0, DAY + timedelta(days=10)),
+    ]
+    assert transfers.pairs(rows, window_days=3) == [(1, 3)]
+
+
+def test_match_marks_both_sides(make_user, make_account, make_transaction):
+    user = make_user()
+    checking, savings = make_account(user), make_account(user)
+    outflow = make_transaction(checking, 250.0, DAY)
+    inflow = make_transaction(savings, -250.0, DAY + timedelta(days=1))
+    purchase = make_transaction(checking, 250.0, DAY + timedelta(days=20))
+
+    assert transfers.match(user.id, [(inflow.amount, inflow.date)]) == 1
+    db.session.commit()
+    assert _pair_ids(outflow, inflow, purchase) == [inflow.id, outflow.id, None]
+
+
+def test_match_skips_inactive_accounts_and_other_users(make_user, make_account, make_transaction):
+    user, other = make_user(), make_user()
+    checking = make_account(user)
+    removed = make_account(user, is_active=False)
+    outflow = make_transaction(checking, 40.0, DAY)
+    make_transaction(removed, -40.0, DAY)
+    make_transaction(make_account(other), -40.0, DAY)
+
+    assert transfers.match(user.id, [(outflow.amount, outflow.date)]) == 0
+
+
+def test_unpair_clears_both_sides_and_allows_repairing(make_user, make_account, make_transaction):
+    user = make_user()
+    checking, savings = make_account(user), make_account(user)
+    outflow = make_transaction(checking, 75.0, DAY)
+    inflow = make_transaction(savings, -75.0, DAY)
+    transfers.match(user.id, [(outflow.amount, outflow.date)])
+    db.session.commit()
+
+    assert transfers.unpair([inflow.id]) == 2
+    db.session.commit()
+    assert _pair_ids(outflow, inflow) == [None, None]
+    assert transfers.unpair([inflow.id]) == 0
+
+    assert transfers.match(user.id, [(outflow.amount, outflow.date)]) == 1
+    db.session.commit()
+    assert _pair_ids(outflow, inflow) == [inflow.id, outflow.id]
+
+
+def test_detect_matches_stored_history(make_user, make_account, make_transaction):
+    user = make_user()
+    checking, savings = make_account(user), make_account(user)
+    # Spread over more than one DETECT_CHUNK_DAYS chunk
+    for month in range(1, 7):
+        make_transaction(checking, 100.0 + month, date(2025, month, 28))
+        make_transaction(savings, -100.0 - month, date(2025, month, 28) + timedelta(days=2))
+
+    assert transfers.detect(user.id) == 6
+    assert transfers.detect(user.id) == 0